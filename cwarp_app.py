@@ -1,42 +1,64 @@
 import warnings
 warnings.filterwarnings("ignore", category=RuntimeWarning)
 from cwarp_defs import *
-from io import BytesIO
+from cwarp_data import PriceCache, YahooProvider, load_returns, parse_portfolio, build_panel
+from cwarp_cache import MemoCache
+from cwarp_profile import Profiler
+from cwarp_render import latex_image, frontier_chart, cumulative_chart, static_frontier, static_cumulative
 import datetime
-import seaborn as sns
+import os
 import streamlit as st
-from streamlit import caching
-caching.clear_cache()
 st.set_page_config(layout="wide", initial_sidebar_state="expanded")
 
-def render_latex(formula, fontsize=12, dpi=300):
-    """Renders LaTeX formula into Streamlit."""
-    fig = plt.figure()
-    text = fig.text(0, 0, '$%s$' % formula, fontsize=fontsize)
-    fig.savefig(BytesIO(), dpi=dpi)  # triggers rendering
-    bbox = text.get_window_extent()
-    width, height = bbox.size / float(dpi) + 0.05
-    fig.set_size_inches((width, height))
-    dy = (bbox.ymin / float(dpi)) / height
-    text.set_position((0, -dy))
-    buffer = BytesIO()
-    fig.savefig(buffer, dpi=dpi, format='jpg')
-    plt.close(fig)
-    st.image(buffer)
-
-def retrieve_yhoo_data(ticker='spy', start_date = '2007-07-01', end_date = '2020-12-31'):
-    try:
-        data_hold=yf.Ticker(ticker)
-        price_df=data_hold.history(start=start_date,  end=end_date).Close.pct_change()
-        price_df.name=ticker
-        if price_df.shape[0] < 100:
-            raise Exception('no prices.')
-        return price_df
-    except Exception as Ex:
-        st.write(f"Sorry, Data not available for {ticker} please refresh the app.")
+@st.cache_resource
+def app_caches():
+    """Price cache and result cache shared by every session of this deployment.
+    Set CWARP_OFFLINE=1 to serve prices only from the local cache and CWARP_MEMO_MB to bound the result cache."""
+    price_cache = PriceCache(YahooProvider(), cache_dir=os.environ.get('CWARP_CACHE_DIR', '.cwarp_cache'),
+                             offline=os.environ.get('CWARP_OFFLINE', '0')=='1')
+    memo = MemoCache(max_bytes=int(os.environ.get('CWARP_MEMO_MB', '256'))*2**20)
+    return price_cache, memo
+
+price_cache, memo = app_caches()
+# replacement portfolio label used while computing cached tables, swapped for the user's name on display
+_PORT_LABEL = '<replacement portfolio>'
+_NO_PROFILER = Profiler(enabled=False)
+
+# rendered formula images survive restarts next to the price cache
+_RENDER_DIR = os.path.join(os.environ.get('CWARP_CACHE_DIR', '.cwarp_cache'), 'render')
+# points per line of the cumulative return charts, about the width of the page in pixels
+_MAX_POINTS = 1000
+
+def render_latex(formula, fontsize=12, dpi=300, profiler=None):
+    """Renders LaTeX formula into Streamlit, the image is rendered once and then served from the caches."""
+    with (profiler or _NO_PROFILER).stage('latex'):
+        st.image(memo.get_or_compute('latex', (formula, fontsize, dpi), lambda: latex_image(formula, fontsize, dpi, cache_dir=_RENDER_DIR)))
+
+def retrieve_yhoo_data(tickers, start_date = '2007-07-01', end_date = '2020-12-31', min_periods=100, profiler=None):
+    """Pulls returns for every ticker concurrently, returns a dict of ticker -> return series and reports tickers without data.
+    Series already pulled for the same (ticker, start_date, end_date) are reused. Fetches are timed per ticker on profiler."""
+    returns = {}
+    for ticker in dict.fromkeys(tickers):
+        price_df = memo.get('data', (ticker, start_date, end_date))
+        if price_df is not None: returns[ticker] = price_df
+    loaded = load_returns([ticker for ticker in tickers if ticker not in returns], start_date, end_date, price_cache, profiler=profiler)
+    failures = dict(loaded.failures)
+    for ticker, price_df in loaded.returns.items():
+        if price_df.shape[0] < min_periods:
+            failures[ticker] = 'no prices.'
+            continue
+        price_df = price_df.copy()
+        # first return in the range is left missing, as with pct_change of the range's closes
+        price_df.iloc[:1]=np.nan
+        returns[ticker] = memo.put('data', (ticker, start_date, end_date), price_df)
+    if failures:
+        st.warning("Sorry, data not available for: " + ", ".join(f"{ticker} ({error})" for ticker, error in failures.items()))
+    return returns
 
 def main():
     st.sidebar.image('Artemis.png')
+    # stage timings of this run, shown in the Stage Timings panel at the bottom of the sidebar
+    profiler = Profiler(enabled=st.sidebar.checkbox("Profile Stage Timings", value=os.environ.get('CWARP_PROFILE', '0')=='1'))
     st.header("CWARP\u2122 Calculator")
 
     st.markdown("""
@@ -61,7 +83,7 @@ To improve the situation, CWARP\u2122 $\chi$ measures the attractiveness of a po
 Here RMDD is the Return to Max-Drawdown Ratio, and n and p represent the new and old portfolio respectively :
 """
     st.markdown(body,unsafe_allow_html=True)
-    formula = render_latex(r'\chi/100 = \sqrt{ \left( \frac{S_n}{S_p} \right) \left(  \frac{ RMDD_n }{ RMDD_p}  \right) }-1.')
+    formula = render_latex(r'\chi/100 = \sqrt{ \left( \frac{S_n}{S_p} \right) \left(  \frac{ RMDD_n }{ RMDD_p}  \right) }-1.', profiler=profiler)
     st.markdown("""Using the boxes below, you can calculate CWARP\u2122 based on your own portfolio for prospective assets,
     so long as a data provider has history on your holdings. Just edit the example entries. Please note that the asset with the shortest period of historical data will constrain the timeframes of the other assets being compared. For more advanced capabilities, please download the [code from github](https://github.com/jpartemis/cwarp) and alter as necessary.
     """)
@@ -74,6 +96,11 @@ Here RMDD is the Return to Max-Drawdown Ratio, and n and p represent the new and
         risk_free_rate = st.sidebar.slider('Risk-Free Rate (annualized)', min_value=0.0, max_value=0.2, value=0.005, step=0.001, format='%.3f')
         financing_rate = st.sidebar.slider('Financing Rate (annualized)', min_value=0.0, max_value=0.2, value=0.01)
         replacement_port_name = st.sidebar.text_input("Replacement Portfolio Name", "Plain 60/40")
+        show_optimal_weights = st.sidebar.checkbox("Show CWARP Maximizing Diversifier Weights", value=False)
+        interactive_charts = st.sidebar.checkbox("Interactive Charts", value=True)
+        join = st.sidebar.selectbox("Date Alignment", ('inner', 'asset_start', 'outer'),
+                                    format_func={'inner': 'Common history only', 'asset_start': 'Each asset from its own start',
+                                                 'outer': 'All dates, missing returns as 0'}.get)
 
         ticker_string_ = "qqq, lqd, hyg, tlt, ief, shy, gld, slv, efa, eem, iyr, xle, xlk, xlf"
         ticker_string = st.text_input("Prospective Portfolio Diversifiers (comma separated)", ticker_string_)
@@ -81,98 +108,57 @@ Here RMDD is the Return to Max-Drawdown Ratio, and n and p represent the new and
 
         port_string_ = ".6, spy, .4, ief"
         port_string = st.text_input("Portfolio (comma separated, fraction_1, symbol_1, fraction_2, symbol_2... )", port_string_)
-        port_list=port_string.replace(' ','').split(',')
-        replacement_port_tik=[]
-        replacement_port_w=[]
-        replacement_port_list = []
-        for i in range(len(port_list)//2):
-            replacement_port_w.append(float(port_list[2*i]))
-            replacement_port_tik.append(port_list[2*i+1])
-            with st.spinner("Pulling data..."):
-                D = retrieve_yhoo_data(replacement_port_tik[-1], start_date, end_date)
-                replacement_port_list.append(D)
-
-        replacement_port = replacement_port_list[0]*(replacement_port_w[0]/sum(replacement_port_w))
-        for k in range(1,len(replacement_port_list)):
-            replacement_port += replacement_port_list[k]*(replacement_port_w[k]/sum(replacement_port_w))
+        replacement_port_tik, replacement_port_w = parse_portfolio(port_string)
+        # pull the replacement portfolio legs and every diversifier in one concurrent batch
+        with st.spinner("Pulling data..."), profiler.stage('data'):
+            returns_data = retrieve_yhoo_data(replacement_port_tik+ticker_list, start_date, end_date, profiler=profiler)
+        missing_legs = [ticker for ticker in replacement_port_tik if ticker not in returns_data]
+        if missing_legs:
+            raise Exception(f"no data for replacement portfolio holdings {', '.join(missing_legs)}")
+        ticker_list = [ticker for ticker in ticker_list if ticker in returns_data]
+
+        # align the replacement portfolio legs and every diversifier on one calendar
+        port_key = (tuple(replacement_port_tik), tuple(replacement_port_w), start_date, end_date, join)
+        with profiler.stage('alignment'):
+            panel = memo.get_or_compute('panel', (tuple(ticker_list),)+port_key,
+                                        lambda: build_panel(returns_data, replacement_port_tik, replacement_port_w, ticker_list, join=join, name=_PORT_LABEL))
+        replacement_port = panel.replace_port
+        candidates_df = panel.candidates
         first_date_of_rp = replacement_port.dropna().index.min()
-        if first_date_of_rp > datetime.date(2020,3,1):
+        if first_date_of_rp.date() > datetime.date(2020,3,1):
             st.write("*** WARNING ***")
             st.write("Your portfolio has a very short (post-pandemic) history of available data.")
             st.write("This will lead to poor CWARP for diversifiers.")
 
-        replacement_port.name=replacement_port_name
-        risk_ret_df=pd.DataFrame(index=['Start_Date','End_Date','CWARP','+Sortino','+Ret_To_MaxDD','Sharpe','Sortino','Max_DD'],columns=ticker_list)
-        new_risk_ret_df=pd.DataFrame(index=['Return','Vol','Sharpe','Sortino','Max_DD','Ret_To_MaxDD',f'CWARP_{round(100*weight_asset)}%_asset'],columns=ticker_list)
-        new_risk_ret_df=new_risk_ret_df.add_suffix(f'@{round(100*weight_asset)}% | '+replacement_port.name+f'{round(100*weight_replace_port)}%')
-        new_risk_ret_df[replacement_port.name]=np.nan
-        prices_df=pd.DataFrame(index=retrieve_yhoo_data(ticker_list[0], start_date, end_date).index)
-
-        # Save these for later plotting...
-        new_ports = {}
-        for i in range(0,len(ticker_list)):
-            temp_data=retrieve_yhoo_data(ticker_list[i], start_date, end_date)
-            prices_df=pd.merge(prices_df,temp_data, left_index=True, right_index=True)
-            risk_ret_df.loc['Start_Date',ticker_list[i]]=min(temp_data.index).date()
-            risk_ret_df.loc['End_Date',ticker_list[i]]=max(temp_data.index).date()
-            risk_ret_df.loc['CWARP',ticker_list[i]]=cole_win_above_replace_port(new_asset=temp_data, replace_port=replacement_port,
+        with st.expander("Date Coverage"):
+            st.write(panel.overlap.assign(**{column: panel.overlap[column].dt.strftime('%Y-%m-%d')
+                                             for column in ('Start', 'End', 'Overlap_Start', 'Overlap_End')}))
+
+        # score every diversifier in one batched pass, results are reused until an input they depend on changes
+        metrics_key = (tuple(ticker_list), port_key, weight_asset, weight_replace_port, risk_free_rate, financing_rate, 252)
+        with profiler.stage('metrics'):
+            risk_ret_df, new_risk_ret_df = memo.get_or_compute('metrics', ('tables',)+metrics_key,
+                                                               lambda: cwarp_tables(new_assets=candidates_df, replace_port=replacement_port,
                                                                                     risk_free_rate = risk_free_rate,
                                                                                     financing_rate = financing_rate,
                                                                                     weight_asset = weight_asset,
                                                                                     weight_replace_port = weight_replace_port,
-                                                                                    periodicity=252)
-            risk_ret_df.loc['+Sortino',ticker_list[i]]=cwarp_additive_sortino(new_asset=temp_data, replace_port=replacement_port,
-                                                                                            risk_free_rate = risk_free_rate,
-                                                                                            financing_rate = financing_rate,
-                                                                                            weight_asset = weight_asset,
-                                                                                            weight_replace_port = weight_replace_port,
-                                                                                            periodicity=252)
-            risk_ret_df.loc['+Ret_To_MaxDD',ticker_list[i]]=cwarp_additive_ret_maxdd(new_asset=temp_data, replace_port=replacement_port,
-                                                                                            risk_free_rate = risk_free_rate,
-                                                                                            financing_rate = financing_rate,
-                                                                                            weight_asset = weight_asset,
-                                                                                            weight_replace_port = weight_replace_port,
-                                                                                            periodicity=252)
-            risk_ret_df.loc['Sharpe',ticker_list[i]]=sharpe_ratio(temp_data, risk_free = risk_free_rate, periodicity=252)
-            risk_ret_df.loc['Sortino',ticker_list[i]]=sortino_ratio(temp_data, risk_free = risk_free_rate, periodicity=252)
-            risk_ret_df.loc['Max_DD',ticker_list[i]]=max_dd(temp_data)
-            new_risk_ret_df.loc['Return',new_risk_ret_df.columns[i]]=cwarp_port_return(new_asset=temp_data,replace_port=replacement_port,
-                                                                                                    risk_free_rate = risk_free_rate,
-                                                                                                    financing_rate = financing_rate,
-                                                                                                    weight_asset = weight_asset,
-                                                                                                    weight_replace_port = weight_replace_port,
-                                                                                                    periodicity = 252)
-            new_risk_ret_df.loc['Vol',new_risk_ret_df.columns[i]]=cwarp_port_risk(new_asset=temp_data,replace_port=replacement_port,
-                                                                                                    risk_free_rate = risk_free_rate,
-                                                                                                    financing_rate = financing_rate,
-                                                                                                    weight_asset = weight_asset,
-                                                                                                    weight_replace_port = weight_replace_port,
-                                                                                                    periodicity=252)
-            cnpd = cwarp_new_port_data(new_asset=temp_data,replace_port=replacement_port, risk_free_rate = risk_free_rate,
-                                                                                                    financing_rate = financing_rate,
-                                                                                                    weight_asset = weight_asset,
-                                                                                                    weight_replace_port = weight_replace_port,
-                                                                                                    periodicity = 252)
-            new_ports[ticker_list[i]] = cnpd
-            new_risk_ret_df.loc['Sharpe',new_risk_ret_df.columns[i]]=sharpe_ratio(cnpd.copy(), risk_free = risk_free_rate, periodicity=252)
-            new_risk_ret_df.loc['Sortino',new_risk_ret_df.columns[i]]=sortino_ratio(cnpd.copy(), risk_free = risk_free_rate, periodicity=252)
-            new_risk_ret_df.loc['Max_DD',new_risk_ret_df.columns[i]]=max_dd(cnpd.copy())
-            new_risk_ret_df.loc['Ret_To_MaxDD',new_risk_ret_df.columns[i]]=return_maxdd_ratio(cnpd.copy(), risk_free = risk_free_rate, periodicity=252)
-            new_risk_ret_df.loc[f'CWARP_{round(100*weight_asset)}%_asset',new_risk_ret_df.columns[i]]=risk_ret_df.loc['CWARP',ticker_list[i]]
-
-        new_risk_ret_df.loc['Return',[replacement_port_name]]=annualized_return(replacement_port, periodicity=252)
-        new_risk_ret_df.loc['Vol',[replacement_port_name]]=target_downside_deviation(replacement_port, MAR=0)*np.sqrt(252)
-        new_risk_ret_df.loc['Sharpe',[replacement_port_name]]=sharpe_ratio(replacement_port, risk_free = risk_free_rate, periodicity=252)
-        new_risk_ret_df.loc['Sortino',[replacement_port_name]]=sortino_ratio(replacement_port, risk_free = risk_free_rate, periodicity=252)
-        new_risk_ret_df.loc['Max_DD',[replacement_port_name]]=max_dd(replacement_port)
-        new_risk_ret_df.loc['Ret_To_MaxDD',[replacement_port_name]]=return_maxdd_ratio(replacement_port, risk_free = risk_free_rate, periodicity=252)
-        new_risk_ret_df.loc[f'CWARP_{round(100*weight_asset)}%_asset',[replacement_port_name]] = cole_win_above_replace_port(new_asset=replacement_port, replace_port=replacement_port, risk_free_rate=risk_free_rate, financing_rate=financing_rate,
-                            weight_asset=weight_asset, weight_replace_port=weight_replace_port, periodicity=252)
-        first_col = new_risk_ret_df.pop(replacement_port_name)
-        new_risk_ret_df.insert(0, replacement_port_name, first_col)
+                                                                                    periodicity=252, history=panel.overlap))
+        new_risk_ret_df = new_risk_ret_df.rename(columns=lambda column: column.replace(_PORT_LABEL, replacement_port_name))
+        replacement_port = replacement_port.rename(replacement_port_name)
         # display dataframes
-        st.write(risk_ret_df.sort_values(by='CWARP', axis=1, ascending=False).style.set_precision(3))
-        st.write(new_risk_ret_df.sort_values(by='Sharpe', axis=1, ascending=False).style.set_precision(3))
+        st.write(risk_ret_df.sort_values(by='CWARP', axis=1, ascending=False).style.format(precision=3))
+        st.write(new_risk_ret_df.sort_values(by='Sharpe', axis=1, ascending=False).style.format(precision=3))
+        if show_optimal_weights:
+            optimal_key = (tuple(ticker_list), port_key, weight_replace_port, risk_free_rate, financing_rate, 252)
+            with profiler.stage('metrics', table='optimal weights'):
+                optimal_df = memo.get_or_compute('metrics', ('optimal',)+optimal_key,
+                                                 lambda: optimal_overlay_weight(new_assets=candidates_df.reindex(replacement_port.index), replace_port=replacement_port,
+                                                                                risk_free_rate = risk_free_rate,
+                                                                                financing_rate = financing_rate,
+                                                                                weight_replace_port = weight_replace_port,
+                                                                                periodicity=252))
+            st.write(optimal_df.sort_values(by='CWARP', ascending=False).T.style.format(precision=3))
         vol_arr=new_risk_ret_df.loc['Vol',new_risk_ret_df.columns[1:]]
         ret_arr=new_risk_ret_df.loc['Return',new_risk_ret_df.columns[1:]]
         sharpe_arr=new_risk_ret_df.loc['Sharpe',new_risk_ret_df.columns[1:]]
@@ -190,34 +176,44 @@ Here RMDD is the Return to Max-Drawdown Ratio, and n and p represent the new and
         # plt.scatter(max_sr_vol, max_sr_ret,c='red', s=200) # red dot
         # st.write(f)
 
-        sns.set_theme(style="white")
-        sns.set(rc={'figure.figsize':(125,10)})
-        #Load Data
-        adjust_new_risk = new_risk_ret_df.transpose()
-        adjust_new_risk['Portfolio']=adjust_new_risk.index
-        #Plot Seaborn
-        p=sns.relplot(x="Vol", y="Return", hue="Portfolio", size=f"CWARP_{round(100*weight_asset)}%_asset",
-                    sizes=(50, 400), alpha=.9, palette="muted",
-                    height=6, data=adjust_new_risk)
-        plt.title('Efficient Frontier with CWARP')
-        st.pyplot(p)
+        with profiler.stage('plot', chart='efficient frontier'):
+            cwarp_label = f"CWARP_{round(100*weight_asset)}%_asset"
+            if interactive_charts:
+                st.altair_chart(frontier_chart(new_risk_ret_df, cwarp_label), use_container_width=True)
+            else:
+                st.pyplot(static_frontier(new_risk_ret_df, cwarp_label))
 
         #plot the putative returns of the best CWARP asset, and the worst.
-        best_div = risk_ret_df.loc['CWARP'].astype(float).idxmax(axis='columns')
-        worst_div = risk_ret_df.loc['CWARP'].astype(float).idxmin(axis='columns')
+        best_div = risk_ret_df.loc['CWARP'].astype(float).idxmax()
+        worst_div = risk_ret_df.loc['CWARP'].astype(float).idxmin()
         st.write(f"Best CWarp: {best_div.upper()} Worst CWarp {worst_div.upper()}")
-
-        f = plt.figure(figsize=(8,6))
-        plt.plot((new_ports[best_div].astype(float)+1).cumprod(), label=best_div)
-        plt.plot((new_ports[worst_div].astype(float)+1).cumprod(), label=worst_div)
-        plt.title('Cumulative Returns With Best/Worst Diversifier')
-        plt.legend()
-        plt.xlabel('Date',fontsize=15)
-        plt.ylabel('Return',fontsize=15)
-        st.write(f)
+        with profiler.stage('plot', chart='best/worst cumulative returns'):
+            # Only the best and worst new portfolios are kept for plotting...
+            new_ports = {}
+            for div in (best_div, worst_div):
+                new_ports[div] = cwarp_new_port_data(new_asset=candidates_df[div], replace_port=replacement_port,
+                                                     risk_free_rate = risk_free_rate,
+                                                     financing_rate = financing_rate,
+                                                     weight_asset = weight_asset,
+                                                     weight_replace_port = weight_replace_port,
+                                                     periodicity = 252)
+            # long histories are downsampled to about one point per pixel, keeping peaks and drawdowns
+            title = 'Cumulative Returns With Best/Worst Diversifier'
+            if interactive_charts:
+                st.altair_chart(cumulative_chart(new_ports, title=title, max_points=_MAX_POINTS), use_container_width=True)
+            else:
+                st.pyplot(static_cumulative(new_ports, title=title, max_points=_MAX_POINTS))
     except Exception as Ex:
         st.write("There Has been an error:", Ex)
         st.write("Please refresh this app.")
+    with st.sidebar.expander("Cache Statistics"):
+        st.write(memo.stats().style.format(precision=2))
+    if profiler.enabled:
+        with st.sidebar.expander("Stage Timings"):
+            st.write(profiler.summary().style.format(precision=2))
+            fetches = profiler.breakdown('ticker')
+            if len(fetches): st.write(fetches.style.format(precision=2))
+            st.download_button("Download Chrome Trace", profiler.to_chrome_trace(), file_name="cwarp_trace.json", mime="application/json")
     # plt.colorbar(label='Cole Win Above Replacement Portfolio')
     # plt.title('Efficient Frontier using CWARP', fontsize=15)
     # plt.xlabel('Downside Volatility',fontsize=15)
@@ -0,0 +1,163 @@
+import numpy as np
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from cwarp_core import batch_metrics, cwarp_batch, cwarp_approx, _periodic_rate
+
+#Multi-Asset Overlay Basket#################################################################
+# Greedy forward selection (then pairwise swaps) of several overlay assets on top of one replacement portfolio, maximizing the
+# CWARP of the combined new portfolio. The basket's aggregate series is kept as a running sum that legs are added to and
+# removed from, so trial baskets are never rebuilt from all of their legs. Each step scores every remaining candidate at every
+# weight from the candidates' sums and cross products with the aggregate (cwarp_approx, shared by all weights), and only a
+# shortlist of the best approximate pairs gets the exact stats pass with its running NAV and drawdowns.
+# pandas is only imported to build the result, so pool workers load NumPy and cwarp_core alone.
+
+OverlayBasket = namedtuple('OverlayBasket', ['weights', 'cwarp', 'history', 'new_port'])
+
+class _Aggregate:
+    """running new portfolio of the basket: replacement portfolio plus every financed overlay leg.
+    Missing returns are tracked by count rather than NaN, so a leg can be removed again exactly like it was added."""
+
+    def __init__(self, replace_port, weight_replace_port):
+        self.filled = np.nan_to_num(replace_port*weight_replace_port)
+        self.missing = np.isnan(replace_port).astype(np.int64)
+
+    def add(self, overlay, weight, sign=1):
+        """overlay - financed returns of one leg (asset return less financing rate)"""
+        self.filled += sign*np.nan_to_num(overlay*weight)
+        self.missing += sign*np.isnan(overlay)
+
+    def series(self):
+        # a period where any leg is missing counts as missing, as the single asset new portfolio does
+        return np.where(self.missing > 0, np.nan, self.filled)
+
+    def removed(self, overlay, weight):
+        """series of the basket without one of its legs"""
+        return np.where(self.missing-np.isnan(overlay) > 0, np.nan, self.filled-np.nan_to_num(overlay*weight))
+
+def _score_additions(aggregate, columns, weights, params, data=None, exact=False):
+    """CWARP of the basket plus each candidate column at each overlay weight, returns a (len(weights) x len(columns)) array.
+    exact=False estimates it with cwarp_approx, exact=True runs the full stats pass of every pair."""
+    new_assets = data if data is not None else _worker_assets
+    block = new_assets[:, columns]
+    # the aggregate already holds the replacement portfolio at its weight, CWARP is measured against params' replace_stats
+    if not exact:
+        return cwarp_approx(block, aggregate, weight_asset=np.asarray(weights)[:, None], weight_replace_port=1, **params)['CWARP']
+    return np.array([cwarp_batch(block, aggregate, weight_asset=weight, weight_replace_port=1, **params)['CWARP'] for weight in weights])
+
+def _score_pairs(aggregate, columns, weights, params, data):
+    """exact CWARP of the basket plus each (column, weight) pair in one stats pass"""
+    return cwarp_batch(data[:, columns], aggregate, weight_asset=weights, weight_replace_port=1, **params)['CWARP']
+
+_worker_assets = None
+
+def _init_worker(new_assets):
+    """pool initializer: the candidate matrix is sent to each worker process once, not with every step"""
+    global _worker_assets
+    _worker_assets = new_assets
+
+def _cwarp(sortino, ret_maxdd, replace_stats):
+    return ((sortino/replace_stats['Sortino'][0]*ret_maxdd/replace_stats['Ret_To_MaxDD'][0])**(1/2)-1)*100
+
+def cwarp_basket(new_assets,replace_port,risk_free_rate=0,financing_rate=0,weights_asset=(0.25,),weight_replace_port=1,periodicity=252,
+                 max_assets=5,max_total_weight=1.0,min_improvement=0.0,swaps=True,max_swap_rounds=10,shortlist=20,n_jobs=1,shard_size=None,max_bytes=None):
+    """Greedy basket of overlay assets maximizing the Cole Win Above Replacement Portolio (CWARP) of the combined new portfolio.
+    new_assets = 2-D returns (time x assets) of the candidate assets, aligned with replace_port (DataFrame column names are used as labels)
+    replace_port = returns of your pre-existing portfolio
+    weights_asset = overlay weights a pick may take, every remaining candidate is tried at every weight that fits the budget
+    max_assets = most assets in the basket
+    max_total_weight = cap on the summed overlay weights of the basket
+    min_improvement = CWARP gain (in CWARP points) a new pick or swap must bring, selection stops when none does
+    swaps = after forward selection, replace basket members by unused candidates while that improves CWARP
+    max_swap_rounds = passes over the basket in the swap phase
+    shortlist = (candidate, weight) pairs with the best approximate CWARP (see cwarp_approx) that are scored exactly at each step,
+                the best of them is picked. None scores every pair exactly.
+    n_jobs = worker processes scoring the candidates of each step, in shards of shard_size columns (default about four per worker).
+             The picks do not depend on n_jobs.
+    max_bytes = memory budget of each batched pass, see cwarp_batch
+    remaining parameters as in cole_win_above_replace_port, the financing rate is charged on every overlay leg
+    Returns an OverlayBasket of the basket weights (Series by candidate), its CWARP, the history of steps (DataFrame) and
+    the basket's new portfolio returns."""
+    labels = list(new_assets.columns) if hasattr(new_assets, 'columns') else None
+    index = replace_port.index if hasattr(replace_port, 'align') and np.ndim(replace_port) == 1 else None
+    new_assets = np.asarray(new_assets, dtype=float)
+    if new_assets.ndim == 1: new_assets = new_assets[:, None]
+    if labels is None: labels = list(range(new_assets.shape[1]))
+    replace_port = np.asarray(replace_port, dtype=float)
+    weights_asset = np.asarray(sorted(weights_asset), dtype=float)
+    # financed overlay returns of a candidate, as in cwarp_new_port_data
+    financing = _periodic_rate(financing_rate, periodicity)
+
+    #Replacement portfolio statistics, computed once and passed to every scoring pass, and the empty basket
+    replace_stats = batch_metrics(replace_port, risk_free=risk_free_rate, periodicity=periodicity)
+    params = dict(risk_free_rate=risk_free_rate, financing_rate=financing_rate, periodicity=periodicity, max_bytes=max_bytes,
+                  replace_stats=replace_stats)
+    aggregate = _Aggregate(replace_port, weight_replace_port)
+    basket_stats = batch_metrics(aggregate.series(), risk_free=risk_free_rate, periodicity=periodicity)
+    current = _cwarp(basket_stats['Sortino'], basket_stats['Ret_To_MaxDD'], replace_stats)[0]
+    basket = {}   # column -> overlay weight
+    history = [{'Step': 0, 'Action': 'start', 'Ticker': None, 'Removed': None, 'Weight': 0.0, 'Total_Weight': 0.0,
+                'CWARP': current, 'Evaluated': 0}]
+
+    pool = ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(new_assets,)) if n_jobs > 1 else None
+
+    def best_addition(series, exclude, budget):
+        """best (CWARP, column, weight) of adding one candidate outside exclude to series within the weight budget, and pairs scored"""
+        columns = np.array([c for c in range(new_assets.shape[1]) if c not in exclude], dtype=np.int64)
+        weights = weights_asset[weights_asset <= budget+1e-12]
+        if len(columns) == 0 or len(weights) == 0: return None, 0
+        size = shard_size or max(1, -(-len(columns) // (4*max(n_jobs, 1))))
+        shards = [columns[i:i+size] for i in range(0, len(columns), size)]
+        exact = shortlist is None or shortlist >= len(columns)*len(weights)
+        if pool is None:
+            results = [_score_additions(series, shard, weights, params, data=new_assets, exact=exact) for shard in shards]
+        else:
+            results = list(pool.map(_score_additions, [series]*len(shards), shards, [weights]*len(shards), [params]*len(shards),
+                                    [None]*len(shards), [exact]*len(shards)))
+        # (candidates x weights), flattened so ties go to the first candidate and the smallest weight
+        scores = np.concatenate(results, axis=1).T.ravel()
+        pairs = np.arange(scores.size)
+        if not exact:
+            # exact pass over the shortlist only, taken across all shards so the picks do not depend on n_jobs
+            order = np.argsort(-np.nan_to_num(scores, nan=-np.inf), kind='stable')
+            pairs = np.sort(order[:shortlist])
+            scores = _score_pairs(series, columns[pairs//len(weights)], weights[pairs%len(weights)], params, new_assets)
+        if np.isnan(scores).all(): return None, len(columns)*len(weights)
+        best = pairs[np.nanargmax(scores)]
+        return (np.nanmax(scores), columns[best//len(weights)], weights[best%len(weights)]), len(columns)*len(weights)
+
+    try:
+        #Forward selection: add the best remaining candidate while it improves CWARP and fits the caps
+        while len(basket) < max_assets:
+            best, evaluated = best_addition(aggregate.series(), basket, max_total_weight-sum(basket.values()))
+            if best is None or best[0] <= current+min_improvement: break
+            current, column, weight = best
+            aggregate.add(new_assets[:, column]-financing, weight)
+            basket[column] = weight
+            history.append({'Step': len(history), 'Action': 'add', 'Ticker': labels[column], 'Removed': None, 'Weight': weight,
+                            'Total_Weight': sum(basket.values()), 'CWARP': current, 'Evaluated': evaluated})
+
+        #Swap phase: try replacing each member by the best unused candidate, keep the first improving swap of each member
+        for _ in range(max_swap_rounds if swaps else 0):
+            improved = False
+            for member in list(basket):
+                overlay = new_assets[:, member]-financing
+                series = aggregate.removed(overlay, basket[member])
+                budget = max_total_weight-sum(basket.values())+basket[member]
+                best, evaluated = best_addition(series, basket, budget)
+                if best is None or best[0] <= current+min_improvement: continue
+                current, column, weight = best
+                aggregate.add(overlay, basket.pop(member), sign=-1)
+                aggregate.add(new_assets[:, column]-financing, weight)
+                basket[column] = weight
+                improved = True
+                history.append({'Step': len(history), 'Action': 'swap', 'Ticker': labels[column], 'Removed': labels[member], 'Weight': weight,
+                                'Total_Weight': sum(basket.values()), 'CWARP': current, 'Evaluated': evaluated})
+            if not improved: break
+    finally:
+        if pool is not None: pool.shutdown()
+
+    new_port = aggregate.series()
+    import pandas as pd
+    weights = pd.Series({labels[column]: weight for column, weight in basket.items()}, dtype=float, name='Weight')
+    return OverlayBasket(weights, current, pd.DataFrame(history).set_index('Step'),
+                         pd.Series(new_port, index=index, name='Basket') if index is not None else new_port)
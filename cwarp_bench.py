@@ -0,0 +1,293 @@
+"""Benchmarks for the cwarp_defs metrics, the CWARP family and the app's scoring pipeline.
+
+Every case runs on synthetic returns. Cases vary the series length, the number of assets and the share of missing
+(NaN) returns. Single series metrics are timed on one asset. The batch and rolling functions are timed on whole
+(time x assets) matrices. The pipeline cases replay the scoring steps of cwarp_app.main headlessly: load, replacement
+portfolio, candidate panel, CWARP tables and the best/worst portfolios. Prices come from an in-memory stub provider,
+so no network is used. The import cases time a cold import of each module in a fresh interpreter and fail if a module
+pulls in heavy dependencies it must not need (e.g. plotting libraries for the metrics).
+
+Results are written as JSON. A saved file can be used as a baseline, and --compare reports every case's ratio to it.
+The exit status is 1 if any case is slower than the baseline by more than --threshold.
+
+Example:
+    python cwarp_bench.py --preset quick --out baseline.json
+    python cwarp_bench.py --preset quick --compare baseline.json --out current.json
+    python cwarp_bench.py --import-check
+"""
+import re
+import sys
+import os
+import json
+import time
+import warnings
+import subprocess
+import platform
+import argparse
+import datetime
+import numpy as np
+import pandas as pd
+import cwarp_defs
+from cwarp_data import MemoryProvider, build_panel, load_returns
+
+PRESETS = {'quick': dict(lengths=(1_000, 100_000), assets=(1, 100), nan=(0.0, 0.05)),
+           'full': dict(lengths=(1_000, 100_000, 1_000_000, 10_000_000), assets=(1, 100, 1_000, 10_000), nan=(0.0, 0.01, 0.2))}
+PARAMS = dict(risk_free_rate=0.005, financing_rate=0.01, weight_asset=0.25, weight_replace_port=1, periodicity=252)
+WINDOW = 252
+# modules that must stay importable without the listed packages, e.g. in short-lived screening workers
+# (cwarp_defs, cwarp_render, cwarp_screen and cwarp_service work on pandas objects throughout, their pandas import is timed and accepted)
+IMPORT_RULES = {'cwarp_core': ('pandas', 'matplotlib', 'seaborn', 'yfinance', 'streamlit'),
+                'cwarp_defs': ('matplotlib', 'seaborn', 'yfinance', 'streamlit'),
+                'cwarp_bootstrap': ('pandas', 'matplotlib', 'seaborn', 'yfinance', 'streamlit'),
+                'cwarp_basket': ('pandas', 'matplotlib', 'seaborn', 'yfinance', 'streamlit'),
+                'cwarp_render': ('matplotlib', 'seaborn', 'yfinance', 'streamlit'),
+                'cwarp_screen': ('matplotlib', 'seaborn', 'yfinance', 'streamlit'),
+                'cwarp_service': ('matplotlib', 'seaborn', 'yfinance', 'streamlit')}
+
+#Synthetic Data#############################################################################
+def synthetic_returns(n_obs, n_assets, nan_density=0.0, seed=0):
+    """(n_obs x n_assets) daily returns with a share nan_density of them missing at random, the first row is always missing
+    (as after pct_change). Column-major, like ReturnStore matrices."""
+    rng = np.random.default_rng([seed, n_obs, n_assets])
+    values = np.asfortranarray(rng.normal(0.0003, 0.01, (n_obs, n_assets)))
+    if nan_density > 0:
+        values[rng.random((n_obs, n_assets)) < nan_density] = np.nan
+    values[0] = np.nan
+    return values
+
+def stub_provider(tickers, n_obs, nan_density=0.0, seed=0):
+    """MemoryProvider serving random-walk closes for every ticker on a business day calendar of n_obs days,
+    with a share nan_density of each ticker's days missing (e.g. holidays, late listings)"""
+    calendar = pd.bdate_range(end='2020-12-31', periods=n_obs)
+    values = synthetic_returns(n_obs, len(tickers), nan_density, seed)
+    prices = {}
+    for k, ticker in enumerate(tickers):
+        close = pd.Series(100*np.cumprod(1+np.nan_to_num(values[:, k])), index=calendar, name=ticker)
+        prices[ticker] = close[~np.isnan(values[:, k])]
+    return MemoryProvider(prices), calendar
+
+#Timing#####################################################################################
+def timeit(fn, repeat=5, min_time=0.2):
+    """best and median seconds per call of fn(). Quick calls are looped so every measurement lasts about min_time/repeat."""
+    start = time.perf_counter()
+    fn()
+    first = time.perf_counter()-start
+    number = max(1, int(min_time/repeat/max(first, 1e-9)))
+    # cases slower than the whole time budget are measured once more instead of repeat times
+    if first*repeat > 10*min_time: repeat = 1
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number): fn()
+        times.append((time.perf_counter()-start)/number)
+    return min(times), float(np.median(times))
+
+#Cases######################################################################################
+def metric_cases(n_obs, nan_density):
+    """single series metrics and the CWARP family on one asset against one replacement portfolio, as pandas Series (as the app calls them)"""
+    values = synthetic_returns(n_obs, 2, nan_density)
+    series = pd.Series(values[:, 0])
+    replace_port = pd.Series(values[:, 1])
+    cases = {
+        'sharpe_ratio': lambda: cwarp_defs.sharpe_ratio(series),
+        'target_downside_deviation': lambda: cwarp_defs.target_downside_deviation(series),
+        'sortino_ratio': lambda: cwarp_defs.sortino_ratio(series),
+        'annualized_return': lambda: cwarp_defs.annualized_return(series),
+        'max_dd': lambda: cwarp_defs.max_dd(series),
+        'return_maxdd_ratio': lambda: cwarp_defs.return_maxdd_ratio(series),
+        'avg_positive': lambda: cwarp_defs.avg_positive(series),
+        'avg_neg': lambda: cwarp_defs.avg_neg(series),
+        'win_pct': lambda: cwarp_defs.win_pct(series),
+        'kelly': lambda: cwarp_defs.kelly(series),
+    }
+    for name in ('cole_win_above_replace_port', 'cwarp_additive_sortino', 'cwarp_additive_ret_maxdd',
+                 'cwarp_port_return', 'cwarp_port_risk', 'cwarp_new_port_data'):
+        fn = getattr(cwarp_defs, name)
+        cases[name] = lambda fn=fn: fn(series, replace_port, **PARAMS)
+    return cases
+
+def batch_cases(n_obs, n_assets, nan_density):
+    """vectorized and rolling functions on a whole (time x assets) matrix"""
+    values = synthetic_returns(n_obs, n_assets+1, nan_density)
+    candidates, replace_port = values[:, 1:], np.nan_to_num(values[:, 0])
+    window = min(WINDOW, n_obs)
+    return {
+        'batch_metrics': lambda: cwarp_defs.batch_metrics(candidates, risk_free=PARAMS['risk_free_rate']),
+        'cwarp_batch': lambda: cwarp_defs.cwarp_batch(candidates, replace_port, **PARAMS),
+        'rolling_sortino_ratio': lambda: cwarp_defs.rolling_sortino_ratio(candidates, window, risk_free=PARAMS['risk_free_rate']),
+        'rolling_max_dd': lambda: cwarp_defs.rolling_max_dd(candidates, window),
+        'rolling_cole_win_above_replace_port': lambda: cwarp_defs.rolling_cole_win_above_replace_port(candidates, replace_port, window, **PARAMS),
+    }
+
+def replay_scoring(provider, tickers, legs, weights, start_date, end_date, join='asset_start'):
+    """headless replay of the scoring steps of cwarp_app.main, returns the seconds spent in each step
+    join - date alignment of the panel, see cwarp_data.build_panel. Missing days of the stub provider are scattered across
+           every ticker, so an inner join of many candidates keeps almost no dates, each asset from its own start is the default"""
+    seconds = {}
+    start = time.perf_counter()
+    # pull data
+    loaded = load_returns(legs+tickers, start_date, end_date, provider)
+    returns = {}
+    for ticker, price_df in loaded.returns.items():
+        price_df = price_df.copy()
+        price_df.iloc[:1] = np.nan
+        returns[ticker] = price_df
+    seconds['load'] = time.perf_counter()-start
+    # replacement portfolio and candidate panel
+    start = time.perf_counter()
+    panel = build_panel(returns, legs, weights, tickers, join=join, name='Replacement')
+    replace_port, candidates_df = panel.replace_port, panel.candidates
+    seconds['panel'] = time.perf_counter()-start
+    # CWARP tables of every candidate
+    start = time.perf_counter()
+    risk_ret_df, new_risk_ret_df = cwarp_defs.cwarp_tables(candidates_df, replace_port, history=panel.overlap, **PARAMS)
+    seconds['score'] = time.perf_counter()-start
+    # best and worst new portfolios for plotting
+    start = time.perf_counter()
+    cwarp = risk_ret_df.loc['CWARP'].astype(float)
+    # random replacement portfolios can lose money, which leaves every CWARP undefined
+    best_worst = (cwarp.idxmax(), cwarp.idxmin()) if cwarp.notna().any() else (cwarp.index[0], cwarp.index[-1])
+    for div in best_worst:
+        new_port = cwarp_defs.cwarp_new_port_data(candidates_df[div], replace_port, **PARAMS)
+        (new_port.astype(float)+1).cumprod()
+    seconds['plot_data'] = time.perf_counter()-start
+    seconds['total'] = sum(seconds.values())
+    return seconds
+
+def pipeline_case(n_obs, n_assets, nan_density, repeat=3):
+    """best seconds per scoring step of the replayed pipeline, over repeat runs"""
+    legs, weights = ['spy', 'ief'], [0.6, 0.4]
+    tickers = [f'c{k:05d}' for k in range(n_assets)]
+    provider, calendar = stub_provider(legs+tickers, n_obs, nan_density)
+    end_date = calendar[-1]+pd.Timedelta(days=1)
+    runs = [replay_scoring(provider, tickers, legs, weights, calendar[0], end_date) for _ in range(repeat)]
+    return {step: (min(run[step] for run in runs), float(np.median([run[step] for run in runs]))) for step in runs[0]}
+
+def import_case(module, forbidden, repeat=3):
+    """best seconds of a cold import of module in a fresh interpreter, and the forbidden packages it loaded"""
+    code = ('import sys, time, json; start = time.perf_counter(); import %s; seconds = time.perf_counter()-start; '
+            'print(json.dumps([seconds, [name for name in %r if name in sys.modules]]))' % (module, list(forbidden)))
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    seconds = [run[0] for run in runs]
+    return min(seconds), float(np.median(seconds)), runs[0][1]
+
+def import_check(rules=IMPORT_RULES, log=print):
+    """import cases of every module in rules, returns (records, violations) with violations mapping module -> loaded forbidden packages"""
+    records, violations = [], {}
+    for module, forbidden in rules.items():
+        best, median, loaded = import_case(module, forbidden)
+        records.append({'group': 'import', 'name': module, 'n_obs': 1, 'n_assets': 1, 'nan_density': 0.0,
+                        'best_s': best, 'median_s': median, 'ns_per_value': best*1e9})
+        if loaded: violations[module] = loaded
+        log(f'{"import."+module:<45} {best*1e3:12.3f} ms' + (f'  loads {", ".join(loaded)}' if loaded else ''))
+    return records, violations
+
+#Suite######################################################################################
+def run_suite(lengths, assets, nan, pattern=None, max_cells=2**25, pipeline_max_obs=50_000, repeat=5, min_time=0.2, log=print):
+    """runs every case of the grid, returns a list of result records.
+    pattern - regular expression, only cases whose 'group.name' matches are run
+    max_cells - cases with more than max_cells time x asset values are skipped
+    pipeline_max_obs - longest calendar of the pipeline replay (daily dates run out long before 10M points)"""
+    selected = re.compile(pattern) if pattern else None
+    records = []
+
+    def record(group, name, n_obs, n_assets, nan_density, best, median):
+        records.append({'group': group, 'name': name, 'n_obs': n_obs, 'n_assets': n_assets, 'nan_density': nan_density,
+                        'best_s': best, 'median_s': median, 'ns_per_value': best/(n_obs*n_assets)*1e9})
+        log(f'{group+"."+name:<45} n_obs={n_obs:<9} n_assets={n_assets:<6} nan={nan_density:<5} {best*1e3:12.3f} ms')
+
+    def wanted(group, name):
+        return selected is None or selected.search(f'{group}.{name}') is not None
+
+    for n_obs in lengths:
+        for nan_density in nan:
+            cases = metric_cases(n_obs, nan_density)
+            for name, fn in cases.items():
+                group = 'cwarp' if 'cwarp' in name or name.startswith('cole') else 'metric'
+                if wanted(group, name): record(group, name, n_obs, 1, nan_density, *timeit(fn, repeat, min_time))
+            del cases
+            for n_assets in assets:
+                if n_obs*n_assets > max_cells: continue
+                cases = batch_cases(n_obs, n_assets, nan_density)
+                for name, fn in cases.items():
+                    if wanted('batch', name): record('batch', name, n_obs, n_assets, nan_density, *timeit(fn, repeat, min_time))
+                del cases
+                if n_obs <= pipeline_max_obs and any(wanted('pipeline', step) for step in ('load', 'panel', 'score', 'plot_data', 'total')):
+                    for step, (best, median) in pipeline_case(n_obs, n_assets, nan_density).items():
+                        if wanted('pipeline', step): record('pipeline', step, n_obs, n_assets, nan_density, best, median)
+    return records
+
+def environment():
+    return {'date': datetime.datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+            'numpy': np.__version__, 'pandas': pd.__version__, 'machine': platform.machine(), 'platform': platform.platform()}
+
+#Baselines##################################################################################
+def _key(record):
+    return (record['group'], record['name'], record['n_obs'], record['n_assets'], record['nan_density'])
+
+def compare(records, baseline, threshold=0.25):
+    """table of every case found in both runs with its best time now and in the baseline.
+    ratio is now/baseline, status is 'regression' above 1+threshold and 'improvement' below 1/(1+threshold)"""
+    old = {_key(record): record for record in baseline['results']}
+    rows = []
+    for record in records:
+        if _key(record) not in old: continue
+        ratio = record['best_s']/old[_key(record)]['best_s']
+        status = 'regression' if ratio > 1+threshold else 'improvement' if ratio < 1/(1+threshold) else ''
+        rows.append(dict(zip(('group', 'name', 'n_obs', 'n_assets', 'nan_density'), _key(record)),
+                         baseline_ms=old[_key(record)]['best_s']*1e3, current_ms=record['best_s']*1e3, ratio=ratio, status=status))
+    return pd.DataFrame(rows, columns=['group', 'name', 'n_obs', 'n_assets', 'nan_density', 'baseline_ms', 'current_ms', 'ratio', 'status'])
+
+#Command Line###############################################################################
+def _numbers(text, kind):
+    return tuple(kind(value) for value in text.replace('_', '').split(','))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the CWARP metrics and scoring pipeline on synthetic data.')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='quick', help='grid of lengths, asset counts and NaN densities')
+    parser.add_argument('--lengths', help='comma separated series lengths, overrides the preset')
+    parser.add_argument('--assets', help='comma separated asset counts, overrides the preset')
+    parser.add_argument('--nan', help='comma separated NaN densities, overrides the preset')
+    parser.add_argument('--filter', help='regular expression on "group.name", e.g. "batch|max_dd"')
+    parser.add_argument('--max-cells', type=int, default=2**25, help='skip cases with more time x asset values')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds spent measuring each quick case')
+    parser.add_argument('--out', help='write results as JSON, e.g. to be used as a baseline')
+    parser.add_argument('--compare', help='baseline JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='slowdown (as a fraction) reported as a regression')
+    parser.add_argument('--import-check', action='store_true', help='only run the import cases')
+    args = parser.parse_args(argv)
+
+    grid = dict(PRESETS[args.preset])
+    if args.lengths: grid['lengths'] = _numbers(args.lengths, int)
+    if args.assets: grid['assets'] = _numbers(args.assets, int)
+    if args.nan: grid['nan'] = _numbers(args.nan, float)
+    warnings.filterwarnings('ignore', category=RuntimeWarning)
+    records, violations = import_check()
+    if not args.import_check:
+        records += run_suite(grid['lengths'], grid['assets'], grid['nan'], pattern=args.filter, max_cells=args.max_cells,
+                             repeat=args.repeat, min_time=args.min_time)
+    for module, loaded in violations.items():
+        print(f'error: importing {module} loads {", ".join(loaded)}')
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'environment': environment(), 'grid': grid, 'results': records}, f, indent=1)
+        print(f'{len(records)} results -> {args.out}')
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        table = compare(records, baseline, threshold=args.threshold)
+        with pd.option_context('display.max_rows', None, 'display.width', 200):
+            print(table.to_string(index=False, float_format=lambda x: f'{x:.3f}'))
+        regressions = (table['status'] == 'regression').sum()
+        print(f'{len(table)} cases compared with {args.compare}: {regressions} regression(s), '
+              f'{(table["status"] == "improvement").sum()} improvement(s)')
+        if regressions: return 1
+    return 1 if violations else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from cwarp_core import batch_metrics, _periodic_rate
+
+#Block Bootstrap############################################################################
+# CWARP confidence intervals from resampling the paired (new asset, replacement portfolio) returns in blocks,
+# which keeps their co-movement and short-range autocorrelation (volatility clustering, drawdown paths) intact.
+# pandas is only imported to build the result table, so pool workers load NumPy and cwarp_core alone.
+
+def bootstrap_indices(n_obs, n_boot, block_size=20, method='stationary', rng=None):
+    """Row indices of n_boot resampled paths of length n_obs, generated in one shot as an (n_boot x n_obs) array.
+    method - 'stationary' (Politis-Romano: geometric block lengths with mean block_size) or
+             'block' (circular moving blocks of exactly block_size)
+    rng - numpy Generator, a new unseeded one by default"""
+    if rng is None: rng = np.random.default_rng()
+    t = np.arange(n_obs)
+    if method == 'stationary':
+        new_block = rng.random((n_boot, n_obs)) < 1/block_size
+    elif method == 'block':
+        new_block = np.broadcast_to(t % block_size == 0, (n_boot, n_obs))
+    else:
+        raise ValueError(f"method must be 'stationary' or 'block', not {method}")
+    new_block = np.array(new_block)
+    new_block[:, 0] = True
+    starts = rng.integers(0, n_obs, size=(n_boot, n_obs))
+    # position where the current block began, then walk forward (wrapping around) from that block's random start
+    block_begin = np.maximum.accumulate(np.where(new_block, t, 0), axis=1)
+    return (np.take_along_axis(starts, block_begin, axis=1) + t - block_begin) % n_obs
+
+def _resampled_cwarp(new_assets, replace_port, idx, params):
+    """CWARP of every candidate on every resampled path, idx is (resamples x time), returns (resamples x assets)"""
+    risk_free_rate = params['risk_free_rate']
+    periodicity = params['periodicity']
+    financing_rate = _periodic_rate(params['financing_rate'], periodicity)
+    # (time x resamples) replacement paths and (time x resamples x assets) candidate paths
+    replace_paths = replace_port[idx.T]
+    replace_stats = batch_metrics(replace_paths, risk_free=risk_free_rate, periodicity=periodicity)
+    new_port = (new_assets[idx.T]-financing_rate)*params['weight_asset']+replace_paths[:, :, None]*params['weight_replace_port']
+    out = batch_metrics(new_port, risk_free=risk_free_rate, periodicity=periodicity)
+    return ((out['Sortino']/replace_stats['Sortino'][:, None]*out['Ret_To_MaxDD']/replace_stats['Ret_To_MaxDD'][:, None])**(1/2)-1)*100
+
+_worker_data = None
+
+def _init_worker(new_assets, replace_port, params):
+    """pool initializer: the return data is sent to each worker process once, not with every chunk"""
+    global _worker_data
+    _worker_data = (new_assets, replace_port, params)
+
+def _bootstrap_chunk(n_boot, seed, block_size, method, data=None):
+    new_assets, replace_port, params = data if data is not None else _worker_data
+    idx = bootstrap_indices(len(replace_port), n_boot, block_size=block_size, method=method, rng=np.random.default_rng(seed))
+    return _resampled_cwarp(new_assets, replace_port, idx, params)
+
+def cwarp_bootstrap(new_assets,replace_port,risk_free_rate=0,financing_rate=0,weight_asset=0.25,weight_replace_port=1,periodicity=252,
+                    n_boot=1000,block_size=20,method='stationary',ci=0.90,seed=None,n_jobs=1,max_cells=2**24,return_samples=False):
+    """Bootstrap distribution of Cole Win Above Replacement Portolio (CWARP) for every candidate asset.
+    new_assets = 2-D returns (time x assets) of the candidate assets, aligned with replace_port (DataFrame column names are used as labels)
+    replace_port = returns of your pre-existing portfolio
+    n_boot = number of resampled paths, the same paths are used for every candidate so their scores stay comparable
+    block_size = (mean) block length in periods, e.g. 20 trading days
+    method = 'stationary' or 'block', see bootstrap_indices
+    ci = coverage of the percentile interval, e.g. 0.90 for the 5th to 95th percentiles
+    seed = seed for reproducible resamples, results do not depend on n_jobs
+    n_jobs = worker processes, resamples are split into chunks of at most max_cells time x resample x asset values
+    return_samples = also return the (n_boot x assets) array of resampled CWARPs
+    remaining parameters as in cole_win_above_replace_port
+    Returns a DataFrame indexed by candidate with the point estimate 'CWARP', bootstrap 'Mean' and 'Std',
+    'CI_Lower'/'CI_Upper' percentile bounds and 'Prob_Positive', the share of resamples with CWARP > 0."""
+    labels = list(new_assets.columns) if hasattr(new_assets, 'columns') else None
+    new_assets = np.asarray(new_assets, dtype=float)
+    if new_assets.ndim == 1: new_assets = new_assets[:, None]
+    replace_port = np.asarray(replace_port, dtype=float)
+    params = dict(risk_free_rate=risk_free_rate, financing_rate=financing_rate, weight_asset=weight_asset,
+                  weight_replace_port=weight_replace_port, periodicity=periodicity)
+
+    # chunks are fixed by the data shape and seeded independently, so any number of processes draws the same paths
+    chunk = max(1, int(max_cells // new_assets.size))
+    sizes = [min(chunk, n_boot-i) for i in range(0, n_boot, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    if n_jobs == 1:
+        samples = [_bootstrap_chunk(n, s, block_size, method, data=(new_assets, replace_port, params)) for n, s in zip(sizes, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(new_assets, replace_port, params)) as pool:
+            samples = list(pool.map(_bootstrap_chunk, sizes, seeds, [block_size]*len(sizes), [method]*len(sizes)))
+    samples = np.concatenate(samples, axis=0)
+
+    point = _resampled_cwarp(new_assets, replace_port, np.arange(len(replace_port))[None, :], params)[0]
+    valid = ~np.isnan(samples)
+    import pandas as pd
+    table = pd.DataFrame({'CWARP': point,
+                          'Mean': np.nanmean(samples, axis=0),
+                          'Std': np.nanstd(samples, axis=0),
+                          'CI_Lower': np.nanpercentile(samples, 100*(1-ci)/2, axis=0),
+                          'CI_Upper': np.nanpercentile(samples, 100*(1+ci)/2, axis=0),
+                          'Prob_Positive': (samples > 0).sum(axis=0)/valid.sum(axis=0)},
+                         index=labels)
+    if return_samples: return table, samples
+    return table
@@ -0,0 +1,96 @@
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+#Memoization Cache##########################################################################
+def _sizeof(value):
+    """approximate memory footprint of a cached value in bytes"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if isinstance(value, np.ndarray): return value.nbytes
+    if isinstance(value, (bytes, bytearray)): return len(value)
+    if isinstance(value, dict): return sys.getsizeof(value)+sum(_sizeof(k)+_sizeof(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)): return sys.getsizeof(value)+sum(_sizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+class MemoCache:
+    """Thread-safe least-recently-used cache of computed results with explicit keys, bounded by memory.
+    Entries are grouped by namespace (e.g. 'data', 'panel', 'metrics', 'latex') and hits, misses and evictions are counted
+    per namespace, so callers can see which stages are actually being reused.
+    max_bytes - total approximate size of cached values, least recently used entries are evicted beyond it"""
+
+    def __init__(self, max_bytes=256*2**20):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # (namespace, key) -> (value, nbytes)
+        self._bytes = 0
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _count(self, namespace, field):
+        stats = self._stats.setdefault(namespace, {'hits': 0, 'misses': 0, 'evictions': 0})
+        stats[field] += 1
+
+    def get(self, namespace, key, default=None):
+        """cached value for key, or default (counted as a miss)"""
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                self._count(namespace, 'misses')
+                return default
+            self._entries.move_to_end((namespace, key))
+            self._count(namespace, 'hits')
+            return entry[0]
+
+    def put(self, namespace, key, value):
+        nbytes = _sizeof(value)
+        with self._lock:
+            old = self._entries.pop((namespace, key), None)
+            if old is not None: self._bytes -= old[1]
+            # values larger than the whole budget are not cached at all
+            if nbytes > self.max_bytes: return value
+            self._entries[(namespace, key)] = (value, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                (evicted_namespace, _), (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._bytes -= evicted_bytes
+                self._count(evicted_namespace, 'evictions')
+        return value
+
+    def get_or_compute(self, namespace, key, compute):
+        """cached value for key, computing and caching it with compute() on a miss"""
+        missing = object()
+        value = self.get(namespace, key, missing)
+        if value is missing: value = self.put(namespace, key, compute())
+        return value
+
+    def memoize(self, namespace, key=None):
+        """decorator caching a function's results in namespace, keyed on key(*args, **kwargs) (default: the arguments themselves)"""
+        def decorator(fn):
+            def wrapper(*args, **kwargs):
+                cache_key = key(*args, **kwargs) if key is not None else (args, tuple(sorted(kwargs.items())))
+                return self.get_or_compute(namespace, cache_key, lambda: fn(*args, **kwargs))
+            wrapper.__name__ = fn.__name__
+            wrapper.__doc__ = fn.__doc__
+            return wrapper
+        return decorator
+
+    def stats(self):
+        """DataFrame of hits, misses, hit rate, evictions, entries and megabytes held per namespace"""
+        with self._lock:
+            rows = {namespace: dict(stats) for namespace, stats in self._stats.items()}
+            for (namespace, _), (_, nbytes) in self._entries.items():
+                row = rows.setdefault(namespace, {'hits': 0, 'misses': 0, 'evictions': 0})
+                row['entries'] = row.get('entries', 0)+1
+                row['MB'] = row.get('MB', 0)+nbytes/2**20
+        table = pd.DataFrame.from_dict(rows, orient='index').reindex(columns=['hits', 'misses', 'evictions', 'entries', 'MB']).fillna(0)
+        table.insert(2, 'hit_rate', table['hits']/(table['hits']+table['misses']).where(lambda n: n > 0))
+        return table
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._stats.clear()
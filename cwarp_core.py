@@ -0,0 +1,587 @@
+"""NumPy-only core of the CWARP metrics: the return stats kernel, the single series risk and reward functions,
+the CWARP family and their batched versions. Pandas objects are accepted as inputs but pandas, plotting libraries
+and data providers are never imported here, so process pool workers can import this module cheaply."""
+import numpy as np
+from collections import namedtuple
+
+#Return Statistics Kernel###################################################################
+ReturnStats = namedtuple('ReturnStats', ['n', 'count', 'mean', 'var', 'downside_ss', 'end_nav', 'max_dd',
+                                         'wins', 'losses', 'zeros', 'avg_win', 'avg_loss'])
+ReturnStats.__doc__ = """Summary of a return series (or of every column along axis 0) that all the risk and reward functions derive from.
+    n - number of periods, including missing returns
+    count - number of non-missing returns
+    mean, var - mean and (population) variance of the non-missing returns
+    downside_ss - sum of squared shortfalls below MAR, missing returns count as no shortfall
+    end_nav - final NAV starting from 1 (missing returns leave NAV unchanged)
+    max_dd - max drawdown of NAV as a positive number
+    wins, losses, zeros - number of positive, negative and zero returns
+    avg_win, avg_loss - mean positive and mean negative return (NaN if there are none)
+    end_nav and max_dd (nav) and the win/loss fields (win_loss) are None unless requested from return_stats"""
+
+def _safe_divide(total, count):
+    """total/count, NaN where count is 0"""
+    return np.divide(total, count, out=np.full(np.shape(total), np.nan), where=np.asarray(count) > 0)[()]
+
+def _as_float(df):
+    """numpy array of df, float32 storage is kept as is (the kernel accumulates it in float64), anything else becomes float64"""
+    df = np.asarray(df)
+    return df if df.dtype in (np.float32, np.float64) else df.astype(float)
+
+def return_stats(df, MAR=0, workspace=None, nav=True, win_loss=True):
+    """df - asset return series, or array/dataframe of series along axis 0
+   MAR - minimum acceptable return per period for the downside sum of squares
+   workspace - optional float64 array of shape (2,)+df.shape reused as scratch space, e.g. across many calls on series of one length
+   nav - also build the NAV path for end_nav and max_dd
+   win_loss - also count and average the wins and losses
+   Fields that are not requested are left as None (e.g. Sharpe and Sortino need neither).
+   Returns a ReturnStats record computed in a fixed set of passes over df with no temporaries beyond the workspace
+   (NAV and running peak are built in place rather than as new arrays for every metric)."""
+    # convert return series to numpy array (in case Pandas series is provided), float32 data is kept and every sum is taken in float64
+    df = _as_float(df)
+    if workspace is None or workspace.shape != (2,)+df.shape: workspace = np.empty((2,)+df.shape)
+    a, b = workspace[0], workspace[1]
+    missing = np.isnan(df)
+    n = df.shape[0]
+    count = n-np.count_nonzero(missing, axis=0)
+    # returns with missing values as 0, complete data is used as is
+    if missing.any():
+        np.copyto(a, df)
+        np.copyto(a, 0, where=missing)
+        ret = a
+    else:
+        missing = None
+        ret = df
+    mean = _safe_divide(ret.sum(axis=0, dtype=np.float64), count)
+    # variance around the mean of the non-missing returns
+    np.subtract(ret, mean, out=b)
+    if missing is not None: np.copyto(b, 0, where=missing)
+    var = _safe_divide(np.einsum('i...,i...->...', b, b), count)
+    # shortfall below MAR, missing returns count as no shortfall
+    np.subtract(ret, MAR, out=b, dtype=np.float64)
+    np.minimum(b, 0, out=b)
+    if missing is not None: np.copyto(b, 0, where=missing)
+    downside_ss = np.einsum('i...,i...->...', b, b)[()]
+    wins = losses = zeros = avg_win = avg_loss = None
+    if win_loss:
+        np.maximum(ret, 0, out=b)
+        wins = np.count_nonzero(b, axis=0)
+        avg_win = _safe_divide(b.sum(axis=0), wins)
+        np.minimum(ret, 0, out=b)
+        losses = np.count_nonzero(b, axis=0)
+        avg_loss = _safe_divide(b.sum(axis=0), losses)
+        zeros = count-wins-losses
+    end_nav = max_dd = None
+    if nav:
+        # NAV (missing returns leave NAV unchanged), running peak and drawdowns relative to the peak
+        np.add(ret, 1.0, out=a, dtype=np.float64)
+        np.cumprod(a, axis=0, out=a)
+        end_nav = a[-1].copy()
+        np.maximum.accumulate(a, axis=0, out=b)
+        np.divide(a, b, out=b)
+        max_dd = np.abs(b.min(axis=0)-1)
+    return ReturnStats(n, count, mean, var, downside_ss, end_nav, max_dd, wins, losses, zeros, avg_win, avg_loss)
+
+def _stats_annualized_return(stats, periodicity=252):
+    return stats.end_nav**(1/(stats.n/periodicity)) - 1
+
+def _stats_sharpe(stats, risk_free=0, periodicity=252):
+    """risk_free is per period"""
+    return (stats.mean-risk_free)/np.sqrt(stats.var)*np.sqrt(periodicity)
+
+def _stats_tdd(stats):
+    """target downside deviation (per period) of the MAR the stats were computed with"""
+    return np.sqrt(stats.downside_ss/stats.n)
+
+def _stats_sortino(stats, risk_free=0, periodicity=252):
+    """risk_free is per period"""
+    return (stats.mean-risk_free)/_stats_tdd(stats)*np.sqrt(periodicity)
+
+def _stats_return_maxdd(stats, risk_free=0, periodicity=252):
+    """risk_free is per period"""
+    return (_stats_annualized_return(stats, periodicity)-risk_free)/abs(stats.max_dd)
+
+#Risk and Reward Functions##################################################################
+def sharpe_ratio(df,risk_free=0,periodicity=252):
+    """df - asset return series, e.g. daily returns based on daily close prices of asset
+   risk_free - annualized risk free rate (default is assumed to be 0)
+   periodicity - number of periods at desired frequency in one year
+                e.g. 252 business days in 1 year (default),
+                12 months in 1 year,
+                52 weeks in 1 year etc."""
+    # convert annualized risk free rate into appropriate value for provided frequency of asset return series (df)
+    risk_free=(1+risk_free)**(1/periodicity)-1
+    # Sharpe Ratio = Mean excess return / Std of returns * sqrt(periodicity)
+    return _stats_sharpe(return_stats(df, nav=False, win_loss=False), risk_free=risk_free, periodicity=periodicity)
+
+def target_downside_deviation(df, MAR=0, periodicity=252):
+    """df - asset return series, e.g. daily returns based on daily close prices of asset
+    minimum acceptable return (MAR) - value is subtracted from returns before root-mean-square calculation to obtain target downside deviation (TDD)"""
+    # root-mean-square of the shortfalls below MAR (positive excess returns count as zero)
+    return _stats_tdd(return_stats(df, MAR=MAR, nav=False, win_loss=False))
+
+def sortino_ratio(df,risk_free=0, periodicity=252, include_risk_free_in_vol=False):
+    """df - asset return series, e.g. daily returns based on daily close prices of asset
+   risk_free - annualized risk free rate (default is assumed to be 0). Note: risk free rate is assumed to be the target return/minimum acceptable return (MAR)
+               used in calculating both the mean excess return (numerator of Sortino ratio) and determining target downside deviation (TDD, the denominator of Sortino)
+   periodicity - number of periods at desired frequency in one year
+                e.g. 252 business days in 1 year (default),
+                12 months in 1 year,
+                52 weeks in 1 year etc."""
+    # convert annualized risk free rate into appropriate value for provided frequency of asset return series (df)
+    risk_free=(1+risk_free)**(1/periodicity)-1
+    # target downside deviation (TDD) is taken below the risk free rate if include_risk_free_in_vol, otherwise below 0
+    if include_risk_free_in_vol==True: MAR=risk_free
+    else: MAR=0
+    # Sortino Ratio = Mean excess return / TDD * sqrt(periodicity)
+    return _stats_sortino(return_stats(df, MAR=MAR, nav=False, win_loss=False), risk_free=risk_free, periodicity=periodicity)
+
+def annualized_return(df,periodicity=252):
+    """df - asset return series, e.g. returns based on daily close prices of asset
+   periodicity - number of periods at desired frequency in one year
+                e.g. 252 business days in 1 year (default),
+                12 months in 1 year,
+                52 weeks in 1 year etc."""
+    # end NAV (starting from 1) annualized over the number of years of returns data provided in df
+    return _stats_annualized_return(return_stats(df, win_loss=False), periodicity=periodicity)
+
+def max_dd(df, return_data=False):
+    """df - asset return series, e.g. returns based on daily close prices of asset
+    return_data - boolean value to determine if drawdown values over the return data time period should be return, instead of max DD"""
+    # max drawdown (a positive number) comes straight from the stats kernel
+    if return_data!=True: return return_stats(df, win_loss=False).max_dd
+    # convert return series to numpy array (in case Pandas series is provided)
+    df = np.asarray(df)
+    # calculate cumulative returns
+    start_NAV = 1
+    r = np.nancumprod(df+start_NAV)
+    # calculate cumulative max returns (i.e. keep track of peak cumulative return up to that point in time, despite actual cumulative return at that point in time)
+    peak_r = np.maximum.accumulate(r)
+    # drawdown values over the time period relative to peak cumulative return achieved up to each point in time
+    return (r - peak_r) / peak_r
+
+def return_maxdd_ratio(df,risk_free=0,periodicity=252):
+    """df - asset return series, e.g. returns based on daily close prices of asset
+   risk_free - annualized risk free rate (default is assumed to be 0)
+   periodicity - number of periods at desired frequency in one year
+                e.g. 252 business days in 1 year (default),
+                12 months in 1 year,
+                52 weeks in 1 year etc."""
+    # convert annualized risk free rate into appropriate value for provided frequency of asset return series (df)
+    risk_free=(1+risk_free)**(1/periodicity)-1
+    # annualized excess return over max drawdown, both from one stats pass
+    return _stats_return_maxdd(return_stats(df, win_loss=False), risk_free=risk_free, periodicity=periodicity)
+
+def _stats_avg_nonneg(stats):
+    """mean of the returns >= 0 (wins and zeros)"""
+    return _safe_divide(np.where(stats.wins > 0, stats.avg_win*stats.wins, 0), stats.wins+stats.zeros)
+
+def avg_positive(ret,dropzero=1,stats=None):
+    if stats is None: stats = return_stats(ret, nav=False)
+    if dropzero>0:
+        positives, avg = stats.wins, stats.avg_win
+    else:
+        positives, avg = stats.wins+stats.zeros, _stats_avg_nonneg(stats)
+    if positives > 0:
+        return avg
+    else:
+        return 0.000000000000000000000000000001
+
+def avg_neg(ret,stats=None):
+    if stats is None: stats = return_stats(ret, nav=False)
+    if stats.losses > 0:
+        return stats.avg_loss
+    else:
+        return -1*0.000000000000000000000000000001
+
+def win_pct(ret,dropzero=1,stats=None):
+    if stats is None: stats = return_stats(ret, nav=False)
+    if dropzero>0:
+        win=stats.wins
+    else:
+        win=stats.wins+stats.zeros
+    # missing returns count towards the total
+    return (win/stats.n)
+
+def kelly(df,dropzero=0,stats=None):
+    if stats is None: stats = return_stats(df, nav=False)
+    # zero returns count as wins unless dropped
+    if dropzero==1:
+        avg_pos=stats.avg_win
+        win_pct=stats.wins/(stats.wins+stats.losses)
+    else:
+        avg_pos=_stats_avg_nonneg(stats)
+        win_pct=(stats.wins+stats.zeros)/stats.count
+    avg_neg=stats.avg_loss
+    loss_pct=(1-win_pct)
+    return ((avg_pos/abs(avg_neg))*win_pct-(loss_pct))/(avg_pos/abs(loss_pct))
+
+#CWARP Functions############################################################################
+def _overlay_stats(new_asset,replace_port,financing_rate,weight_asset,weight_replace_port,replace=True,nav=True):
+    """ReturnStats of the new portfolio (new_asset-financing_rate)*weight_asset+replace_port*weight_replace_port and, if replace,
+    of the replacement portfolio, computed in one shared workspace. financing_rate is per period."""
+    replace_stats = None
+    if all(hasattr(x, 'align') and np.ndim(x) == 1 for x in (new_asset, replace_port)) and not new_asset.index.equals(replace_port.index):
+        # the replacement portfolio is scored on its own dates, only the new portfolio is built on the union of both
+        # (pandas series on different dates are aligned, as pandas arithmetic would)
+        if replace: replace_stats = return_stats(replace_port, nav=nav, win_loss=False)
+        new_asset, replace_port = new_asset.align(replace_port)
+    new_asset = np.asarray(new_asset, dtype=float)
+    replace_port = np.asarray(replace_port, dtype=float)
+    workspace = np.empty((3,)+np.broadcast_shapes(new_asset.shape, replace_port.shape))
+    # new portfolio built in place in the last slot, the first two are scratch space for the stats kernel
+    new_port = workspace[2]
+    np.subtract(new_asset, financing_rate, out=new_port)
+    np.multiply(new_port, weight_asset, out=new_port)
+    np.multiply(replace_port, weight_replace_port, out=workspace[0])
+    np.add(new_port, workspace[0], out=new_port)
+    new_stats = return_stats(new_port, workspace=workspace[:2], nav=nav, win_loss=False)
+    if not replace: return new_stats
+    if replace_stats is None: replace_stats = return_stats(replace_port, workspace=workspace[:2], nav=nav, win_loss=False)
+    return replace_stats, new_stats
+
+def cole_win_above_replace_port(new_asset,replace_port,risk_free_rate=0,financing_rate=0,weight_asset=0.25,weight_replace_port=1,periodicity=252):
+    """Cole Win Above Replacement Portolio (CWARP): Total score to evaluate whether any new investment improves or hurts the return to risk of your total portfolio.
+    new_asset = returns of the asset you are thinking of adding to your portfolio
+    replace_port = returns of your pre-existing portfolio (e.g. S&P 500 Index, 60/40 Stock-Bond Portfolio)
+    risk_free_rate = Tbill rate (annualized)
+    financing_rate = portfolio margin/borrowing cost (annualized) to layer new asset on top of prevailing portfolio (e.g. LIBOR + 60bps). No financing rate is reasonable for derivate overlay products.
+    weight_asset = % weight you wish to overlay for the new asset on top of the previous portfolio, 25% overlay allocation is standard
+    weight_replace_port = % weight of the replacement portfolio, 100% pre-existing portfolio value is standard
+    periodicity = the frequency of the data you are sampling, typically 12 for monthly or 252 for trading day count"""
+    # convert annualized financing and risk free rates into appropriate values for provided periodicity
+    financing_rate=(1+financing_rate)**(1/periodicity)-1
+    risk_free=(1+risk_free_rate)**(1/periodicity)-1
+
+    #One stats pass each over the replacement portfolio and the new portfolio
+    replace_stats, new_stats = _overlay_stats(new_asset, replace_port, financing_rate, weight_asset, weight_replace_port)
+
+    #Calculate Replacement Portfolio Sortino Ratio and Return to Max Drawdown
+    replace_port_sortino = _stats_sortino(replace_stats, risk_free=risk_free, periodicity=periodicity)
+    replace_port_return_maxdd = _stats_return_maxdd(replace_stats, risk_free=risk_free, periodicity=periodicity)
+
+    #Calculate New Portfolio Sortino Ratio and Return to Max Drawdown
+    new_port_sortino = _stats_sortino(new_stats, risk_free=risk_free, periodicity=periodicity)
+    new_port_return_maxdd = _stats_return_maxdd(new_stats, risk_free=risk_free, periodicity=periodicity)
+
+    #Final CWARP calculation
+    CWARP = ((new_port_return_maxdd/replace_port_return_maxdd*new_port_sortino/replace_port_sortino)**(1/2)-1)*100
+
+    return CWARP
+
+def cwarp_additive_sortino(new_asset,replace_port,risk_free_rate=0,financing_rate=0,weight_asset=0.25,weight_replace_port=1,periodicity=252):
+    """Cole Win Above Replacement Portolio (CWARP) Sortino +: Isolates new investment effect on total portfolio Sortino Ratio, which is a portion of the holistic CWARP score.
+    new_asset = returns of the asset you are thinking of adding to your portfolio
+    replace_port = returns of your pre-existing portfolio (e.g. S&P 500 Index, 60/40 Stock-Bond Portfolio)
+    risk_free_rate = Tbill rate (annualized)
+    financing_rate = portfolio margin/borrowing cost (annualized) to layer new asset on top of prevailing portfolio (e.g. LIBOR + 60bps). No financing rate is reasonable for derivate overlay products.
+    weight_asset = % weight you wish to overlay for the new asset on top of the previous portfolio, 25% overlay allocation is standard
+    weight_replace_port = % weight of the replacement portfolio, 100% pre-existing portfolio value is standard
+    periodicity = the frequency of the data you are sampling, typically 12 for monthly or 252 for trading day count"""
+    # convert annualized financing and risk free rates into appropriate values for provided periodicity
+    financing_rate=(1+financing_rate)**(1/periodicity)-1
+    risk_free=(1+risk_free_rate)**(1/periodicity)-1
+    replace_stats, new_stats = _overlay_stats(new_asset, replace_port, financing_rate, weight_asset, weight_replace_port, nav=False)
+
+    #Calculate Replacement Portfolio Sortino Ratio
+    replace_port_sortino = _stats_sortino(replace_stats, risk_free=risk_free, periodicity=periodicity)
+
+    #Calculate New Portfolio Sortino Ratio
+    new_port_sortino = _stats_sortino(new_stats, risk_free=risk_free, periodicity=periodicity)
+
+    #Final calculation
+    CWARP_add_sortino=((new_port_sortino/replace_port_sortino)-1)*100
+
+    return CWARP_add_sortino
+
+def cwarp_additive_ret_maxdd(new_asset,replace_port,risk_free_rate=0,financing_rate=0,weight_asset=0.25,weight_replace_port=1,periodicity=252):
+    """Cole Win Above Replacement Portolio (CWARP) Ret to Max DD +: Isolates new investment effect on total portfolio Return to MAXDD, which is a portion of the holistic CWARP score.
+    new_asset = returns of the asset you are thinking of adding to your portfolio
+    replace_port = returns of your pre-existing portfolio (e.g. S&P 500 Index, 60/40 Stock-Bond Portfolio)
+    risk_free_rate = Tbill rate (annualized)
+    financing_rate = portfolio margin/borrowing cost (annualized) to layer new asset on top of prevailing portfolio (e.g. LIBOR + 60bps). No financing rate is reasonable for derivate overlay products.
+    weight_asset = % weight you wish to overlay for the new asset on top of the previous portfolio, 25% overlay allocation is standard
+    weight_replace_port = % weight of the replacement portfolio, 100% pre-existing portfolio value is standard
+    periodicity = the frequency of the data you are sampling, typically 12 for monthly or 252 for trading day count"""
+    # convert annualized financing and risk free rates into appropriate values for provided periodicity
+    financing_rate=(1+financing_rate)**(1/periodicity)-1
+    risk_free=(1+risk_free_rate)**(1/periodicity)-1
+    replace_stats, new_stats = _overlay_stats(new_asset, replace_port, financing_rate, weight_asset, weight_replace_port)
+
+    #Calculate Replacement Portfolio Return to Max Drawdown
+    replace_port_return_maxdd = _stats_return_maxdd(replace_stats, risk_free=risk_free, periodicity=periodicity)
+
+    #Calculate New Portfolio Return to Max Drawdown
+    new_port_return_maxdd = _stats_return_maxdd(new_stats, risk_free=risk_free, periodicity=periodicity)
+
+    #Final calculation
+    CWARP_add_ret_maxdd=((new_port_return_maxdd/replace_port_return_maxdd)-1)*100
+
+    return CWARP_add_ret_maxdd
+
+def cwarp_port_return(new_asset,replace_port,risk_free_rate=0,financing_rate=0,weight_asset=0.25,weight_replace_port=1,periodicity=252):
+    """Cole Win Above Replacement Portolio (CWARP) Portfolio Return: Returns of the aggregate portfolio after a new asset is financed and layered on top of the replacement portfolio.
+    new_asset = returns of the asset you are thinking of adding to your portfolio
+    replace_port = returns of your pre-existing portfolio (e.g. S&P 500 Index, 60/40 Stock-Bond Portfolio)
+    risk_free_rate = Tbill rate (annualized)
+    financing_rate = portfolio margin/borrowing cost (annualized) to layer new asset on top of prevailing portfolio (e.g. LIBOR + 60bps). No financing rate is reasonable for derivate overlay products.
+    weight_asset = % weight you wish to overlay for the new asset on top of the previous portfolio, 25% overlay allocation is standard
+    weight_replace_port = % weight of the replacement portfolio, 100% pre-existing portfolio value is standard
+    periodicity = the frequency of the data you are sampling, typically 12 for monthly or 252 for trading day count"""
+    # convert annual financing based on periodicity
+    financing_rate=((financing_rate+1)**(1/periodicity)-1)
+
+    # stats of the new portfolio
+    new_stats = _overlay_stats(new_asset, replace_port, financing_rate, weight_asset, weight_replace_port, replace=False)
+
+    # calculate annualized return of new portfolio and subtract risk-free rate
+    out = _stats_annualized_return(new_stats, periodicity=periodicity) - risk_free_rate
+    return out
+
+def cwarp_port_risk(new_asset,replace_port,risk_free_rate=0,financing_rate=0,weight_asset=0.25,weight_replace_port=1,periodicity=252):
+    """Cole Win Above Replacement Portolio (CWARP) Portfolio Risk: Volatility of the aggregate portfolio after a new asset is financed and layered on top of the replacement portfolio.
+    new_asset = returns of the asset you are thinking of adding to your portfolio
+    replace_port = returns of your pre-existing portfolio (e.g. S&P 500 Index, 60/40 Stock-Bond Portfolio)
+    risk_free_rate = Tbill rate (annualized)
+    financing_rate = portfolio margin/borrowing cost (annualized) to layer new asset on top of prevailing portfolio (e.g. LIBOR + 60bps). No financing rate is reasonable for derivate overlay products.
+    weight_asset = % weight you wish to overlay for the new asset on top of the previous portfolio, 25% overlay allocation is standard
+    weight_replace_port = % weight of the replacement portfolio, 100% pre-existing portfolio value is standard
+    periodicity = the frequency of the data you are sampling, typically 12 for monthly or 252 for trading day count"""
+    # convert annual financing and risk free rates based on periodicity
+    financing_rate=((financing_rate+1)**(1/periodicity)-1)
+    risk_free_rate=((risk_free_rate+1)**(1/periodicity)-1)
+    # stats of the new portfolio
+    new_stats = _overlay_stats(new_asset, replace_port, financing_rate, weight_asset, weight_replace_port, replace=False, nav=False)
+    # calculated target downside deviation (TDD)
+    tdd = _stats_tdd(new_stats)*np.sqrt(periodicity)
+    return tdd
+
+def cwarp_new_port_data(new_asset,replace_port,risk_free_rate=0,financing_rate=0,weight_asset=0.25,weight_replace_port=1,periodicity=252):
+    """Cole Win Above Replacement Portolio (CWARP) return stream: Return series after a new asset is financed and layered on top of the replacement portfolio.
+    new_asset = returns of the asset you are thinking of adding to your portfolio
+    replace_port = returns of your pre-existing portfolio (e.g. S&P 500 Index, 60/40 Stock-Bond Portfolio)
+    risk_free_rate = Tbill rate
+    financing_rate = portfolio margin/borrowing cost to layer new asset on top of prevailing portfolio (e.g. LIBOR + 60bps). No financing rate is reasonable for derivate overlay products.
+    weight_asset = % weight you wish to overlay for the new asset on top of the previous portfolio, 25% overlay allocation is standard
+    weight_replace_port = % weight of the replacement portfolio, 100% pre-existing portfolio value is standard
+    periodicity = the frequency of the data you are sampling, typically 12 for monthly or 252 for trading day count"""
+    # convert annual financing based on periodicity
+    financing_rate=((financing_rate+1)**(1/periodicity)-1)
+    new_port=(new_asset-financing_rate)*weight_asset+replace_port*weight_replace_port
+    return new_port
+
+#Batch CWARP Functions######################################################################
+def _periodic_rate(rate, periodicity=252):
+    """convert an annualized rate into the equivalent rate for one period at the provided periodicity"""
+    return (1+rate)**(1/periodicity)-1
+
+def _block_width(n_obs, n_cols, max_bytes=None, arrays=2):
+    """candidate columns per block so that `arrays` float64 work arrays of n_obs rows (plus a missing value mask) fit in max_bytes,
+    all columns at once when max_bytes is None and at least one column whatever the budget"""
+    if max_bytes is None: return max(n_cols, 1)
+    return int(min(max(n_cols, 1), max(1, max_bytes//(max(n_obs, 1)*(8*arrays+1)))))
+
+def _stats_metrics(stats, risk_free=0, periodicity=252):
+    """batch_metrics dict from a ReturnStats record, risk_free is per period"""
+    AnnualReturn = stats.end_nav**(periodicity/stats.n) - 1
+    return {'Return': AnnualReturn,
+            'Vol': _stats_tdd(stats)*np.sqrt(periodicity),
+            'Sharpe': _stats_sharpe(stats, risk_free=risk_free, periodicity=periodicity),
+            'Sortino': _stats_sortino(stats, risk_free=risk_free, periodicity=periodicity),
+            'Max_DD': stats.max_dd,
+            'Ret_To_MaxDD': (AnnualReturn-risk_free)/stats.max_dd}
+
+_METRIC_KEYS = ('Return', 'Vol', 'Sharpe', 'Sortino', 'Max_DD', 'Ret_To_MaxDD')
+
+def batch_metrics(df, risk_free=0, periodicity=252, max_bytes=None, own_history=False):
+    """df - 2-D return array (time x assets), e.g. daily returns of many assets aligned on one calendar. A 1-D series is treated as a single column.
+        float32 arrays are read as they are and accumulated in float64, halving the memory held by large candidate matrices.
+   risk_free - annualized risk free rate (default is assumed to be 0)
+   periodicity - number of periods at desired frequency in one year
+                e.g. 252 business days in 1 year (default),
+                12 months in 1 year,
+                52 weeks in 1 year etc.
+   max_bytes - memory budget for scratch space, columns are then evaluated in blocks that fit it (default evaluates all columns at once)
+   own_history - count each column's periods from its first to its last return only, so the missing rows padding a column onto a
+                 longer calendar (e.g. a late listing in a panel) neither dilute its downside deviation nor stretch its annualization.
+                 Each value then matches the single series functions applied to that column with its leading and trailing NaNs dropped.
+   Returns a dict of 1-D arrays with one value per column: 'Return', 'Vol' (target downside deviation, annualized), 'Sharpe', 'Sortino', 'Max_DD' and 'Ret_To_MaxDD'.
+   Each value matches the single series functions above (annualized_return, target_downside_deviation, sharpe_ratio, sortino_ratio, max_dd, return_maxdd_ratio) applied to that column."""
+    # convert return data to numpy array (in case Pandas series/dataframe is provided), extra axes are flattened into columns
+    df = _as_float(df)
+    if df.ndim == 1: df = df[:, None]
+    shape = df.shape[1:]
+    df = df.reshape(df.shape[0], -1)
+    n_obs, n_cols = df.shape
+    risk_free = _periodic_rate(risk_free, periodicity)
+    # one stats pass per block of columns, missing returns count as zero downside and leave NAV unchanged
+    width = _block_width(n_obs, n_cols, max_bytes)
+    workspace = np.empty((2, n_obs, width))
+    out = {key: np.empty(n_cols) for key in _METRIC_KEYS}
+    for first in range(0, n_cols, width):
+        last = min(first+width, n_cols)
+        stats = return_stats(df[:, first:last], workspace=workspace[:, :, :last-first], win_loss=False)
+        if own_history:
+            present = ~np.isnan(df[:, first:last])
+            span = n_obs-np.argmax(present[::-1], axis=0)-np.argmax(present, axis=0)
+            stats = stats._replace(n=np.where(present.any(axis=0), span, np.nan))
+        for key, value in _stats_metrics(stats, risk_free=risk_free, periodicity=periodicity).items():
+            out[key][first:last] = value
+    return {key: value.reshape(shape) for key, value in out.items()}
+
+def cwarp_batch(new_assets,replace_port,risk_free_rate=0,financing_rate=0,weight_asset=0.25,weight_replace_port=1,periodicity=252,max_bytes=None,replace_stats=None):
+    """Cole Win Above Replacement Portolio (CWARP) for a whole matrix of candidate assets in one vectorized pass.
+    new_assets = 2-D returns (time x assets) of the assets you are thinking of adding to your portfolio, aligned with replace_port (float32 is accumulated in float64)
+    replace_port = returns of your pre-existing portfolio (e.g. S&P 500 Index, 60/40 Stock-Bond Portfolio)
+    risk_free_rate = Tbill rate (annualized)
+    financing_rate = portfolio margin/borrowing cost (annualized) to layer new asset on top of prevailing portfolio (e.g. LIBOR + 60bps). No financing rate is reasonable for derivate overlay products.
+    weight_asset = % weight you wish to overlay for the new asset on top of the previous portfolio, 25% overlay allocation is standard
+    weight_replace_port = % weight of the replacement portfolio, 100% pre-existing portfolio value is standard
+    periodicity = the frequency of the data you are sampling, typically 12 for monthly or 252 for trading day count
+    max_bytes = memory budget for the new portfolios and scratch space, candidates are then scored in blocks of columns that fit it
+                and only their summary statistics are kept (default scores every candidate at once)
+    replace_stats = batch_metrics of the portfolio CWARP is measured against, when it is already known (e.g. the same portfolio is scored
+                    against many batches) or differs from replace_port (e.g. replace_port already holds other overlays)
+    Returns a dict of 1-D arrays with one value per candidate column: 'CWARP', '+Sortino', '+Ret_To_MaxDD' and the new portfolio's
+    'Return' (less risk_free_rate, as cwarp_port_return), 'Vol' (as cwarp_port_risk), 'Sharpe', 'Sortino', 'Max_DD' and 'Ret_To_MaxDD'."""
+    new_assets = _as_float(new_assets)
+    if new_assets.ndim == 1: new_assets = new_assets[:, None]
+    replace_port = np.asarray(replace_port, dtype=float)
+    n_obs, n_cols = new_assets.shape
+    # convert annualized financing and risk free rates into appropriate values for provided periodicity
+    financing_rate = _periodic_rate(financing_rate, periodicity)
+    risk_free = _periodic_rate(risk_free_rate, periodicity)
+
+    #Replacement portfolio statistics are computed once for all candidates
+    if replace_stats is None: replace_stats = batch_metrics(replace_port, risk_free=risk_free_rate, periodicity=periodicity)
+    replace_part = (replace_port*weight_replace_port)[:, None]
+    weight_asset = np.broadcast_to(np.asarray(weight_asset, dtype=float), (n_cols,))
+
+    #New portfolio for each block of candidate columns, built in place in the third slot of the workspace
+    width = _block_width(n_obs, n_cols, max_bytes, arrays=3)
+    workspace = np.empty((3, n_obs, width))
+    out = {key: np.empty(n_cols) for key in _METRIC_KEYS}
+    for first in range(0, n_cols, width):
+        last = min(first+width, n_cols)
+        new_port = workspace[2, :, :last-first]
+        np.subtract(new_assets[:, first:last], financing_rate, out=new_port, dtype=np.float64)
+        np.multiply(new_port, weight_asset[first:last], out=new_port)
+        np.add(new_port, replace_part, out=new_port)
+        stats = return_stats(new_port, workspace=workspace[:2, :, :last-first], win_loss=False)
+        for key, value in _stats_metrics(stats, risk_free=risk_free, periodicity=periodicity).items():
+            out[key][first:last] = value
+    del workspace
+
+    #Final CWARP calculations
+    sortino_ratio_change = out['Sortino']/replace_stats['Sortino'][0]
+    ret_maxdd_ratio_change = out['Ret_To_MaxDD']/replace_stats['Ret_To_MaxDD'][0]
+    out['CWARP'] = ((sortino_ratio_change*ret_maxdd_ratio_change)**(1/2)-1)*100
+    out['+Sortino'] = (sortino_ratio_change-1)*100
+    out['+Ret_To_MaxDD'] = (ret_maxdd_ratio_change-1)*100
+    out['Return'] = out['Return'] - risk_free_rate
+    return out
+
+def _nonzero(mask):
+    """(rows, cols) of the True entries of a 2-D mask, scanned in its memory order"""
+    if mask.flags.f_contiguous:
+        cols, rows = np.divmod(np.flatnonzero(mask.T), mask.shape[0])
+    else:
+        rows, cols = np.divmod(np.flatnonzero(mask), mask.shape[1])
+    return rows, cols
+
+def _block_sums(x, n_blocks, step):
+    """sums of x (time x assets) over consecutive blocks of step rows, the last partial block is dropped"""
+    if x.flags.f_contiguous:
+        # each column's blocks are contiguous, summed as one reduction over the innermost axis
+        return np.einsum('ijk->ij', x.T[:, :n_blocks*step].reshape(x.shape[1], n_blocks, step), dtype=np.float64).T
+    return x[:n_blocks*step].reshape(n_blocks, step, -1).sum(axis=1, dtype=np.float64)
+
+def cwarp_approx(new_assets,replace_port,risk_free_rate=0,financing_rate=0,weight_asset=0.25,weight_replace_port=1,periodicity=252,step=5,max_bytes=None,replace_stats=None):
+    """Cheap approximation of cwarp_batch's 'CWARP', 'Sortino' and 'Ret_To_MaxDD', for pruning a large universe before exact scoring.
+    Candidates are read a few times in matrix products and no running NAV is built at full resolution:
+    the new portfolio's mean and second moment follow exactly from the candidate's sums and its cross product with replace_port,
+    its downside sum of squares from the downside co-moments (co-semivariance approximation, exact when the legs fall together),
+    its compounded return from the first two moments of its log returns, and its max drawdown from the NAV of its summed returns
+    over blocks of `step` periods (drawdowns within a block are missed, so the estimate errs low).
+    weight_asset may also be a column of weights (shape (W, 1)): the candidates' sums are then shared by every weight and each
+    returned array has shape (W, candidates), one row per weight.
+    Remaining parameters as in cwarp_batch. Returns a dict of 1-D arrays with one value per candidate column: 'CWARP', 'Sortino' and 'Ret_To_MaxDD'."""
+    new_assets = _as_float(new_assets)
+    if new_assets.ndim == 1: new_assets = new_assets[:, None]
+    replace_port = np.asarray(replace_port, dtype=float)
+    n_obs, n_cols = new_assets.shape
+    # convert annualized financing and risk free rates into appropriate values for provided periodicity
+    financing_rate = _periodic_rate(financing_rate, periodicity)
+    risk_free = _periodic_rate(risk_free_rate, periodicity)
+    weight_asset = np.asarray(weight_asset, dtype=float)
+    grid = weight_asset.ndim == 2
+    weight_asset = np.broadcast_to(weight_asset, (weight_asset.shape[0] if grid else 1, n_cols))
+
+    #Replacement portfolio statistics and the sums of its weighted leg
+    if replace_stats is None: replace_stats = batch_metrics(replace_port, risk_free=risk_free_rate, periodicity=periodicity)
+    replace_missing = np.isnan(replace_port)
+    leg = np.nan_to_num(replace_port*weight_replace_port)
+    leg_down = np.minimum(leg, 0)
+    leg_terms = np.column_stack([np.ones(n_obs), leg])
+    n_blocks = n_obs//step
+    cut = n_blocks*step
+    leg_blocks = leg[:cut].reshape(n_blocks, step).sum(axis=1)
+
+    width = _block_width(n_obs, n_cols, max_bytes)
+    # scratch arrays in the memory order of the candidates, e.g. column-major ReturnStore matrices
+    order = 'F' if new_assets.flags.f_contiguous else 'C'
+    masked, down = np.empty((n_obs, width), order=order), np.empty((n_obs, width), order=order)
+    out = {key: np.empty(weight_asset.shape) for key in ('CWARP', 'Sortino', 'Ret_To_MaxDD')}
+    for first in range(0, n_cols, width):
+        last = min(first+width, n_cols)
+        block = new_assets[:, first:last]
+        w = weight_asset[:, first:last]
+        # rows where the candidate or the replacement portfolio is missing count as a zero return of the new portfolio,
+        # they are usually few, so the leg's sums are corrected for them position by position
+        missing = np.isnan(block)
+        if replace_missing.any(): missing |= replace_missing[:, None]
+        any_missing = missing.any()
+        if any_missing:
+            rows, cols = _nonzero(missing)
+            x = masked[:, :last-first]
+            np.copyto(x, block)
+            np.copyto(x, 0, where=missing)
+        else:
+            rows = cols = np.empty(0, dtype=np.int64)
+            x = block
+        def missing_sum(values): return np.bincount(cols, weights=values[rows], minlength=last-first)
+        count = n_obs-np.bincount(cols, minlength=last-first)
+        sum_leg = leg.sum()-missing_sum(leg)
+        sum_leg_sq = (leg**2).sum()-missing_sum(leg**2)
+        sum_leg_down_sq = (leg_down**2).sum()-missing_sum(leg_down**2)
+
+        #New portfolio sums: leg + w*(x-financing_rate) on the candidate's rows
+        sum_x, sum_x_leg = (x.T @ leg_terms).T
+        sum_x_sq = np.einsum('ij,ij->j', x, x, dtype=np.float64)
+        total = sum_leg+w*(sum_x-financing_rate*count)
+        sum_squares = sum_leg_sq+2*w*(sum_x_leg-financing_rate*sum_leg)+w**2*(sum_x_sq-2*financing_rate*sum_x+financing_rate**2*count)
+        x_down = down[:, :last-first]
+        np.subtract(x, financing_rate, out=x_down, dtype=np.float64)
+        np.minimum(x_down, 0, out=x_down)
+        if any_missing: np.copyto(x_down, 0, where=missing)
+        downside_ss = sum_leg_down_sq+2*w*(x_down.T @ leg_down)+w**2*np.einsum('ij,ij->j', x_down, x_down)
+
+        #Coarse NAV from block sums, less the leg and financing on the rows each candidate is missing
+        x_blocks = _block_sums(x, n_blocks, step)
+        inside = rows < cut
+        cells = (rows[inside]//step)*(last-first)+cols[inside]
+        missing_count = np.bincount(cells, minlength=n_blocks*(last-first)).reshape(n_blocks, -1)
+        missing_leg = np.bincount(cells, weights=leg[rows[inside]], minlength=n_blocks*(last-first)).reshape(n_blocks, -1)
+        # (weights x blocks x candidates)
+        nav = leg_blocks[:, None]-missing_leg+w[:, None, :]*(x_blocks-financing_rate*(step-missing_count))+1
+        np.cumprod(nav, axis=1, out=nav)
+        np.divide(nav, np.maximum.accumulate(nav, axis=1), out=nav)
+        max_dd = np.abs(nav.min(axis=1)-1)
+
+        out['Sortino'][:, first:last] = (_safe_divide(total, count)-risk_free)/np.sqrt(downside_ss/n_obs)*np.sqrt(periodicity)
+        # log NAV ~ sum of returns less half their sum of squares
+        annual_return = np.exp((total-sum_squares/2)*periodicity/n_obs)-1
+        out['Ret_To_MaxDD'][:, first:last] = (annual_return-risk_free)/max_dd
+
+    #Final CWARP calculations
+    out['CWARP'] = ((out['Sortino']/replace_stats['Sortino'][0]*out['Ret_To_MaxDD']/replace_stats['Ret_To_MaxDD'][0])**(1/2)-1)*100
+    return out if grid else {key: value[0] for key, value in out.items()}
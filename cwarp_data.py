@@ -0,0 +1,444 @@
+import os
+import time
+import zlib
+import heapq
+import zipfile
+import tempfile
+import threading
+from contextlib import contextmanager
+from collections import namedtuple
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+import numpy as np
+import pandas as pd
+try:
+    import fcntl
+except ImportError:   # Windows
+    fcntl = None
+    import msvcrt
+
+#Price Providers############################################################################
+# A provider returns daily close prices for one ticker over [start_date, end_date) as a pandas Series indexed by (tz-naive) date.
+
+class YahooProvider:
+    """Daily closes from Yahoo Finance via yfinance."""
+    def fetch(self, ticker, start_date, end_date):
+        import yfinance as yf
+        close = yf.Ticker(ticker).history(start=start_date, end=end_date).Close
+        if close.index.tz is not None: close.index = close.index.tz_localize(None)
+        close.index = close.index.normalize()
+        close.name = ticker
+        return close
+
+class SyntheticProvider:
+    """Deterministic random-walk closes on a business day calendar, for tests and offline runs.
+    The same ticker always produces the same prices, and every call is recorded in self.calls."""
+    def __init__(self, seed=0, first_date='1990-01-01', last_date='2030-12-31'):
+        self.seed = seed
+        self.calendar = pd.bdate_range(first_date, last_date)
+        self.calls = []
+
+    def fetch(self, ticker, start_date, end_date):
+        self.calls.append((ticker, pd.Timestamp(start_date), pd.Timestamp(end_date)))
+        rng = np.random.default_rng([self.seed, zlib.crc32(ticker.encode())])
+        close = pd.Series(100*np.cumprod(1+rng.normal(0.0003, 0.01, len(self.calendar))), index=self.calendar, name=ticker)
+        return close[(close.index>=pd.Timestamp(start_date))&(close.index<pd.Timestamp(end_date))]
+
+class CsvDirectoryProvider:
+    """Daily closes from a directory of CSV files named <ticker>.csv (case-insensitive) with a date column and a close column."""
+    def __init__(self, directory, date_column='Date', close_column='Close'):
+        self.directory = directory
+        self.date_column = date_column
+        self.close_column = close_column
+
+    def fetch(self, ticker, start_date, end_date):
+        names = {name.lower(): name for name in os.listdir(self.directory)}
+        path = os.path.join(self.directory, names.get(ticker.lower()+'.csv', ticker+'.csv'))
+        frame = pd.read_csv(path, usecols=[self.date_column, self.close_column], parse_dates=[self.date_column], index_col=self.date_column)
+        close = frame[self.close_column].sort_index()
+        close.name = ticker
+        return close[(close.index>=pd.Timestamp(start_date))&(close.index<pd.Timestamp(end_date))]
+
+class MemoryProvider:
+    """Daily closes served from an in-memory dict of ticker -> price Series, e.g. as a stub in tests."""
+    def __init__(self, prices):
+        self.prices = prices
+
+    def fetch(self, ticker, start_date, end_date):
+        close = self.prices[ticker]
+        close = close[(close.index>=pd.Timestamp(start_date))&(close.index<pd.Timestamp(end_date))]
+        close.name = ticker
+        return close
+
+#Local Return Cache#########################################################################
+class _FileLock:
+    """exclusive lock held on a file, shared by every process using the same path (flock on POSIX, msvcrt on Windows).
+    blocking=False raises BlockingIOError rather than waiting when another holder has it."""
+    def __init__(self, path, blocking=True):
+        self.path = path
+        self.blocking = blocking
+
+    def __enter__(self):
+        while True:
+            self.file = open(self.path, 'a+b')
+            try:
+                if fcntl is not None:
+                    fcntl.flock(self.file.fileno(), fcntl.LOCK_EX if self.blocking else fcntl.LOCK_EX|fcntl.LOCK_NB)
+                else:
+                    self.file.seek(0)
+                    msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK if self.blocking else msvcrt.LK_NBLCK, 1)
+            except OSError as error:
+                self.file.close()
+                raise BlockingIOError(f'{self.path} is locked') from error
+            # the lock file may have been deleted (cache eviction) while waiting for it, the lock must be on the file now at path
+            try:
+                if os.path.samestat(os.fstat(self.file.fileno()), os.stat(self.path)): return self
+            except FileNotFoundError:
+                pass
+            self._release()
+
+    def _release(self):
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        self.file.close()
+
+    def __exit__(self, *exc):
+        self._release()
+
+def _remove(*paths):
+    """delete files that may already be gone (or, on Windows, still be open elsewhere)"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+class PriceCache:
+    """On-disk cache of daily returns in front of a price provider, one NumPy .npz file per ticker.
+    provider - object with fetch(ticker, start_date, end_date) returning daily closes (e.g. YahooProvider, SyntheticProvider)
+    cache_dir - directory holding the cache files
+    ttl - seconds after which the most recent days of a ticker are fetched again (vendors revise recent bars)
+    max_bytes - total size cap of the cache directory, least recently used tickers are evicted beyond it
+    offline - serve entirely from the cache and never call the provider
+    Returns are cached rather than prices: adjusted closes are rescaled after every dividend, but returns computed within each
+    fetched range are unaffected, so only the missing date ranges ever need to be fetched and stitched.
+    Several processes may share one cache_dir (e.g. pool workers): reading and storing an entry holds a lock file next to it, and
+    entries are written to unique temporary files that are renamed into place. No lock is held while the provider is called, so a
+    stuck fetch that load_returns abandons does not block its retries."""
+    refresh_days = 7     # trailing days re-fetched once the ttl expires
+    overlap_days = 10    # extra days fetched before a range so its first return has a previous close
+
+    def __init__(self, provider, cache_dir='.cwarp_cache', ttl=24*3600, max_bytes=512*2**20, offline=False):
+        self.provider = provider
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self._lock = threading.RLock()
+        self._ticker_locks = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _ticker_lock(self, ticker):
+        """one lock per ticker, so concurrent loads of different tickers do not wait on each other"""
+        with self._lock:
+            return self._ticker_locks.setdefault(ticker.lower(), threading.Lock())
+
+    def _path(self, ticker):
+        return os.path.join(self.cache_dir, ticker.lower()+'.npz')
+
+    def _lock_path(self, ticker):
+        return os.path.join(self.cache_dir, ticker.lower()+'.lock')
+
+    @contextmanager
+    def _locked(self, ticker):
+        """the ticker's lock in this process and its lock file across processes"""
+        with self._ticker_lock(ticker), _FileLock(self._lock_path(ticker)):
+            yield
+
+    def _load(self, ticker):
+        path = self._path(ticker)
+        try:
+            # the file is opened here so it is closed even when np.load fails on a corrupt entry
+            with open(path, 'rb') as f, np.load(f) as data:
+                entry = {'returns': pd.Series(data['returns'], index=pd.DatetimeIndex(data['dates']), name=ticker),
+                         'start': pd.Timestamp(int(data['covered'][0])), 'end': pd.Timestamp(int(data['covered'][1])),
+                         'fetched_at': float(data['fetched_at'])}
+            # touching the file marks it as recently used for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            # not cached yet, or evicted by another thread or process
+            return None
+        except (zipfile.BadZipFile, EOFError, ValueError, KeyError, OSError):
+            # a truncated or corrupt entry counts as a miss and is fetched again
+            _remove(path)
+            return None
+        return entry
+
+    def _save(self, ticker, entry):
+        path = self._path(ticker)
+        # a temporary file of its own, so concurrent writers never share a half written file
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, prefix=ticker.lower()+'.', suffix='.tmp', delete=False) as f:
+            try:
+                np.savez(f, dates=entry['returns'].index.values.astype('datetime64[ns]'), returns=entry['returns'].values.astype(float),
+                         covered=np.array([entry['start'].value, entry['end'].value]), fetched_at=entry['fetched_at'])
+            except BaseException:
+                f.close()
+                os.remove(f.name)
+                raise
+        os.replace(f.name, path)
+        with self._lock:
+            self._evict(keep=path)
+
+    def _evict(self, keep=None):
+        """delete least recently used entries and their lock files until the cache fits in max_bytes.
+        Entries locked by another thread or process are in use and skipped."""
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.npz'): continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                # evicted by another process meanwhile
+                continue
+            files.append((stat.st_mtime, stat.st_size, os.path.join(self.cache_dir, name)))
+        total = sum(size for mtime, size, path in files)
+        for mtime, size, path in sorted(files):
+            if total <= self.max_bytes: break
+            if path == keep: continue
+            lock_path = path[:-len('.npz')]+'.lock'
+            try:
+                with _FileLock(lock_path, blocking=False):
+                    if not os.path.exists(path): continue
+                    _remove(path, lock_path)
+            except BlockingIOError:
+                continue
+            total -= size
+
+    def _fetch_returns(self, ticker, start, end):
+        """returns over [start, end) computed from one provider call, padded at the front so the first return is complete"""
+        close = self.provider.fetch(ticker, start-pd.Timedelta(days=self.overlap_days), end)
+        returns = close.pct_change()
+        return returns[returns.index>=start]
+
+    def get(self, ticker, start_date, end_date):
+        """daily returns of ticker over [start_date, end_date), fetching only the date ranges missing from the cache"""
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        with self._locked(ticker):
+            entry = self._load(ticker)
+        if self.offline:
+            if entry is None: raise KeyError(f'{ticker} is not in the price cache (offline mode)')
+        else:
+            missing = []
+            refreshed = False
+            if entry is None:
+                missing.append((start, end))
+                entry = {'returns': pd.Series(index=pd.DatetimeIndex([]), dtype=float, name=ticker), 'start': start, 'end': end, 'fetched_at': 0.0}
+                refreshed = True
+            else:
+                if start < entry['start']: missing.append((start, entry['start']))
+                # past the ttl the trailing days are fetched again along with anything beyond the cached range
+                stale = time.time()-entry['fetched_at'] > self.ttl
+                tail = entry['end']-pd.Timedelta(days=self.refresh_days) if stale else entry['end']
+                if end > tail:
+                    missing.append((max(tail, entry['start']), max(end, entry['end'])))
+                    refreshed = True
+            if missing:
+                # the provider is called without any lock held
+                fetched = [self._fetch_returns(ticker, a, b) for a, b in missing]
+                entry['start'], entry['end'] = min(entry['start'], start), max(entry['end'], end)
+                with self._locked(ticker):
+                    # another thread or process may have stored the ticker meanwhile, its range is kept if it joins this one
+                    stored = self._load(ticker)
+                    parts = fetched+[entry['returns']]
+                    if stored is not None and stored['start'] <= entry['end'] and stored['end'] >= entry['start']:
+                        parts.insert(len(fetched), stored['returns'])
+                        entry['start'], entry['end'] = min(entry['start'], stored['start']), max(entry['end'], stored['end'])
+                        entry['fetched_at'] = max(entry['fetched_at'], stored['fetched_at'])
+                    # freshly fetched values take precedence over cached ones on overlapping dates
+                    returns = pd.concat(parts)
+                    entry['returns'] = returns[~returns.index.duplicated(keep='first')].sort_index()
+                    if refreshed: entry['fetched_at'] = time.time()
+                    self._save(ticker, entry)
+        returns = entry['returns']
+        return returns[(returns.index>=start)&(returns.index<end)]
+
+    def clear(self):
+        """delete every cached entry and its lock file"""
+        tickers = {name.rsplit('.', 1)[0] for name in os.listdir(self.cache_dir) if name.endswith(('.npz', '.lock'))}
+        for ticker in sorted(tickers):
+            with self._locked(ticker):
+                _remove(self._path(ticker), self._lock_path(ticker))
+
+#Concurrent Loader##########################################################################
+LoadResult = namedtuple('LoadResult', ['returns', 'failures'])
+
+def _source_returns(source, ticker, start_date, end_date):
+    """daily returns from a PriceCache (get) or directly from a provider (fetch)"""
+    if hasattr(source, 'get'): return source.get(ticker, start_date, end_date)
+    returns = source.fetch(ticker, start_date, end_date).pct_change()
+    returns.name = ticker
+    return returns
+
+def _attempt(future, source, ticker, start_date, end_date, attempt=0, profiler=None):
+    """thread body of one fetch attempt, its returns or its error are set on future"""
+    try:
+        if profiler is None:
+            returns = _source_returns(source, ticker, start_date, end_date)
+        else:
+            with profiler.stage('fetch', ticker=ticker, attempt=attempt):
+                returns = _source_returns(source, ticker, start_date, end_date)
+    except Exception as error:
+        future.set_exception(error)
+    else:
+        future.set_result(returns)
+
+def load_returns(tickers, start_date, end_date, source, max_workers=8, timeout=30, retries=2, backoff=0.5, profiler=None):
+    """Fetches daily returns of many tickers concurrently, each attempt on its own worker thread.
+    tickers - list of ticker symbols (duplicates are fetched once)
+    source - PriceCache, or any provider with fetch(ticker, start_date, end_date) returning closes
+    max_workers - number of fetches in flight at once, attempts abandoned after a timeout no longer count
+    timeout - seconds allowed for one attempt, from the moment it starts running, before it is abandoned and retried
+    retries - extra attempts per ticker after a failure or timeout, waiting backoff*2**attempt seconds before each
+    profiler - optional cwarp_profile.Profiler, every attempt is timed as stage 'fetch' tagged with its ticker
+    Returns LoadResult(returns, failures): returns maps ticker -> return Series in the order requested,
+    failures maps ticker -> message of the last error for tickers that could not be loaded."""
+    tickers = list(dict.fromkeys(tickers))
+    results = {}
+    failures = {}
+    # attempts waiting for a worker as (earliest start, sequence, ticker, attempt), first attempts start in the order requested
+    queue = [(0.0, k, ticker, 0) for k, ticker in enumerate(tickers)]
+    sequence = len(queue)
+    running = {}   # future -> (ticker, attempt, started)
+    while queue or running:
+        # start every attempt that is due while a worker is free, its timeout counts from here rather than from when it was queued
+        now = time.monotonic()
+        while queue and len(running) < max_workers and queue[0][0] <= now:
+            _, _, ticker, attempt = heapq.heappop(queue)
+            future = Future()
+            # daemon thread: a stuck provider call cannot be interrupted, but it neither holds a worker nor blocks interpreter exit
+            threading.Thread(target=_attempt, args=(future, source, ticker, start_date, end_date, attempt, profiler), daemon=True).start()
+            running[future] = (ticker, attempt, now)
+        # wake up when something finishes, when the oldest attempt runs out of time or when a waiting retry is due
+        wake = min([started+timeout for ticker, attempt, started in running.values()]+
+                   ([queue[0][0]] if queue and len(running) < max_workers else []))
+        if running:
+            wait(list(running), timeout=max(wake-now, 0), return_when=FIRST_COMPLETED)
+        else:
+            time.sleep(max(wake-now, 0))
+        now = time.monotonic()
+        for future in list(running):
+            ticker, attempt, started = running[future]
+            if future.done():
+                error = future.exception()
+                if error is None:
+                    results[ticker] = future.result()
+                    failures.pop(ticker, None)
+                    del running[future]
+                    continue
+                failures[ticker] = f'{type(error).__name__}: {error}'
+            elif now-started >= timeout:
+                # the worker thread cannot be interrupted, its result is simply ignored and a new worker takes its place
+                failures[ticker] = f'timed out after {timeout}s'
+            else:
+                continue
+            del running[future]
+            if attempt < retries:
+                heapq.heappush(queue, (now+backoff*2**attempt, sequence, ticker, attempt+1))
+                sequence += 1
+    return LoadResult({ticker: results[ticker] for ticker in tickers if ticker in results}, failures)
+
+#Portfolio Specs############################################################################
+def parse_portfolio(port_string):
+    """parse a "fraction_1, symbol_1, fraction_2, symbol_2..." portfolio string into (tickers, weights)"""
+    port_list = port_string.replace(' ','').split(',')
+    tickers = []
+    weights = []
+    for i in range(len(port_list)//2):
+        weights.append(float(port_list[2*i]))
+        tickers.append(port_list[2*i+1])
+    return tickers, weights
+
+def replacement_portfolio(returns, tickers, weights, name=None):
+    """weighted replacement portfolio return series from a dict of ticker -> return Series, weights are normalized to sum to 1"""
+    replace_port = returns[tickers[0]]*(weights[0]/sum(weights))
+    for k in range(1, len(tickers)):
+        replace_port = replace_port + returns[tickers[k]]*(weights[k]/sum(weights))
+    replace_port.name = name
+    return replace_port
+
+#Panel Builder##############################################################################
+Panel = namedtuple('Panel', ['dates', 'replace_port', 'candidates', 'missing', 'overlap'])
+PANEL_JOINS = ('inner', 'outer', 'asset_start')
+
+def build_panel(returns, legs, weights, candidates=None, join='inner', fill=0.0, name=None):
+    """Aligns the replacement portfolio legs and the candidate assets onto one calendar in a single pass.
+    returns - dict of ticker -> return Series (e.g. LoadResult.returns)
+    legs, weights - replacement portfolio holdings and weights, weights are normalized to sum to 1
+    candidates - candidate tickers, defaults to every ticker in returns that is not a leg
+    join - 'inner': only dates on which every series has a return, so the shortest history constrains everything
+           'outer': every date of any series, missing returns are filled with fill
+           'asset_start': every date from the first date on which all legs have a return, each candidate stays missing (NaN)
+                          before its first and after its last return, gaps inside its history are filled with fill
+    fill - value for filled returns (0 leaves NAV unchanged), None keeps them missing
+    name - name of the replacement portfolio series
+    Returns Panel(dates, replace_port, candidates, missing, overlap): the calendar, the replacement portfolio Series, the candidate
+    DataFrame, a DataFrame flagging every return that was missing before filling, and a per-candidate overlap report with the
+    first/last return and number of returns of the candidate's own history (before the join), the window and number of dates shared
+    with the replacement portfolio on the joined calendar and the filled count."""
+    if join not in PANEL_JOINS: raise ValueError(f"join must be one of {', '.join(PANEL_JOINS)}, not {join}")
+    if candidates is None: candidates = [ticker for ticker in returns if ticker not in legs]
+    tickers = list(dict.fromkeys(list(legs)+list(candidates)))
+    column = {ticker: k for k, ticker in enumerate(tickers)}
+
+    # union calendar of every series, then one scatter of each series into a (dates x tickers) matrix
+    index = [np.asarray(returns[ticker].index, dtype='datetime64[ns]') for ticker in tickers]
+    calendar = np.unique(np.concatenate(index))
+    values = np.full((len(calendar), len(tickers)), np.nan, order='F')
+    for k, ticker in enumerate(tickers):
+        values[np.searchsorted(calendar, index[k]), k] = np.asarray(returns[ticker], dtype=float)
+    present = ~np.isnan(values)
+    # each candidate's own history, before the join policy trims the calendar
+    cand_cols = [column[ticker] for ticker in candidates]
+    own = present[:, cand_cols]
+    own_dates = pd.DatetimeIndex(calendar)
+
+    # calendar of the join policy
+    leg_cols = [column[ticker] for ticker in legs]
+    if join == 'inner':
+        keep = present.all(axis=1)
+    elif join == 'outer':
+        keep = np.ones(len(calendar), dtype=bool)
+    else:
+        legs_present = present[:, leg_cols].all(axis=1)
+        keep = np.arange(len(calendar)) >= (np.argmax(legs_present) if legs_present.any() else len(calendar))
+    calendar, values, present = calendar[keep], np.asfortranarray(values[keep]), present[keep]
+    missing = ~present
+
+    # fill missing returns, inside each asset's own history only for asset_start
+    fill_mask = missing.copy()
+    if join == 'asset_start':
+        rows = np.arange(len(calendar))[:, None]
+        first = np.where(present.any(axis=0), np.argmax(present, axis=0), len(calendar))
+        last = len(calendar)-1-np.argmax(present[::-1], axis=0)
+        fill_mask &= (rows >= first) & (rows <= last)
+        # replacement portfolio legs are filled from the start of the calendar
+        fill_mask[:, leg_cols] = missing[:, leg_cols]
+    if fill is None: fill_mask[:] = False
+    values[fill_mask] = fill
+
+    dates = pd.DatetimeIndex(calendar)
+    weights = np.asarray(weights, dtype=float)
+    replace_port = pd.Series(values[:, leg_cols] @ (weights/weights.sum()), index=dates, name=name)
+    candidates_df = pd.DataFrame(values[:, cand_cols], index=dates, columns=list(candidates))
+
+    # overlap of every candidate's returns with the replacement portfolio's, next to the candidate's own history
+    shared = present[:, cand_cols] & ~np.isnan(replace_port.values)[:, None]
+    def edge_dates(mask, index, last=False):
+        rows = len(index)-1-np.argmax(mask[::-1], axis=0) if last else np.argmax(mask, axis=0)
+        return index[rows].where(mask.any(axis=0))
+    overlap = pd.DataFrame({'Start': edge_dates(own, own_dates), 'End': edge_dates(own, own_dates, last=True), 'Observations': own.sum(axis=0),
+                            'Overlap_Start': edge_dates(shared, dates), 'Overlap_End': edge_dates(shared, dates, last=True), 'Overlap_Obs': shared.sum(axis=0),
+                            'Filled': fill_mask[:, cand_cols].sum(axis=0)}, index=list(candidates))
+    return Panel(dates, replace_port, candidates_df, pd.DataFrame(missing, index=dates, columns=tickers), overlap)
@@ -1,327 +1,523 @@
+import importlib
 import pandas as pd
 import numpy as np
 from datetime import date
-import matplotlib
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-import seaborn as sns
-import yfinance as yf
-yf.pdr_override()
-import pandas as pd
-
-#Risk and Reward Functions##################################################################
-def sharpe_ratio(df,risk_free=0,periodicity=252):
-    """df - asset return series, e.g. daily returns based on daily close prices of asset
-   risk_free - annualized risk free rate (default is assumed to be 0)
-   periodicity - number of periods at desired frequency in one year
-                e.g. 252 business days in 1 year (default),
-                12 months in 1 year,
-                52 weeks in 1 year etc."""
-    # convert return series to numpy array (in case Pandas series is provided)
-    df = np.asarray(df)
-    # convert annualized risk free rate into appropriate value for provided frequency of asset return series (df)
-    risk_free=(1+risk_free)**(1/periodicity)-1
-    # calculate mean excess return based on return series provided
-    dfMean=np.nanmean(df)-risk_free
-    # calculate standard deviation of return series
-    dfSTD=np.nanstd(df)
-    # calculate Sharpe Ratio = Mean excess return / Std of returns * sqrt(periodicity)
-    dfSharpe=dfMean/dfSTD*np.sqrt(periodicity)
-    return dfSharpe
-
-def target_downside_deviation(df, MAR=0, periodicity=252):
-    """df - asset return series, e.g. daily returns based on daily close prices of asset
-    minimum acceptable return (MAR) - value is subtracted from returns before root-mean-square calculation to obtain target downside deviation (TDD)"""
-    # convert return series to numpy array (in case Pandas series is provided)
-    df = np.asarray(df)
-    # TDD step 1: subtract mininum acceptable return (MAR) from period returns provided in df
-    df_ = df - MAR
-    # TDD step 2: zero out positive excess returns and calculate root-mean-square for resulting values
-    df2 = np.where(df_<0, df_, 0)
-    tdd = np.sqrt(np.nanmean(df2**2))
-    return tdd
-
-def sortino_ratio(df,risk_free=0, periodicity=252, include_risk_free_in_vol=False):
-    """df - asset return series, e.g. daily returns based on daily close prices of asset
-   risk_free - annualized risk free rate (default is assumed to be 0). Note: risk free rate is assumed to be the target return/minimum acceptable return (MAR)
-               used in calculating both the mean excess return (numerator of Sortino ratio) and determining target downside deviation (TDD, the denominator of Sortino)
-   periodicity - number of periods at desired frequency in one year
-                e.g. 252 business days in 1 year (default),
-                12 months in 1 year,
-                52 weeks in 1 year etc."""
-    # convert return series to numpy array (in case Pandas series is provided)
-    df = np.asarray(df)
-    # convert annualized risk free rate into appropriate value for provided frequency of asset return series (df)
-    risk_free=(1+risk_free)**(1/periodicity)-1
-    # calculate mean excess return based on return series provided
-    dfMean=np.nanmean(df)-risk_free
-    # calculate target downside deviation (TDD)
-    # assume risk free rate is MAR
-    if include_risk_free_in_vol==True: MAR=risk_free
-    else: MAR=0
-    tdd = target_downside_deviation(df, MAR=MAR)
-    # calculate Sortino Ratio = Mean excess return / TDD * sqrt(periodicity)
-    dfSortino=(dfMean/tdd)*np.sqrt(periodicity)
-    return dfSortino
-
-def annualized_return(df,periodicity=252):
-    """df - asset return series, e.g. returns based on daily close prices of asset
-   periodicity - number of periods at desired frequency in one year
-                e.g. 252 business days in 1 year (default),
-                12 months in 1 year,
-                52 weeks in 1 year etc."""
-    # convert return series to numpy array (in case Pandas series is provided)
-    df = np.asarray(df)
-    # how many years of returns data is provided in df
-    difference_in_years = len(df)/periodicity
-    # starting net asset value / NAV (assumed to be 1) and cumulative returns (r) over time period provided in returns data
-    start_NAV=1.0
-    r = np.nancumprod(df+start_NAV)
-    # end NAV based on final cumulative return
-    end_NAV=r[-1]
-    # determine annualized return
-    AnnualReturn = end_NAV**(1 / difference_in_years) - 1
-    return AnnualReturn
-
-def max_dd(df, return_data=False):
-    """df - asset return series, e.g. returns based on daily close prices of asset
-    return_data - boolean value to determine if drawdown values over the return data time period should be return, instead of max DD"""
-    # convert return series to numpy array (in case Pandas series is provided)
-    df = np.asarray(df)
-    # calculate cumulative returns
-    start_NAV = 1
-    r = np.nancumprod(df+start_NAV)
-    # calculate cumulative max returns (i.e. keep track of peak cumulative return up to that point in time, despite actual cumulative return at that point in time)
-    peak_r = np.maximum.accumulate(r)
-    # determine drawdowns relative to peak cumulative return achieved up to each point in time
-    dd = (r - peak_r) / peak_r
-    # return drawdown values over time period if return_data is set to True, otherwise return max drawdown which will be a positive number
-    if return_data==True:
-        out = dd
-    else:
-        out = np.abs(np.nanmin(dd))
-    return out
-
-def return_maxdd_ratio(df,risk_free=0,periodicity=252):
-    """df - asset return series, e.g. returns based on daily close prices of asset
-   risk_free - annualized risk free rate (default is assumed to be 0)
-   periodicity - number of periods at desired frequency in one year
-                e.g. 252 business days in 1 year (default),
-                12 months in 1 year,
-                52 weeks in 1 year etc."""
-    # convert return series to numpy array (in case Pandas series is provided)
-    df = np.asarray(df)
-    # convert annualized risk free rate into appropriate value for provided frequency of asset return series (df)
-    risk_free=(1+risk_free)**(1/periodicity)-1
-    # determine annualized return to be used in numerator of return to max drawdown (RMDD) calculation
-    AnnualReturn = annualized_return(df, periodicity=periodicity)
-    # determine max drawdown to be used in the denominator of RMDD calculation
-    maxDD=max_dd(df,return_data=False)
-    return (AnnualReturn-risk_free)/abs(maxDD)
-
-def avg_positive(ret,dropzero=1):
-    if dropzero>0:
-        positives = ret > 0
-    else:
-        positives = ret >= 0
-    if positives.any():
-        return np.mean(ret[positives])
-    else:
-        return 0.000000000000000000000000000001
-
-def avg_neg(ret):
-    negatives = ret < 0
-    if negatives.any():
-        return np.mean(ret[negatives])
-    else:
-        return -1*0.000000000000000000000000000001
-
-def win_pct(ret,dropzero=1):
-    if dropzero>0:
-        win=len(np.where(ret>0)[0])
-        total=len(ret)
-    else:
-        win=len(np.where(ret>=0)[0])
-        total=len(ret)
-    return (win/total)
-
-def kelly(df,dropzero=0):
-    if dropzero==1: df = df[(df!= 0)]
-    avg_pos=df[df>=0].mean()
-    avg_neg=df[df<0].mean()
-    win_pct=df[df>=0].count()/df.count()
-    loss_pct=(1-win_pct)
-    return ((avg_pos/abs(avg_neg))*win_pct-(loss_pct))/(avg_pos/abs(loss_pct))
+# the metrics themselves live in the NumPy-only core and are re-exported here
+from cwarp_core import *
+from cwarp_core import _periodic_rate, _block_width
+
+# plotting and the Yahoo integration are imported on first use (e.g. cwarp_defs.plt), so importing the metrics stays cheap
+_LAZY_MODULES = {'matplotlib': 'matplotlib', 'plt': 'matplotlib.pyplot', 'mdates': 'matplotlib.dates', 'sns': 'seaborn', 'yf': 'yfinance'}
+
+def __getattr__(name):
+    if name in _LAZY_MODULES:
+        module = importlib.import_module(_LAZY_MODULES[name])
+        globals()[name] = module
+        return module
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+#Tearsheet Engine###########################################################################
+def _sparse_levels(values, combine):
+    """sparse table: level k holds combine() over every run of 2**k consecutive elements (as a tuple of arrays)"""
+    levels = [values]
+    width = 1
+    while 2*width <= len(values[0]):
+        prev = levels[-1]
+        levels.append(combine(tuple(v[:len(v)-width] for v in prev), tuple(v[width:] for v in prev)))
+        width *= 2
+    return levels
+
+def _dd_combine(left, right):
+    """(peak, trough, drawdown) of log NAV over two adjacent segments"""
+    return (np.maximum(left[0], right[0]), np.minimum(left[1], right[1]),
+            np.maximum(np.maximum(left[2], right[2]), left[0]-right[1]))
+
+class TearsheetIndex:
+    """Precomputed range index over one return series answering tearsheet statistics for any number of (bop, eop) windows.
+    Prefix sums of returns, squared returns, downside squares, win/loss sums and log NAV give every moment in O(1) per window,
+    a sparse table over log NAV gives max drawdown in O(log n) per window and best/worst period in O(1).
+    df_pct - return series (Pandas series indexed by date)
+    dropzero - drop zero returns (e.g. non-trading days) from the Sharpe and Sortino moments
+    periodicity - number of periods at desired frequency in one year"""
+
+    def __init__(self, df_pct, dropzero=1, periodicity=252):
+        self.index = df_pct.index
+        self.periodicity = periodicity
+        x = np.asarray(df_pct, dtype=float)
+        present = ~np.isnan(x)
+        x0 = np.where(present, x, 0)
+        positive = present & (x >= 0)
+        moment_rows = present & (x != 0) if dropzero>0 else present
+        def prefix(values):
+            out = np.zeros(len(values)+1)
+            np.cumsum(values, out=out[1:])
+            return out
+        self.n = prefix(present)
+        self.n_moment = prefix(moment_rows)
+        # second moments are summed around the series mean, which keeps short windows free of cancellation error
+        self.shift = np.mean(x[present]) if present.any() else 0.0
+        xc = np.where(present, x-self.shift, 0)
+        self.s1 = prefix(xc)
+        self.s2 = prefix(xc**2)
+        self.s1_moment = prefix(np.where(moment_rows, xc, 0))
+        self.s2_moment = prefix(np.where(moment_rows, xc, 0)**2)
+        self.s_moment = prefix(np.where(moment_rows, x0, 0))
+        self.d2 = prefix(np.minimum(x0, 0)**2)
+        self.n_pos = prefix(positive)
+        self.s_pos = prefix(np.where(positive, x0, 0))
+        self.s_neg = prefix(np.minimum(x0, 0))
+        # log NAV after each period (missing returns leave NAV unchanged, as np.nancumprod)
+        self.log_nav = prefix(np.log1p(x0))
+        nav = self.log_nav[1:]
+        self._dd_levels = _sparse_levels((nav, nav, np.zeros(len(nav))), _dd_combine)
+        self._best = _sparse_levels((np.where(present, x, -np.inf),), lambda a, b: (np.maximum(a[0], b[0]),))
+        self._worst = _sparse_levels((np.where(present, x, np.inf),), lambda a, b: (np.minimum(a[0], b[0]),))
+
+    def rows(self, bop=None, eop=None):
+        """row range [i, j) of the windows between bop and eop (inclusive, None for the start/end of the series)"""
+        if not isinstance(bop, (list, tuple, np.ndarray, pd.Index)): bop = [bop]
+        if not isinstance(eop, (list, tuple, np.ndarray, pd.Index)): eop = [eop]
+        bop = pd.DatetimeIndex([self.index[0] if b is None else pd.Timestamp(b) for b in bop])
+        eop = pd.DatetimeIndex([self.index[-1] if e is None else pd.Timestamp(e) for e in eop])
+        return self.index.searchsorted(bop, side='left'), self.index.searchsorted(eop, side='right')
+
+    def _range_extreme(self, levels, i, j, combine):
+        """O(1) idempotent range query over rows [i, j) from two overlapping power-of-two runs"""
+        k = np.floor(np.log2(np.maximum(j-i, 1))).astype(int)
+        out = np.empty(len(i))
+        for level in np.unique(k):
+            sel = k == level
+            values = levels[level][0]
+            out[sel] = combine(values[i[sel]], values[j[sel]-2**level])
+        return out
+
+    def max_dd(self, i, j):
+        """max drawdown of rows [i, j) by merging the disjoint power-of-two runs covering the window, left to right"""
+        peak = np.full(len(i), -np.inf)
+        dd = np.zeros(len(i))
+        pos = i.copy()
+        length = j-i
+        for level in range(len(self._dd_levels)-1, -1, -1):
+            sel = (length >> level) & 1 == 1
+            if not sel.any(): continue
+            seg_peak, seg_trough, seg_dd = (v[pos[sel]] for v in self._dd_levels[level])
+            dd[sel] = np.maximum(np.maximum(dd[sel], seg_dd), peak[sel]-seg_trough)
+            peak[sel] = np.maximum(peak[sel], seg_peak)
+            pos[sel] += 2**level
+        return 1-np.exp(-dd)
+
+    def query(self, bop=None, eop=None):
+        """tearsheet statistics of every (bop, eop) window, bop/eop are dates or sequences of dates"""
+        i, j = self.rows(bop, eop)
+        p = self.periodicity
+        def window(prefix): return prefix[j]-prefix[i]
+        n = window(self.n)
+        n_moment = window(self.n_moment)
+        # moments for Sharpe and Sortino use only the rows kept by dropzero
+        mean_moment = window(self.s_moment)/n_moment
+        centered_moment = window(self.s1_moment)/n_moment
+        sharpe = mean_moment/np.sqrt(np.maximum(window(self.s2_moment)/n_moment-centered_moment**2, 0))*np.sqrt(p)
+        sortino = mean_moment/np.sqrt(window(self.d2)/n_moment)*np.sqrt(p)
+        centered = window(self.s1)/n
+        vol = np.sqrt(np.maximum(window(self.s2)/n-centered**2, 0))*np.sqrt(p)
+        annret = np.exp(window(self.log_nav)*p/(j-i))-1
+        maxdd = self.max_dd(i, j)
+        win_pct = window(self.n_pos)/n
+        loss_pct = 1-win_pct
+        avg_pos = window(self.s_pos)/window(self.n_pos)
+        avg_neg = window(self.s_neg)/(n-window(self.n_pos))
+        kelly = ((avg_pos/np.abs(avg_neg))*win_pct-loss_pct)/(avg_pos/np.abs(loss_pct))
+        return pd.DataFrame({'AnnRet': annret, 'Vol': vol, 'Sharpe': sharpe, 'Sortino': sortino, 'MaxDD': maxdd, 'Calmar': annret/np.abs(maxdd),
+                             'Kelly': kelly,
+                             'BestDay': self._range_extreme(self._best, i, j, np.maximum),
+                             'WorstDay': self._range_extreme(self._worst, i, j, np.minimum),
+                             'bop': self.index[np.minimum(i, len(self.index)-1)], 'eop': self.index[np.maximum(j-1, 0)]})
+
+def calendar_year_windows(index):
+    """(label, bop, eop) of every calendar year in a date index"""
+    years = pd.Series(index, index=index).groupby(index.year)
+    return [(str(year), dates.iloc[0], dates.iloc[-1]) for year, dates in years]
+
+def trailing_windows(index, years=(1,3,5)):
+    """(label, bop, eop) of the trailing N-year windows ending on the last date of an index"""
+    eop = index[-1]
+    return [(f'Trailing_{y}Y', eop-pd.DateOffset(years=y)+pd.Timedelta(days=1), eop) for y in years]
+
+def tearsheet(df_pct, windows=None, dropzero=1, periodicity=252):
+    """Tearsheet table (AnnRet, Vol, Sharpe, Sortino, MaxDD, Calmar, Kelly, BestDay, WorstDay) for many series and windows.
+    df_pct - return series, or dataframe with one return series per column
+    windows - list of (label, bop, eop), e.g. calendar_year_windows(df_pct.index) + trailing_windows(df_pct.index), default is the full sample
+    Each series is indexed once and all of its windows are answered from the same index.
+    Returns a DataFrame indexed by window label (by (series, window label) for a dataframe)."""
+    if windows is None: windows = [('Full', None, None)]
+    labels = [w[0] for w in windows]
+    bops = [w[1] for w in windows]
+    eops = [w[2] for w in windows]
+    if isinstance(df_pct, pd.Series):
+        return TearsheetIndex(df_pct, dropzero=dropzero, periodicity=periodicity).query(bops, eops).set_axis(labels)
+    tables = {name: TearsheetIndex(df_pct[name], dropzero=dropzero, periodicity=periodicity).query(bops, eops).set_axis(labels)
+              for name in df_pct.columns}
+    return pd.concat(tables, names=['Series', 'Window'])
 
 def return_analyz(df_pct,bck_test_name='BackTest',bop=None,eop=None):
-    df_pct=df_pct.copy()
-    if bop==None: bop=min(df_pct.index)
-    if eop==None: eop=max(df_pct.index)
-
-    sharpe=SharpeAdj(df_pct[(df_pct.index>=bop)&(df_pct.index<=eop)].to_numpy(),dropzero=1, periodicity=252)
-    sortino=SortinoAdj(df_pct[(df_pct.index>=bop)&(df_pct.index<=eop)].to_numpy(),dropzero=1, periodicity=252)
-    annret=annualized_return(df_pct[(df_pct.index>=bop)&(df_pct.index<=eop)].to_numpy(),periodicity=252)
-    maxdd=max_dd(df_pct[(df_pct.index>=bop)&(df_pct.index<=eop)],use_window=False,return_data=False)
-    calmar=annret/abs(maxdd)
-    #calmar=annualized_return(df_pct[(df_pct.index>=bop)&(df_pct.index<=eop)].to_numpy(),days_in_year=252)/abs(max_dd(df_pct[(df_pct.index>=bop)&(df_pct.index<=eop)]))
-    vol=np.std(df_pct[(df_pct.index>=bop)&(df_pct.index<=eop)])*((252)**.5)
-    worst_day=min(df_pct[(df_pct.index>=bop)&(df_pct.index<=eop)])
-    best_day=min(df_pct[(df_pct.index>=bop)&(df_pct.index<=eop)])
-    win_pct=df_pct[df_pct>=0].count()/df_pct.count()
-    avg_positive=df_pct[df_pct>=0].mean()
-    avg_neg=df_pct[df_pct<0].mean()
-    kelly1=kelly(df_pct[(df_pct.index>=bop)&(df_pct.index<=eop)],dropzero=0)
-    data=[annret,vol,sharpe,sortino,maxdd,calmar,kelly,bop,eop]
-    arr= pd.DataFrame({'AnnRet': annret, 'Vol': vol, 'Sharpe': sharpe, 'Sortino': sortino, 'MaxDD': maxdd, 'Calmar': calmar,
-                       'Kelly': kelly1, 'bop': bop, 'eop': eop},index=[bck_test_name])
-    return arr
+    """df_pct - return series (Pandas series indexed by date)
+    bck_test_name - row label of the result
+    bop, eop - first and last date of the window analyzed (default is the whole series)
+    Returns a one row tearsheet: AnnRet, Vol, Sharpe and Sortino (zero returns dropped), MaxDD, Calmar, Kelly, BestDay, WorstDay, bop, eop.
+    For many windows or series use tearsheet, which indexes each series once."""
+    return tearsheet(df_pct, windows=[(bck_test_name, bop, eop)])
+
+#Calendar Return Tables#####################################################################
+def calendar_return_matrices(df, data='nav', freqs=('M','Q','A')):
+    """Calendar return matrices for every column of a NAV or return panel at once.
+    df - dataframe (or series) indexed by date, one NAV or return series per column
+    data - 'nav' if df holds NAV/price levels, 'returns' if it holds period returns
+    freqs - any of 'M' (monthly), 'Q' (quarterly), 'A' (annual)
+    Period returns are compounded from one grouped pass over the log returns of all columns; quarterly and annual returns
+    are then summed from the monthly log returns. Periods without any data are NaN. A series' first period is compounded from
+    its first NAV (or return), so it is reported as a partial period rather than left NaN as month-end to month-end returns would.
+    Returns a dict freq -> DataFrame: 'M' and 'Q' are indexed by (series, year) with one column per month/quarter plus 'Annual',
+    'A' is indexed by year with one column per series."""
+    if isinstance(df, pd.Series): df = df.to_frame()
+    returns = df.pct_change() if data == 'nav' else df
+    present = returns.notna()
+    log_ret = np.log1p(returns.where(present, 0))
+    keys = [returns.index.year.rename('Year'), returns.index.month.rename('Month')]
+    # single grouped pass over every column: summed log returns and number of observations per (year, month)
+    monthly_log = log_ret.groupby(keys).sum()
+    monthly_n = present.groupby(keys).sum()
+    monthly_log = monthly_log.where(monthly_n > 0)
+    annual_log = monthly_log.groupby(level='Year').sum(min_count=1)
+
+    series, years = list(monthly_log.columns), annual_log.index
+    rows = pd.MultiIndex.from_product([series, years], names=['Series', 'Year'])
+    annual = np.expm1(annual_log.to_numpy()).T.ravel()
+    def matrix(period_log, period_name):
+        # (year, period) x series -> (series, year) x period in one unstack and transpose of the whole frame,
+        # with the compounded annual return alongside
+        periods = sorted(period_log.index.get_level_values(period_name).unique())
+        wide = period_log.unstack(period_name).reindex(index=years, columns=pd.MultiIndex.from_product([series, periods]))
+        values = np.expm1(wide.to_numpy()).reshape(len(years), len(series), len(periods)).transpose(1, 0, 2)
+        table = pd.DataFrame(values.reshape(-1, len(periods)), index=rows, columns=periods)
+        table['Annual'] = annual
+        return table
+
+    out = {}
+    for freq in freqs:
+        if freq == 'M':
+            out['M'] = matrix(monthly_log, 'Month')
+        elif freq == 'Q':
+            quarter = ((monthly_log.index.get_level_values('Month')-1)//3+1).rename('Quarter')
+            quarterly_log = monthly_log.groupby([monthly_log.index.get_level_values('Year'), quarter]).sum(min_count=1)
+            out['Q'] = matrix(quarterly_log, 'Quarter').rename(columns=lambda q: q if q == 'Annual' else f'Q{q}')
+        elif freq == 'A':
+            out['A'] = np.expm1(annual_log)
+        else:
+            raise ValueError(f"freq must be 'M', 'Q' or 'A', not {freq}")
+    return out
 
 def monthly_ret_matrix(daily_nav_df):
-    return_df=daily_nav_df.iloc[:,0]
-    return_df=pd.DataFrame(return_df.resample('M').last())
-    return_df['Monthly%']=return_df.pct_change()
-    return_df['month']=pd.DatetimeIndex(return_df.index).month
-    return_df['year']=pd.DatetimeIndex(return_df.index).year
-    return_table=pd.pivot_table(return_df,index=["month"],
-                   values=["Monthly%"],
-                   aggfunc='sum',fill_value=None,
-                   columns=["year"])
-    return_table=return_table.append(pd.DataFrame(((return_table+1).cumprod()-1).iloc[-1,:]).rename(columns={12: "Annual"}).T)
-    return return_table
+    """daily_nav_df - dataframe of daily NAV, one series per column
+    Returns monthly returns with months 1-12 (and 'Annual') as rows and (series, year) as columns."""
+    return calendar_return_matrices(daily_nav_df, data='nav', freqs=('M',))['M'].T
 
 def ReturnTable(daily_nav_df,freq='1M'):
-    return_df=daily_pct_df.resample('1M').last()
-    return_df
-
-
-def cole_win_above_replace_port(new_asset,replace_port,risk_free_rate=0,financing_rate=0,weight_asset=0.25,weight_replace_port=1,periodicity=252):
-    """Cole Win Above Replacement Portolio (CWARP): Total score to evaluate whether any new investment improves or hurts the return to risk of your total portfolio.
-    new_asset = returns of the asset you are thinking of adding to your portfolio
-    replace_port = returns of your pre-existing portfolio (e.g. S&P 500 Index, 60/40 Stock-Bond Portfolio)
+    """daily_nav_df - dataframe of daily NAV, one series per column
+    freq - '1M'/'M' monthly, '1Q'/'Q' quarterly or '1A'/'A'/'Y' annual
+    Returns the calendar return matrix of every series at the requested frequency (see calendar_return_matrices)."""
+    freq = freq.lstrip('1').replace('Y', 'A')
+    return calendar_return_matrices(daily_nav_df, data='nav', freqs=(freq,))[freq]
+
+
+def cwarp_tables(new_assets,replace_port,risk_free_rate=0,financing_rate=0,weight_asset=0.25,weight_replace_port=1,periodicity=252,max_bytes=None,history=None):
+    """Builds the two CWARP summary tables for a set of candidate assets in one batched pass.
+    new_assets = DataFrame of returns, one column per candidate asset (column names are the tickers)
+    replace_port = Series of returns of your pre-existing portfolio, its name is used as the replacement portfolio label
+    max_bytes = memory budget of the batched evaluation, see cwarp_batch
+    history = DataFrame with Start and End columns indexed by ticker (e.g. Panel.overlap), the dates of each candidate's own history,
+              defaults to each column's first and last return in new_assets, which is only the common window once the panel is inner joined
+    remaining parameters as in cole_win_above_replace_port
+    Returns (risk_ret_df, new_risk_ret_df):
+    risk_ret_df - Start/End dates, CWARP and its components plus standalone Sharpe, Sortino, Max DD of every candidate
+    new_risk_ret_df - Return, Vol, Sharpe, Sortino, Max DD, RMDD and CWARP of the replacement portfolio and of every new portfolio"""
+    ticker_list = list(new_assets.columns)
+    replace_name = replace_port.name
+    cwarp_label = f'CWARP_{round(100*weight_asset)}%_asset'
+    # standalone statistics use each candidate's own rows (not its padding onto a panel's calendar), CWARP statistics use the replacement portfolio's calendar,
+    # candidates are reindexed onto it a block of columns at a time so max_bytes also bounds the aligned copy
+    width = _block_width(max(len(new_assets), len(replace_port)), len(ticker_list), max_bytes, arrays=4)
+    asset_parts, cwarp_parts = [], []
+    for first in range(0, len(ticker_list), width):
+        block = new_assets.iloc[:, first:first+width]
+        asset_parts.append(batch_metrics(block, risk_free=risk_free_rate, periodicity=periodicity, own_history=True))
+        cwarp_parts.append(cwarp_batch(block.reindex(replace_port.index), replace_port, risk_free_rate=risk_free_rate, financing_rate=financing_rate,
+                                       weight_asset=weight_asset, weight_replace_port=weight_replace_port, periodicity=periodicity))
+    asset_stats = {key: np.concatenate([part[key] for part in asset_parts]) for key in asset_parts[0]}
+    cwarp_stats = {key: np.concatenate([part[key] for part in cwarp_parts]) for key in cwarp_parts[0]}
+
+    if history is None:
+        history = pd.DataFrame({'Start': [new_assets[t].first_valid_index() for t in ticker_list],
+                                'End': [new_assets[t].last_valid_index() for t in ticker_list]}, index=ticker_list)
+    # candidates without a single return have no dates
+    edge = lambda date: pd.Timestamp(date).date() if pd.notna(date) else None
+    risk_ret_df = pd.DataFrame([[edge(history.at[t, 'Start']) for t in ticker_list],
+                                [edge(history.at[t, 'End']) for t in ticker_list],
+                                cwarp_stats['CWARP'], cwarp_stats['+Sortino'], cwarp_stats['+Ret_To_MaxDD'],
+                                asset_stats['Sharpe'], asset_stats['Sortino'], asset_stats['Max_DD']],
+                               index=['Start_Date','End_Date','CWARP','+Sortino','+Ret_To_MaxDD','Sharpe','Sortino','Max_DD'],
+                               columns=ticker_list)
+
+    new_rows = ['Return','Vol','Sharpe','Sortino','Max_DD','Ret_To_MaxDD']
+    new_risk_ret_df = pd.DataFrame([cwarp_stats[row] for row in new_rows]+[cwarp_stats['CWARP']],
+                                   index=new_rows+[cwarp_label], columns=ticker_list)
+    new_risk_ret_df = new_risk_ret_df.add_suffix(f'@{round(100*weight_asset)}% | '+str(replace_name)+f'{round(100*weight_replace_port)}%')
+    # replacement portfolio column goes first
+    replace_stats = batch_metrics(replace_port, risk_free=risk_free_rate, periodicity=periodicity)
+    replace_col = [replace_stats[row][0] for row in new_rows]
+    replace_col.append(cole_win_above_replace_port(new_asset=replace_port, replace_port=replace_port, risk_free_rate=risk_free_rate,
+                                                   financing_rate=financing_rate, weight_asset=weight_asset,
+                                                   weight_replace_port=weight_replace_port, periodicity=periodicity))
+    new_risk_ret_df.insert(0, replace_name, replace_col)
+    return risk_ret_df, new_risk_ret_df
+
+def _cwarp_weight_grid(new_assets,replace_port,replace_stats,weights_asset,weight_replace_port,financing_rate,risk_free_rate,periodicity):
+    """CWARP of every (overlay weight, candidate) pair for one replacement weight and one per-period financing rate.
+    new_assets - 2-D array (time x assets), replace_port - 1-D array, weights_asset - 1-D array of overlay weights
+    Returns an array of shape (len(weights_asset), assets)."""
+    # broadcast to (time x weights x assets) so every weight is scored in the same reductions
+    new_port = (new_assets[:, None, :]-financing_rate)*weights_asset[None, :, None]+replace_port[:, None, None]*weight_replace_port
+    out = batch_metrics(new_port, risk_free=risk_free_rate, periodicity=periodicity)
+    return ((out['Sortino']/replace_stats['Sortino'][0]*out['Ret_To_MaxDD']/replace_stats['Ret_To_MaxDD'][0])**(1/2)-1)*100
+
+def cwarp_surface(new_assets,replace_port,weights_asset=(0.05,0.1,0.15,0.2,0.25,0.3,0.4,0.5),weights_replace_port=(1,),financing_rates=(0,),risk_free_rate=0,periodicity=252,max_cells=2**25):
+    """CWARP sensitivity surface: scores every combination of overlay weight, replacement portfolio weight and financing rate for every candidate.
+    new_assets = 2-D returns (time x assets) of the candidate assets, aligned with replace_port (DataFrame column names are used as labels)
+    replace_port = returns of your pre-existing portfolio
+    weights_asset = grid of % overlay weights for the new asset
+    weights_replace_port = grid of % weights of the replacement portfolio
+    financing_rates = grid of annualized financing rates
     risk_free_rate = Tbill rate (annualized)
-    financing_rate = portfolio margin/borrowing cost (annualized) to layer new asset on top of prevailing portfolio (e.g. LIBOR + 60bps). No financing rate is reasonable for derivate overlay products.
-    weight_asset = % weight you wish to overlay for the new asset on top of the previous portfolio, 25% overlay allocation is standard
-    weight_replace_port = % weight of the replacement portfolio, 100% pre-existing portfolio value is standard
-    periodicity = the frequency of the data you are sampling, typically 12 for monthly or 252 for trading day count"""
-    # convert annualized financing rate into appropriate value for provided periodicity
-    # risk_free_rate will be converted appropriately in respective Sortino and RMDD calcs
-    financing_rate=(1+financing_rate)**(1/periodicity)-1
-
-    #Calculate Replacement Portfolio Sortino Ratio
-    replace_port_sortino = sortino_ratio(replace_port, risk_free=risk_free_rate, periodicity=periodicity)
-
-    #Calculate Replacement Portfolio Return to Max Drawdown
-    replace_port_return_maxdd = return_maxdd_ratio(replace_port, risk_free=risk_free_rate, periodicity=periodicity)
+    periodicity = the frequency of the data you are sampling, typically 12 for monthly or 252 for trading day count
+    max_cells = upper bound on the number of time x weight x asset values materialized at once, candidates are processed in blocks to respect it
+    Returns a DataFrame of CWARP values indexed by (weight_asset, weight_replace_port, financing_rate) with one column per candidate."""
+    labels = list(new_assets.columns) if isinstance(new_assets, pd.DataFrame) else None
+    new_assets = np.asarray(new_assets, dtype=float)
+    if new_assets.ndim == 1: new_assets = new_assets[:, None]
+    replace_port = np.asarray(replace_port, dtype=float)
+    weights_asset = np.asarray(weights_asset, dtype=float)
+    replace_stats = batch_metrics(replace_port, risk_free=risk_free_rate, periodicity=periodicity)
+    # number of candidate columns that fit in one broadcast block
+    block = max(1, int(max_cells // (new_assets.shape[0]*len(weights_asset))))
+
+    cube = []
+    keys = []
+    for weight_replace_port in weights_replace_port:
+        for financing_rate in financing_rates:
+            per_period_financing = _periodic_rate(financing_rate, periodicity)
+            values = np.concatenate([_cwarp_weight_grid(new_assets[:, i:i+block], replace_port, replace_stats, weights_asset,
+                                                        weight_replace_port, per_period_financing, risk_free_rate, periodicity)
+                                     for i in range(0, new_assets.shape[1], block)], axis=1)
+            cube.append(values)
+            keys += [(w, weight_replace_port, financing_rate) for w in weights_asset]
+    index = pd.MultiIndex.from_tuples(keys, names=['weight_asset','weight_replace_port','financing_rate'])
+    return pd.DataFrame(np.concatenate(cube, axis=0), index=index, columns=labels).sort_index()
+
+def optimal_overlay_weight(new_assets,replace_port,risk_free_rate=0,financing_rate=0,weight_replace_port=1,periodicity=252,bounds=(0.0001,0.9999),grid_points=21,tol=1e-4,max_iter=60):
+    """Finds the overlay weight that maximizes CWARP for every candidate asset.
+    A coarse grid is scored for all candidates at once to bracket the best weight, then a golden-section search refines every bracket together,
+    so each iteration is a single batched CWARP evaluation across all candidates.
+    new_assets = 2-D returns (time x assets) of the candidate assets, aligned with replace_port (DataFrame column names are used as labels)
+    replace_port = returns of your pre-existing portfolio
+    bounds = (lowest, highest) overlay weight considered
+    grid_points = number of weights in the coarse bracketing grid
+    tol = width of the final bracket on the overlay weight
+    remaining parameters as in cole_win_above_replace_port
+    Returns a DataFrame indexed by candidate with the CWARP maximizing 'weight_asset' and its 'CWARP'."""
+    labels = list(new_assets.columns) if isinstance(new_assets, pd.DataFrame) else None
+    new_assets = np.asarray(new_assets, dtype=float)
+    if new_assets.ndim == 1: new_assets = new_assets[:, None]
+    replace_port = np.asarray(replace_port, dtype=float)
+    per_period_financing = _periodic_rate(financing_rate, periodicity)
+    replace_stats = batch_metrics(replace_port, risk_free=risk_free_rate, periodicity=periodicity)
+    columns = np.arange(new_assets.shape[1])
+
+    def score(weights):
+        # CWARP of every candidate at its own overlay weight, missing scores never win
+        new_port = (new_assets-per_period_financing)*weights+replace_port[:, None]*weight_replace_port
+        out = batch_metrics(new_port, risk_free=risk_free_rate, periodicity=periodicity)
+        cwarp = ((out['Sortino']/replace_stats['Sortino'][0]*out['Ret_To_MaxDD']/replace_stats['Ret_To_MaxDD'][0])**(1/2)-1)*100
+        return np.where(np.isnan(cwarp), -np.inf, cwarp)
+
+    # coarse grid brackets the maximum of every candidate between the neighbours of its best grid weight
+    grid = np.linspace(bounds[0], bounds[1], grid_points)
+    grid_scores = np.stack([score(w) for w in grid])
+    best = np.argmax(grid_scores, axis=0)
+    a = grid[np.maximum(best-1, 0)]
+    b = grid[np.minimum(best+1, grid_points-1)]
+
+    # golden-section search, one new weight per candidate per iteration
+    g = (np.sqrt(5)-1)/2
+    c = b-g*(b-a)
+    d = a+g*(b-a)
+    fc = score(c)
+    fd = score(d)
+    for _ in range(max_iter):
+        if np.max(b-a) < tol: break
+        left = fc > fd
+        # maximum lies in [a, d]: shrink from the right, otherwise shrink from the left
+        b = np.where(left, d, b)
+        a = np.where(left, a, c)
+        c_new = np.where(left, c, d)
+        fc_new = np.where(left, fc, fd)
+        new_point = np.where(left, b-g*(b-a), a+g*(b-a))
+        f_new = score(new_point)
+        c = np.where(left, new_point, c_new)
+        d = np.where(left, c_new, new_point)
+        fc, fd = np.where(left, f_new, fc_new), np.where(left, fc_new, f_new)
+
+    # keep the best of the refined bracket and the coarse grid (handles maxima on the bounds)
+    refined_w = np.where(fc >= fd, c, d)
+    refined_f = np.maximum(fc, fd)
+    grid_best = grid_scores[best, columns]
+    use_grid = grid_best > refined_f
+    weights = np.where(use_grid, grid[best], refined_w)
+    cwarp = np.where(use_grid, grid_best, refined_f)
+    return pd.DataFrame({'weight_asset': weights, 'CWARP': np.where(np.isinf(cwarp), np.nan, cwarp)}, index=labels)
+
+#Rolling Window Functions###################################################################
+def _rolling_input(df):
+    """convert a return series/dataframe into a 2-D float array (time x assets) plus a function that restores the input's shape and labels"""
+    values = np.asarray(df, dtype=float)
+    squeeze = values.ndim == 1
+    if squeeze: values = values[:, None]
+    def restore(out):
+        if squeeze: out = out[:, 0]
+        if isinstance(df, pd.Series): return pd.Series(out, index=df.index, name=df.name)
+        if isinstance(df, pd.DataFrame): return pd.DataFrame(out, index=df.index, columns=df.columns)
+        return out
+    return values, restore
+
+def _rolling_sum(values, window):
+    """sum of the trailing window ending at every row of a 2-D array (no missing values) from one running sum, first window-1 rows are NaN"""
+    running = np.zeros((values.shape[0]+1, values.shape[1]))
+    np.cumsum(values, axis=0, out=running[1:])
+    out = np.full(values.shape, np.nan)
+    out[window-1:] = running[window:] - running[:-window]
+    return out
 
-    #Calculate New Portfolio Sortino Ratio
-    new_port = (new_asset-financing_rate)*weight_asset+replace_port*weight_replace_port
-    new_port_sortino = sortino_ratio(new_port, risk_free=risk_free_rate, periodicity=periodicity)
+def _rolling_log_nav(values):
+    """cumulative log NAV of a 2-D return array, missing returns leave NAV unchanged (as np.nancumprod)"""
+    log_ret = np.log1p(values)
+    log_ret[np.isnan(log_ret)] = 0
+    return np.cumsum(log_ret, axis=0)
+
+def _rolling_max_log_dd(log_nav, window):
+    """largest fall of log NAV (max over j<=k of log_nav[j]-log_nav[k]) inside the trailing window ending at every row.
+    Van Herk/Gil-Werman: prefix and suffix aggregates over fixed blocks of length window are combined, so the cost is linear in the series length."""
+    n, m = log_nav.shape
+    blocks = -(-n // window)
+    padded = np.empty((blocks*window, m))
+    padded[:n] = log_nav
+    padded[n:] = log_nav[-1]
+    B = padded.reshape(blocks, window, m)
+    # prefix aggregates of every block: running peak, running trough and running drawdown
+    pre_max = np.maximum.accumulate(B, axis=1)
+    pre_min = np.minimum.accumulate(B, axis=1).reshape(-1, m)
+    pre_dd = np.maximum.accumulate(pre_max - B, axis=1).reshape(-1, m)
+    del pre_max
+    # suffix aggregates of every block: peak, trough and drawdown from each row to the end of its block
+    suf_max = np.maximum.accumulate(B[:, ::-1], axis=1)[:, ::-1]
+    suf_min = np.minimum.accumulate(B[:, ::-1], axis=1)[:, ::-1]
+    suf_dd = np.maximum.accumulate((B - suf_min)[:, ::-1], axis=1)[:, ::-1].reshape(-1, m)
+    suf_max = suf_max.reshape(-1, m)
+    # window [s, e] = suffix of the block holding s + prefix of the block holding e
+    s = np.arange(n-window+1)
+    e = s + window - 1
+    dd = np.maximum(np.maximum(suf_dd[s], pre_dd[e]), suf_max[s] - pre_min[e])
+    # windows that start on a block boundary are exactly one block
+    aligned = s % window == 0
+    dd[aligned] = suf_dd[s[aligned]]
+    out = np.full((n, m), np.nan)
+    out[window-1:] = dd
+    return out
 
-    #Calculate New Portfolio Return to Max Drawdown
-    new_port_return_maxdd = return_maxdd_ratio(new_port, risk_free=risk_free_rate, periodicity=periodicity)
+def rolling_annualized_return(df,window,periodicity=252):
+    """df - asset return series (or dataframe of series), e.g. returns based on daily close prices of asset
+   window - number of periods in each trailing window, e.g. 252 for 1 year of daily data
+   periodicity - number of periods at desired frequency in one year
+   Returns annualized_return of every trailing window, NaN until the first full window."""
+    values, restore = _rolling_input(df)
+    log_ret = np.log1p(values)
+    log_ret[np.isnan(log_ret)] = 0
+    # end NAV of each window from the running sum of log returns
+    AnnualReturn = np.exp(_rolling_sum(log_ret, window)*periodicity/window) - 1
+    return restore(AnnualReturn)
+
+def rolling_target_downside_deviation(df,window,MAR=0,periodicity=252):
+    """df - asset return series (or dataframe of series), e.g. daily returns based on daily close prices of asset
+    window - number of periods in each trailing window
+    minimum acceptable return (MAR) - value is subtracted from returns before root-mean-square calculation to obtain target downside deviation (TDD)
+    Returns target_downside_deviation of every trailing window, NaN until the first full window."""
+    values, restore = _rolling_input(df)
+    downside = np.minimum(values - MAR, 0)
+    downside[np.isnan(downside)] = 0
+    tdd = np.sqrt(_rolling_sum(downside**2, window)/window)
+    return restore(tdd)
+
+def rolling_sortino_ratio(df,window,risk_free=0,periodicity=252,include_risk_free_in_vol=False):
+    """df - asset return series (or dataframe of series), e.g. daily returns based on daily close prices of asset
+   window - number of periods in each trailing window
+   risk_free - annualized risk free rate (default is assumed to be 0), used as in sortino_ratio
+   periodicity - number of periods at desired frequency in one year
+   Returns sortino_ratio of every trailing window, NaN until the first full window."""
+    values, restore = _rolling_input(df)
+    risk_free = _periodic_rate(risk_free, periodicity)
+    # window mean of the non-missing returns from running sums of returns and counts
+    present = ~np.isnan(values)
+    dfMean = _rolling_sum(np.where(present, values, 0), window)/_rolling_sum(present.astype(float), window) - risk_free
+    MAR = risk_free if include_risk_free_in_vol==True else 0
+    tdd = rolling_target_downside_deviation(values, window, MAR=MAR)
+    return restore(dfMean/tdd*np.sqrt(periodicity))
+
+def rolling_max_dd(df,window):
+    """df - asset return series (or dataframe of series), e.g. returns based on daily close prices of asset
+    window - number of periods in each trailing window
+    Returns max_dd of every trailing window (a positive number), NaN until the first full window."""
+    values, restore = _rolling_input(df)
+    maxDD = 1 - np.exp(-_rolling_max_log_dd(_rolling_log_nav(values), window))
+    return restore(maxDD)
+
+def rolling_return_maxdd_ratio(df,window,risk_free=0,periodicity=252):
+    """df - asset return series (or dataframe of series), e.g. returns based on daily close prices of asset
+   window - number of periods in each trailing window
+   risk_free - annualized risk free rate (default is assumed to be 0)
+   periodicity - number of periods at desired frequency in one year
+   Returns return_maxdd_ratio of every trailing window, NaN until the first full window."""
+    values, restore = _rolling_input(df)
+    risk_free = _periodic_rate(risk_free, periodicity)
+    AnnualReturn = rolling_annualized_return(values, window, periodicity=periodicity)
+    maxDD = rolling_max_dd(values, window)
+    return restore((AnnualReturn-risk_free)/maxDD)
+
+def rolling_cole_win_above_replace_port(new_asset,replace_port,window,risk_free_rate=0,financing_rate=0,weight_asset=0.25,weight_replace_port=1,periodicity=252):
+    """Cole Win Above Replacement Portolio (CWARP) over every trailing window, e.g. window=252*3 for rolling 3 year CWARP on daily data.
+    new_asset = returns of the asset you are thinking of adding to your portfolio (a dataframe scores every column), aligned with replace_port
+    replace_port = returns of your pre-existing portfolio
+    window = number of periods in each trailing window
+    remaining parameters as in cole_win_above_replace_port
+    Returns the CWARP of every trailing window, NaN until the first full window."""
+    values, restore = _rolling_input(new_asset)
+    replace_port = np.asarray(replace_port, dtype=float)[:, None]
+    financing_rate = _periodic_rate(financing_rate, periodicity)
+
+    #Replacement portfolio rolling Sortino and Return to Max Drawdown
+    replace_port_sortino = rolling_sortino_ratio(replace_port, window, risk_free=risk_free_rate, periodicity=periodicity)
+    replace_port_return_maxdd = rolling_return_maxdd_ratio(replace_port, window, risk_free=risk_free_rate, periodicity=periodicity)
+
+    #New portfolio rolling Sortino and Return to Max Drawdown
+    new_port = (values-financing_rate)*weight_asset+replace_port*weight_replace_port
+    new_port_sortino = rolling_sortino_ratio(new_port, window, risk_free=risk_free_rate, periodicity=periodicity)
+    new_port_return_maxdd = rolling_return_maxdd_ratio(new_port, window, risk_free=risk_free_rate, periodicity=periodicity)
 
-    #Final CWARP calculation
     CWARP = ((new_port_return_maxdd/replace_port_return_maxdd*new_port_sortino/replace_port_sortino)**(1/2)-1)*100
-
-    return CWARP
-
-def cwarp_additive_sortino(new_asset,replace_port,risk_free_rate=0,financing_rate=0,weight_asset=0.25,weight_replace_port=1,periodicity=252):
-    """Cole Win Above Replacement Portolio (CWARP) Sortino +: Isolates new investment effect on total portfolio Sortino Ratio, which is a portion of the holistic CWARP score.
-    new_asset = returns of the asset you are thinking of adding to your portfolio
-    replace_port = returns of your pre-existing portfolio (e.g. S&P 500 Index, 60/40 Stock-Bond Portfolio)
-    risk_free_rate = Tbill rate (annualized)
-    financing_rate = portfolio margin/borrowing cost (annualized) to layer new asset on top of prevailing portfolio (e.g. LIBOR + 60bps). No financing rate is reasonable for derivate overlay products.
-    weight_asset = % weight you wish to overlay for the new asset on top of the previous portfolio, 25% overlay allocation is standard
-    weight_replace_port = % weight of the replacement portfolio, 100% pre-existing portfolio value is standard
-    periodicity = the frequency of the data you are sampling, typically 12 for monthly or 252 for trading day count"""
-    # convert annualized financing rate into appropriate value for provided periodicity
-    # risk_free_rate will be converted appropriately in respective Sortino and RMDD calcs
-    financing_rate=(1+financing_rate)**(1/periodicity)-1
-
-    #Calculate Replacement Portfolio Sortino Ratio
-    replace_port_sortino = sortino_ratio(replace_port, risk_free=risk_free_rate, periodicity=periodicity)
-
-    #Calculate New Portfolio Sortino Ratio
-    new_port = (new_asset-financing_rate)*weight_asset+replace_port*weight_replace_port
-    new_port_sortino = sortino_ratio(new_port, risk_free=risk_free_rate, periodicity=periodicity)
-
-    #Final calculation
-    CWARP_add_sortino=((new_port_sortino/replace_port_sortino)-1)*100
-
-    return CWARP_add_sortino
-
-def cwarp_additive_ret_maxdd(new_asset,replace_port,risk_free_rate=0,financing_rate=0,weight_asset=0.25,weight_replace_port=1,periodicity=252):
-    """Cole Win Above Replacement Portolio (CWARP) Ret to Max DD +: Isolates new investment effect on total portfolio Return to MAXDD, which is a portion of the holistic CWARP score.
-    new_asset = returns of the asset you are thinking of adding to your portfolio
-    replace_port = returns of your pre-existing portfolio (e.g. S&P 500 Index, 60/40 Stock-Bond Portfolio)
-    risk_free_rate = Tbill rate (annualized)
-    financing_rate = portfolio margin/borrowing cost (annualized) to layer new asset on top of prevailing portfolio (e.g. LIBOR + 60bps). No financing rate is reasonable for derivate overlay products.
-    weight_asset = % weight you wish to overlay for the new asset on top of the previous portfolio, 25% overlay allocation is standard
-    weight_replace_port = % weight of the replacement portfolio, 100% pre-existing portfolio value is standard
-    periodicity = the frequency of the data you are sampling, typically 12 for monthly or 252 for trading day count"""
-    # convert annualized financing rate into appropriate value for provided periodicity
-    # risk_free_rate will be converted appropriately in respective Sortino and RMDD calcs
-    financing_rate=(1+financing_rate)**(1/periodicity)-1
-
-    #Calculate Replacement Portfolio Return to Max Drawdown
-    replace_port_return_maxdd = return_maxdd_ratio(replace_port, risk_free=risk_free_rate, periodicity=periodicity)
-
-    #Calculate New Portfolio Return to Max Drawdown
-    new_port = (new_asset-financing_rate)*weight_asset+replace_port*weight_replace_port
-    new_port_return_maxdd = return_maxdd_ratio(new_port, risk_free=risk_free_rate, periodicity=periodicity)
-
-    #Final calculation
-    CWARP_add_ret_maxdd=((new_port_return_maxdd/replace_port_return_maxdd)-1)*100
-
-    return CWARP_add_ret_maxdd
-
-def cwarp_port_return(new_asset,replace_port,risk_free_rate=0,financing_rate=0,weight_asset=0.25,weight_replace_port=1,periodicity=252):
-    """Cole Win Above Replacement Portolio (CWARP) Portfolio Return: Returns of the aggregate portfolio after a new asset is financed and layered on top of the replacement portfolio.
-    new_asset = returns of the asset you are thinking of adding to your portfolio
-    replace_port = returns of your pre-existing portfolio (e.g. S&P 500 Index, 60/40 Stock-Bond Portfolio)
-    risk_free_rate = Tbill rate (annualized)
-    financing_rate = portfolio margin/borrowing cost (annualized) to layer new asset on top of prevailing portfolio (e.g. LIBOR + 60bps). No financing rate is reasonable for derivate overlay products.
-    weight_asset = % weight you wish to overlay for the new asset on top of the previous portfolio, 25% overlay allocation is standard
-    weight_replace_port = % weight of the replacement portfolio, 100% pre-existing portfolio value is standard
-    periodicity = the frequency of the data you are sampling, typically 12 for monthly or 252 for trading day count"""
-    # convert annual financing based on periodicity
-    financing_rate=((financing_rate+1)**(1/periodicity)-1)
-
-    # compose new portfolio
-    new_port=(new_asset-financing_rate)*weight_asset+replace_port*weight_replace_port
-
-    # calculate annualized return of new portfolio and subtract risk-free rate
-    out = annualized_return(new_port, periodicity=periodicity) - risk_free_rate
-    return out
-
-def cwarp_port_risk(new_asset,replace_port,risk_free_rate=0,financing_rate=0,weight_asset=0.25,weight_replace_port=1,periodicity=252):
-    """Cole Win Above Replacement Portolio (CWARP) Portfolio Risk: Volatility of the aggregate portfolio after a new asset is financed and layered on top of the replacement portfolio.
-    new_asset = returns of the asset you are thinking of adding to your portfolio
-    replace_port = returns of your pre-existing portfolio (e.g. S&P 500 Index, 60/40 Stock-Bond Portfolio)
-    risk_free_rate = Tbill rate (annualized)
-    financing_rate = portfolio margin/borrowing cost (annualized) to layer new asset on top of prevailing portfolio (e.g. LIBOR + 60bps). No financing rate is reasonable for derivate overlay products.
-    weight_asset = % weight you wish to overlay for the new asset on top of the previous portfolio, 25% overlay allocation is standard
-    weight_replace_port = % weight of the replacement portfolio, 100% pre-existing portfolio value is standard
-    periodicity = the frequency of the data you are sampling, typically 12 for monthly or 252 for trading day count"""
-    # convert annual financing and risk free rates based on periodicity
-    financing_rate=((financing_rate+1)**(1/periodicity)-1)
-    risk_free_rate=((risk_free_rate+1)**(1/periodicity)-1)
-    # compose new portfolio
-    new_port=(new_asset-financing_rate)*weight_asset+replace_port*weight_replace_port
-    # calculated target downside deviation (TDD)
-    tdd = target_downside_deviation(new_port, MAR=0)*np.sqrt(periodicity)
-    return tdd
-
-def cwarp_new_port_data(new_asset,replace_port,risk_free_rate=0,financing_rate=0,weight_asset=0.25,weight_replace_port=1,periodicity=252):
-    """Cole Win Above Replacement Portolio (CWARP) return stream: Return series after a new asset is financed and layered on top of the replacement portfolio.
-    new_asset = returns of the asset you are thinking of adding to your portfolio
-    replace_port = returns of your pre-existing portfolio (e.g. S&P 500 Index, 60/40 Stock-Bond Portfolio)
-    risk_free_rate = Tbill rate
-    financing_rate = portfolio margin/borrowing cost to layer new asset on top of prevailing portfolio (e.g. LIBOR + 60bps). No financing rate is reasonable for derivate overlay products.
-    weight_asset = % weight you wish to overlay for the new asset on top of the previous portfolio, 25% overlay allocation is standard
-    weight_replace_port = % weight of the replacement portfolio, 100% pre-existing portfolio value is standard
-    periodicity = the frequency of the data you are sampling, typically 12 for monthly or 252 for trading day count"""
-    # convert annual financing based on periodicity
-    financing_rate=((financing_rate+1)**(1/periodicity)-1)
-    new_port=(new_asset-financing_rate)*weight_asset+replace_port*weight_replace_port
-    return new_port
+    return restore(CWARP)
@@ -0,0 +1,171 @@
+import numpy as np
+
+#Online Metric Accumulators#################################################################
+# Stateful counterparts of the cwarp_defs metrics for live data: each new period is folded in with O(1) work
+# instead of recomputing nanmean/nanstd/nancumprod over the full history.
+# Missing returns (NaN) are treated exactly as the batch functions treat them: they count towards the number of periods
+# used to annualize and to average downside deviation, but leave the mean, variance and NAV unchanged.
+
+class SeriesAccumulator:
+    """Running statistics of one return series: Welford mean/variance, downside sum of squares (MAR=0),
+    cumulative NAV, running peak NAV and worst drawdown."""
+    __slots__ = ('n_total', 'n', 'mean', 'm2', 'downside_ss', 'nav', 'peak', 'max_dd')
+    n_fields = 8
+
+    def __init__(self):
+        self.n_total = 0      # periods seen, including missing returns
+        self.n = 0            # non-missing returns
+        self.mean = 0.0
+        self.m2 = 0.0         # sum of squared deviations from the running mean
+        self.downside_ss = 0.0
+        self.nav = 1.0
+        self.peak = 0.0
+        self.max_dd = 0.0
+
+    def update(self, ret):
+        """fold in one period return, NaN marks a missing return"""
+        self.n_total += 1
+        if ret == ret:
+            # Welford update of mean and variance
+            self.n += 1
+            delta = ret - self.mean
+            self.mean += delta / self.n
+            self.m2 += delta * (ret - self.mean)
+            if ret < 0: self.downside_ss += ret * ret
+            self.nav *= 1.0 + ret
+        # drawdown relative to the peak NAV reached so far
+        if self.nav > self.peak: self.peak = self.nav
+        dd = 1.0 - self.nav / self.peak
+        if dd > self.max_dd: self.max_dd = dd
+
+    @classmethod
+    def from_returns(cls, df):
+        """build the accumulator state from a return history in one vectorized pass, e.g. to seed a live accumulator"""
+        df = np.asarray(df, dtype=float)
+        acc = cls()
+        present = df[~np.isnan(df)]
+        acc.n_total = len(df)
+        acc.n = len(present)
+        if acc.n:
+            acc.mean = float(np.mean(present))
+            acc.m2 = float(np.sum((present - acc.mean)**2))
+            acc.downside_ss = float(np.sum(np.minimum(present, 0)**2))
+        if acc.n_total:
+            r = np.nancumprod(df + 1.0)
+            peak_r = np.maximum.accumulate(r)
+            acc.nav = float(r[-1])
+            acc.peak = float(peak_r[-1])
+            acc.max_dd = float(np.max(1.0 - r / peak_r))
+        return acc
+
+    def state(self):
+        """accumulator state as a flat float array (see from_state)"""
+        return np.array([getattr(self, name) for name in self.__slots__], dtype=float)
+
+    @classmethod
+    def from_state(cls, state):
+        acc = cls()
+        for name, value in zip(cls.__slots__, state):
+            setattr(acc, name, float(value))
+        acc.n_total = int(acc.n_total)
+        acc.n = int(acc.n)
+        return acc
+
+    def annualized_return(self, periodicity=252):
+        return self.nav**(periodicity / self.n_total) - 1
+
+    def target_downside_deviation(self):
+        return np.sqrt(self.downside_ss / self.n_total)
+
+    def sharpe_ratio(self, risk_free=0, periodicity=252):
+        risk_free = (1+risk_free)**(1/periodicity)-1
+        return (self.mean - risk_free) / np.sqrt(self.m2 / self.n) * np.sqrt(periodicity)
+
+    def sortino_ratio(self, risk_free=0, periodicity=252):
+        risk_free = (1+risk_free)**(1/periodicity)-1
+        return (self.mean - risk_free) / self.target_downside_deviation() * np.sqrt(periodicity)
+
+    def return_maxdd_ratio(self, risk_free=0, periodicity=252):
+        risk_free = (1+risk_free)**(1/periodicity)-1
+        return (self.annualized_return(periodicity) - risk_free) / self.max_dd
+
+
+class CwarpAccumulator:
+    """Live Cole Win Above Replacement Portolio (CWARP) for one new asset layered on one replacement portfolio.
+    Parameters are as in cwarp_defs.cole_win_above_replace_port. Call update(new_asset_ret, replace_ret) once per period
+    and read cwarp() (or its components) at any time."""
+    __slots__ = ('risk_free_rate', 'financing_rate', 'weight_asset', 'weight_replace_port', 'periodicity', 'new_port', 'replace_port')
+    n_params = 5
+
+    def __init__(self, risk_free_rate=0, financing_rate=0, weight_asset=0.25, weight_replace_port=1, periodicity=252):
+        self.risk_free_rate = risk_free_rate
+        self.financing_rate = financing_rate
+        self.weight_asset = weight_asset
+        self.weight_replace_port = weight_replace_port
+        self.periodicity = periodicity
+        self.new_port = SeriesAccumulator()
+        self.replace_port = SeriesAccumulator()
+
+    def _new_port_ret(self, new_asset_ret, replace_ret):
+        financing_rate = (1+self.financing_rate)**(1/self.periodicity)-1
+        return (new_asset_ret-financing_rate)*self.weight_asset+replace_ret*self.weight_replace_port
+
+    def update(self, new_asset_ret, replace_ret):
+        """fold in one period of new asset and replacement portfolio returns"""
+        self.new_port.update(self._new_port_ret(new_asset_ret, replace_ret))
+        self.replace_port.update(replace_ret)
+
+    @classmethod
+    def from_history(cls, new_asset, replace_port, **params):
+        """seed an accumulator from aligned return histories in one vectorized pass"""
+        acc = cls(**params)
+        new_asset = np.asarray(new_asset, dtype=float)
+        replace_port = np.asarray(replace_port, dtype=float)
+        acc.new_port = SeriesAccumulator.from_returns(acc._new_port_ret(new_asset, replace_port))
+        acc.replace_port = SeriesAccumulator.from_returns(replace_port)
+        return acc
+
+    def additive_sortino(self):
+        """as cwarp_defs.cwarp_additive_sortino"""
+        return (self.new_port.sortino_ratio(self.risk_free_rate, self.periodicity)
+                / self.replace_port.sortino_ratio(self.risk_free_rate, self.periodicity) - 1) * 100
+
+    def additive_ret_maxdd(self):
+        """as cwarp_defs.cwarp_additive_ret_maxdd"""
+        return (self.new_port.return_maxdd_ratio(self.risk_free_rate, self.periodicity)
+                / self.replace_port.return_maxdd_ratio(self.risk_free_rate, self.periodicity) - 1) * 100
+
+    def cwarp(self):
+        """as cwarp_defs.cole_win_above_replace_port"""
+        return (((self.additive_sortino()/100+1) * (self.additive_ret_maxdd()/100+1))**(1/2) - 1) * 100
+
+    def port_return(self):
+        """as cwarp_defs.cwarp_port_return"""
+        return self.new_port.annualized_return(self.periodicity) - self.risk_free_rate
+
+    def port_risk(self):
+        """as cwarp_defs.cwarp_port_risk"""
+        return self.new_port.target_downside_deviation() * np.sqrt(self.periodicity)
+
+    def state(self):
+        """parameters and both series states as one flat float array (see from_state)"""
+        params = [self.risk_free_rate, self.financing_rate, self.weight_asset, self.weight_replace_port, self.periodicity]
+        return np.concatenate([np.asarray(params, dtype=float), self.new_port.state(), self.replace_port.state()])
+
+    @classmethod
+    def from_state(cls, state):
+        k = cls.n_params
+        n = SeriesAccumulator.n_fields
+        acc = cls(*state[:k-1], periodicity=int(state[k-1]))
+        acc.new_port = SeriesAccumulator.from_state(state[k:k+n])
+        acc.replace_port = SeriesAccumulator.from_state(state[k+n:k+2*n])
+        return acc
+
+
+def save_accumulators(path, accumulators):
+    """checkpoint many CwarpAccumulators into one .npy file, one row of state per accumulator"""
+    np.save(path, np.stack([acc.state() for acc in accumulators]))
+
+def load_accumulators(path):
+    """restore the CwarpAccumulators written by save_accumulators, in the same order"""
+    return [CwarpAccumulator.from_state(state) for state in np.load(path)]
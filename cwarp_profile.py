@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import threading
+import functools
+import pandas as pd
+
+#Stage Profiler#############################################################################
+class _NullStage:
+    """shared do-nothing context manager handed out by a disabled profiler"""
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    def __init__(self, profiler, name, tags):
+        self.profiler = profiler
+        self.name = name
+        self.tags = tags
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        self.profiler._add(self.name, self.start, end-self.start, self.tags)
+        return False
+
+class Profiler:
+    """Wall-clock timings of named pipeline stages (e.g. 'data', 'alignment', 'metrics', 'plot'), optionally tagged per ticker.
+    enabled - when False, stage() returns a shared no-op context manager and timed() calls straight through, so the
+              instrumentation can stay in place at the cost of one attribute check per stage
+    Stages may be nested and entered from several threads, every event keeps its thread for the Chrome trace."""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.events = []   # dicts of name, tags, start (seconds since the profiler was created), seconds, thread
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _add(self, name, start, seconds, tags):
+        event = {'name': name, 'tags': tags, 'start': start-self._origin, 'seconds': seconds, 'thread': threading.get_ident()}
+        with self._lock:
+            self.events.append(event)
+
+    def stage(self, name, **tags):
+        """context manager timing the enclosed block as stage name, e.g. with profiler.stage('fetch', ticker='spy'): ..."""
+        if not self.enabled: return _NULL_STAGE
+        return _Stage(self, name, tags)
+
+    def timed(self, name=None, **tags):
+        """decorator timing every call of a function as stage name (default: the function's name)"""
+        def decorator(fn):
+            stage_name = name or fn.__name__
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled: return fn(*args, **kwargs)
+                with _Stage(self, stage_name, tags):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record(self, name, seconds, **tags):
+        """add a duration measured elsewhere, ending now"""
+        if self.enabled: self._add(name, time.perf_counter()-seconds, seconds, tags)
+
+    def reset(self):
+        with self._lock:
+            self.events = []
+        self._origin = time.perf_counter()
+
+    def summary(self):
+        """DataFrame of calls, total, mean and max milliseconds per stage, in order of first appearance.
+        'share' is each stage's total over the wall time covered by all events (nested and concurrent stages can add up to more than 1)"""
+        columns = ['calls', 'total_ms', 'mean_ms', 'max_ms', 'share']
+        if not self.events: return pd.DataFrame(columns=columns)
+        events = pd.DataFrame(self.events)
+        table = events.groupby('name', sort=False)['seconds'].agg(['count', 'sum', 'mean', 'max'])
+        table.columns = columns[:4]
+        table[['total_ms', 'mean_ms', 'max_ms']] *= 1e3
+        wall = (events['start']+events['seconds']).max()-events['start'].min()
+        table['share'] = table['total_ms']/1e3/wall if wall > 0 else float('nan')
+        return table
+
+    def breakdown(self, tag='ticker', name=None):
+        """DataFrame of calls and milliseconds per value of tag (e.g. per ticker), optionally restricted to stage name"""
+        rows = [(event['tags'][tag], event['name'], event['seconds']) for event in self.events
+                if tag in event['tags'] and (name is None or event['name'] == name)]
+        table = pd.DataFrame(rows, columns=[tag, 'stage', 'seconds'])
+        table = table.groupby([tag, 'stage'])['seconds'].agg(['count', 'sum']).rename(columns={'count': 'calls', 'sum': 'total_ms'})
+        table['total_ms'] *= 1e3
+        return table.sort_values('total_ms', ascending=False)
+
+    def to_json(self, path=None):
+        """events as a JSON string, also written to path if given"""
+        text = json.dumps({'events': self.events}, default=str, indent=1)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def to_chrome_trace(self, path=None):
+        """events in Chrome trace event format (load in chrome://tracing or Perfetto) as a JSON string, also written to path if given"""
+        pid = os.getpid()
+        trace = [{'name': event['name'], 'cat': 'cwarp', 'ph': 'X', 'ts': event['start']*1e6, 'dur': event['seconds']*1e6,
+                  'pid': pid, 'tid': event['thread'], 'args': event['tags']} for event in self.events]
+        text = json.dumps({'traceEvents': trace, 'displayTimeUnit': 'ms'}, default=str)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
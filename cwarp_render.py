@@ -0,0 +1,142 @@
+import os
+import hashlib
+import functools
+from io import BytesIO
+import numpy as np
+import pandas as pd
+import altair as alt
+
+#Downsampling###############################################################################
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: indices of n_out points of the line (x, y) that keep its visual shape (peaks, troughs,
+    drawdowns), always including the first and last point. x must be increasing and free of NaN, as must y."""
+    n = len(y)
+    if n_out >= n or n_out < 3: return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # n_out-2 buckets between the fixed first and last points
+    edges = np.linspace(1, n-1, n_out-1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n-1
+    a = 0
+    for i in range(n_out-2):
+        lo, hi = edges[i], edges[i+1]
+        # average of the next bucket (the last point for the final bucket) is the triangle's third corner
+        next_hi = edges[i+2] if i+2 < len(edges) else n
+        cx, cy = x[hi:next_hi].mean(), y[hi:next_hi].mean()
+        area = np.abs((x[a]-cx)*(y[lo:hi]-y[a])-(x[a]-x[lo:hi])*(cy-y[a]))
+        a = lo+int(np.argmax(area))
+        selected[i+1] = a
+    return selected
+
+def downsample(data, max_points=1000):
+    """Long-format DataFrame ('Date', 'Series', 'Value') of every column of data (Series or DataFrame indexed by date)
+    reduced to at most max_points points each with lttb. Missing values are dropped per column."""
+    if isinstance(data, pd.Series): data = data.to_frame(data.name if data.name is not None else 'Value')
+    frames = []
+    for column in data.columns:
+        series = data[column].dropna()
+        # datetimes are placed on the x axis by their nanosecond value
+        x = series.index.asi8 if isinstance(series.index, pd.DatetimeIndex) else np.arange(len(series))
+        keep = lttb(x, series.values, max_points)
+        frames.append(pd.DataFrame({'Date': series.index[keep], 'Series': str(column), 'Value': series.values[keep]}))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['Date', 'Series', 'Value'])
+
+def cumulative_returns(returns):
+    """growth of 1 for a return Series/DataFrame, missing returns leave it unchanged (computed at full length before downsampling)"""
+    return (returns.astype(float).fillna(0)+1).cumprod()
+
+#Interactive Charts#########################################################################
+def frontier_chart(new_risk_ret_df, size_row, height=400):
+    """scatter of downside volatility against return for every portfolio column of new_risk_ret_df, sized by row size_row (CWARP)"""
+    points = new_risk_ret_df.T.astype(float).rename(columns={size_row: 'CWARP'})
+    points['Portfolio'] = points.index
+    return alt.Chart(points).mark_circle(opacity=0.9).encode(
+        x=alt.X('Vol:Q', title='Downside Volatility', scale=alt.Scale(zero=False)),
+        y=alt.Y('Return:Q', scale=alt.Scale(zero=False)),
+        color=alt.Color('Portfolio:N', legend=alt.Legend(orient='bottom', columns=2, labelLimit=400)),
+        size=alt.Size('CWARP:Q', scale=alt.Scale(range=[50, 400], zero=False), title=size_row),
+        tooltip=['Portfolio', alt.Tooltip('Return:Q', format='.3f'), alt.Tooltip('Vol:Q', format='.3f'),
+                 alt.Tooltip('Sharpe:Q', format='.3f'), alt.Tooltip('CWARP:Q', format='.2f', title=size_row)]
+    ).properties(title='Efficient Frontier with CWARP', height=height).interactive()
+
+def cumulative_chart(returns, title='Cumulative Returns', max_points=1000, height=400):
+    """line chart of the growth of 1 of every return series (dict of name -> Series, or DataFrame), downsampled to max_points per line"""
+    if isinstance(returns, dict): returns = pd.concat(returns, axis=1)
+    lines = downsample(cumulative_returns(returns), max_points=max_points)
+    return alt.Chart(lines).mark_line().encode(
+        x=alt.X('Date:T'),
+        y=alt.Y('Value:Q', title='Return', scale=alt.Scale(zero=False)),
+        color=alt.Color('Series:N', title=None),
+        tooltip=['Series', alt.Tooltip('Date:T'), alt.Tooltip('Value:Q', format='.3f')]
+    ).properties(title=title, height=height).interactive()
+
+#Static Images##############################################################################
+def figure(figsize=(8,6)):
+    """a new matplotlib figure outside pyplot: concurrent sessions never share pyplot's global figure registry,
+    and the figure is garbage collected once the caller drops it, without plt.close"""
+    from matplotlib.figure import Figure
+    return Figure(figsize=figsize)
+
+@functools.lru_cache(maxsize=32)
+def _render_latex(formula, fontsize, dpi):
+    from matplotlib.figure import Figure
+    # a figure outside pyplot is not registered globally and needs no closing
+    fig = Figure()
+    text = fig.text(0, 0, '$%s$' % formula, fontsize=fontsize)
+    fig.savefig(BytesIO(), dpi=dpi)  # triggers rendering
+    bbox = text.get_window_extent()
+    width, height = bbox.size / float(dpi) + 0.05
+    fig.set_size_inches((width, height))
+    dy = (bbox.ymin / float(dpi)) / height
+    text.set_position((0, -dy))
+    buffer = BytesIO()
+    fig.savefig(buffer, dpi=dpi, format='png')
+    return buffer.getvalue()
+
+def latex_image(formula, fontsize=12, dpi=300, cache_dir=None):
+    """PNG bytes of a LaTeX formula, rendered once per process and, with cache_dir, once per cache directory"""
+    if cache_dir is None: return _render_latex(formula, fontsize, dpi)
+    key = hashlib.sha1(repr((formula, fontsize, dpi)).encode()).hexdigest()[:16]
+    path = os.path.join(cache_dir, f'latex_{key}.png')
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    image = _render_latex(formula, fontsize, dpi)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(path+'.tmp', 'wb') as f:
+        f.write(image)
+    os.replace(path+'.tmp', path)
+    return image
+
+def static_frontier(new_risk_ret_df, size_row):
+    """matplotlib version of frontier_chart"""
+    fig = figure(figsize=(10,6))
+    ax = fig.add_subplot()
+    points = new_risk_ret_df.T.astype(float)
+    size = points[size_row]
+    span = size.max()-size.min()
+    sizes = 50+350*(size-size.min())/span if span > 0 else pd.Series(200, index=size.index)
+    for label in points.index:
+        ax.scatter(points.loc[label, 'Vol'], points.loc[label, 'Return'], s=sizes[label], alpha=.9, label=label)
+    ax.set_title('Efficient Frontier with CWARP')
+    ax.set_xlabel('Downside Volatility')
+    ax.set_ylabel('Return')
+    ax.legend(fontsize='small', loc='upper center', bbox_to_anchor=(0.5, -0.12), ncol=2)
+    return fig
+
+def static_cumulative(returns, title='Cumulative Returns', max_points=1000):
+    """matplotlib version of cumulative_chart"""
+    if isinstance(returns, dict): returns = pd.concat(returns, axis=1)
+    lines = downsample(cumulative_returns(returns), max_points=max_points)
+    fig = figure(figsize=(8,6))
+    ax = fig.add_subplot()
+    for label, line in lines.groupby('Series', sort=False):
+        ax.plot(line['Date'], line['Value'], label=label)
+    ax.set_title(title)
+    ax.legend()
+    ax.set_xlabel('Date',fontsize=15)
+    ax.set_ylabel('Return',fontsize=15)
+    return fig
@@ -0,0 +1,301 @@
+"""Command line CWARP screener for nightly batch jobs.
+
+Scores a universe of candidate assets against one or more replacement portfolios and writes one ranked table.
+Candidates are split into column shards scored on a process pool. The candidate return matrix is shared with the
+workers through shared memory (or through the memory mapping of a ReturnStore) instead of being pickled to each task.
+For long (e.g. minute bar) histories, --max-memory bounds the scratch space of every shard, which is then scored in blocks of
+columns keeping only summary statistics, and --float32 halves the shared candidate matrix (statistics still accumulate in float64).
+With --prescreen-top K (or --prescreen-threshold T) every candidate first gets a cheap approximate CWARP (cwarp_approx), and only
+candidates that may still reach the top K (or a CWARP of T) within --prescreen-margin are scored exactly. --validate-prescreen
+also scores the whole universe and reports how well the pre-screen ranked it.
+
+Example:
+    python cwarp_screen.py --universe "qqq, lqd, hyg, tlt, gld" --portfolio "60/40=.6, spy, .4, ief" --out cwarp.csv
+"""
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from cwarp_core import batch_metrics, cwarp_batch, cwarp_approx, _block_width
+from cwarp_data import (PriceCache, YahooProvider, SyntheticProvider, CsvDirectoryProvider, load_returns,
+                        parse_portfolio, replacement_portfolio)
+from cwarp_store import ReturnStore
+
+#Worker Side################################################################################
+_candidates = None   # (time x assets) candidate matrix attached once per worker process
+_shm = None
+
+def _attach_shared(name, shape, dtype):
+    """pool initializer: map the candidate matrix from shared memory"""
+    global _candidates, _shm
+    _shm = shared_memory.SharedMemory(name=name)
+    _candidates = np.ndarray(shape, dtype=dtype, buffer=_shm.buf, order='F')
+
+def _attach_store(path, first_row, last_row):
+    """pool initializer: map the candidate rows first_row..last_row-1 of a ReturnStore"""
+    global _candidates
+    _candidates = ReturnStore.open(path).values[first_row:last_row]
+
+def _shard_columns(columns, first, last):
+    """columns first..last-1 of a shard's column slice or column numbers"""
+    if isinstance(columns, slice): return slice(columns.start+first, columns.start+last)
+    return columns[first:last]
+
+def _score_shard(columns, rows, replace_port, params):
+    """score candidate columns (a slice, or an array of column numbers after pre-screening) against one replacement portfolio.
+    rows - calendar rows of the replacement portfolio's dates (-1 where a candidate has no row)
+    Columns are gathered, aligned and scored in blocks that fit params['max_bytes'], no copy of the whole shard is made."""
+    n_cols = columns.stop-columns.start if isinstance(columns, slice) else len(columns)
+    # a block's aligned copy plus the three work arrays of cwarp_batch
+    width = _block_width(max(len(_candidates), len(rows)), n_cols, params['max_bytes'], arrays=4)
+    parts = []
+    for first in range(0, n_cols, width):
+        block = _candidates[:, _shard_columns(columns, first, min(first+width, n_cols))]
+        # standalone statistics over each candidate's own history, not the union calendar it is stored on
+        asset_stats = batch_metrics(block, risk_free=params['risk_free_rate'], periodicity=params['periodicity'], own_history=True)
+        aligned = block[np.maximum(rows, 0)]
+        aligned[rows < 0] = np.nan
+        out = cwarp_batch(aligned, replace_port, **params)
+        del aligned
+        # standalone statistics of each candidate are reported next to the new portfolio's
+        for key in ('Sharpe', 'Sortino', 'Max_DD'):
+            out['Asset_'+key] = asset_stats[key]
+        present = ~np.isnan(block)
+        out['First_Row'] = np.where(present.any(axis=0), np.argmax(present, axis=0), -1)
+        out['Last_Row'] = np.where(present.any(axis=0), len(block)-1-np.argmax(present[::-1], axis=0), -1)
+        parts.append(out)
+    return columns, {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+#Pre-Screen#################################################################################
+def _approximate(candidates, rows, replace_port, params):
+    """approximate CWARP of every candidate column against one replacement portfolio, aligned in blocks of columns"""
+    n_assets = candidates.shape[1]
+    width = _block_width(len(rows), n_assets, params['max_bytes'], arrays=3)
+    approx = np.empty(n_assets)
+    for first in range(0, n_assets, width):
+        aligned = candidates[:, first:first+width][np.maximum(rows, 0)]
+        aligned[rows < 0] = np.nan
+        approx[first:first+width] = cwarp_approx(aligned, replace_port, **params)['CWARP']
+    return approx
+
+def prune(approx, top_k=None, threshold=None, margin=0.05):
+    """Candidates worth scoring exactly, from their approximate CWARPs.
+    top_k - keep candidates that may reach the top_k highest CWARPs
+    threshold - keep candidates that may reach a CWARP of threshold (with top_k as well, the higher cutoff applies)
+    margin - shortfall allowed against the cutoff, relative to 1+CWARP/100, as the approximation is typically a few percent off
+    Candidates without an approximate CWARP (NaN) are always kept. Returns (keep mask, cutoff CWARP)."""
+    cutoff = -np.inf
+    finite = np.sort(approx[~np.isnan(approx)])
+    if top_k is not None and len(finite) > top_k: cutoff = finite[-top_k]
+    if threshold is not None: cutoff = max(cutoff, threshold)
+    return ~(approx+100 < (cutoff+100)*(1-margin)), cutoff
+
+def ranking_agreement(approx, exact, keep, top_k=None, threshold=None):
+    """How well a pre-screen ranked the universe, given the exact CWARP of every candidate (a full run).
+    Returns a dict of 'spearman', the rank correlation of approximate and exact CWARPs, 'targets', the number of candidates pruning
+    had to keep (exact top_k, at or above threshold), 'recall', the share of them that survived, and 'missed', those pruned by mistake."""
+    both = ~np.isnan(approx) & ~np.isnan(exact)
+    spearman = pd.Series(approx[both]).rank().corr(pd.Series(exact[both]).rank())
+    order = np.argsort(-np.where(np.isnan(exact), -np.inf, exact), kind='stable')
+    targets = order[:top_k] if top_k is not None else order
+    targets = targets[~np.isnan(exact[targets])]
+    if threshold is not None: targets = targets[exact[targets] >= threshold]
+    survived = keep[targets]
+    return {'spearman': spearman, 'targets': len(targets), 'recall': survived.mean() if len(targets) else 1.0,
+            'missed': int((~survived).sum())}
+
+def _column_index(columns):
+    """a slice for a run of consecutive columns, so the shard stays a view of the shared matrix"""
+    if len(columns) and columns[-1]-columns[0] == len(columns)-1: return slice(int(columns[0]), int(columns[-1])+1)
+    return columns
+
+#Screen#####################################################################################
+def screen(candidates, dates, tickers, portfolios, risk_free_rate=0, financing_rate=0, weight_asset=0.25, weight_replace_port=1,
+           periodicity=252, workers=1, shard_size=None, store_path=None, store_rows=None, max_bytes=None,
+           prescreen_top=None, prescreen_threshold=None, prescreen_margin=0.05, report=None):
+    """Scores every candidate column against every replacement portfolio and ranks them by CWARP.
+    candidates - (time x assets) float64 or float32 return matrix on the calendar dates (a ReturnStore's values when store_path is given)
+    tickers - candidate label of every column
+    portfolios - dict of portfolio name -> replacement portfolio return Series
+    workers - number of processes, 1 scores everything in this process (deterministic, used by tests)
+    shard_size - candidate columns per task, defaults to about four tasks per worker (fewer columns if max_bytes requires)
+    store_path - path of the ReturnStore whose window store_rows=(first_row, last_row) is candidates, workers then map the store instead of shared memory
+    max_bytes - memory budget for the scratch space of each shard (see cwarp_batch), default scores a whole shard at once
+    prescreen_top, prescreen_threshold, prescreen_margin - score exactly only candidates whose approximate CWARP may reach the top
+             prescreen_top or prescreen_threshold (see prune), pruned candidates are left out and 'Approx_CWARP' is added
+    report - optional dict, filled with each portfolio's pre-screen: 'candidates', 'pruned', 'cutoff' and the 'approx' and 'keep' arrays
+    Returns a DataFrame with one row per (portfolio, candidate), sorted by portfolio and CWARP rank."""
+    global _candidates
+    n_assets = candidates.shape[1]
+    if shard_size is None:
+        shard_size = max(1, -(-n_assets // (4*workers)))
+        # with a memory budget every shard is one block of columns that fits it
+        if max_bytes is not None: shard_size = min(shard_size, _block_width(len(dates), n_assets, max_bytes, arrays=4))
+    params = dict(risk_free_rate=risk_free_rate, financing_rate=financing_rate, weight_asset=weight_asset,
+                  weight_replace_port=weight_replace_port, periodicity=periodicity, max_bytes=max_bytes)
+    prescreen = prescreen_top is not None or prescreen_threshold is not None
+    approximations = {}
+    tasks = []
+    for name, replace_port in portfolios.items():
+        rows = dates.get_indexer(replace_port.index)
+        replace_port = np.asarray(replace_port, dtype=float)
+        columns = np.arange(n_assets)
+        if prescreen:
+            approximations[name] = approx = _approximate(candidates, rows, replace_port, params)
+            keep, cutoff = prune(approx, top_k=prescreen_top, threshold=prescreen_threshold, margin=prescreen_margin)
+            columns = np.flatnonzero(keep)
+            if report is not None:
+                report[name] = {'candidates': n_assets, 'pruned': n_assets-len(columns), 'cutoff': cutoff, 'approx': approx, 'keep': keep}
+        for first in range(0, len(columns), shard_size):
+            tasks.append((name, _column_index(columns[first:first+shard_size]), rows, replace_port))
+
+    if workers == 1:
+        _candidates = candidates
+        results = [_score_shard(columns, rows, replace_port, params) for name, columns, rows, replace_port in tasks]
+    else:
+        shm = None
+        if store_path is not None:
+            initializer, initargs = _attach_store, (store_path,)+tuple(store_rows)
+        else:
+            # one copy of the matrix into shared memory, column-major so every shard is a contiguous block
+            shm = shared_memory.SharedMemory(create=True, size=max(candidates.nbytes, 1))
+            shared = np.ndarray(candidates.shape, dtype=candidates.dtype, buffer=shm.buf, order='F')
+            shared[:] = candidates
+            initializer, initargs = _attach_shared, (shm.name, candidates.shape, candidates.dtype)
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as pool:
+                futures = [pool.submit(_score_shard, columns, rows, replace_port, params)
+                           for name, columns, rows, replace_port in tasks]
+                results = [future.result() for future in futures]
+        finally:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
+    tickers = np.asarray(tickers, dtype=object)
+    tables = []
+    for (name, columns, rows, replace_port), (_, out) in zip(tasks, results):
+        table = pd.DataFrame({key: value for key, value in out.items() if key not in ('First_Row', 'Last_Row')})
+        table.insert(0, 'Ticker', tickers[columns])
+        table.insert(0, 'Portfolio', name)
+        if prescreen: table['Approx_CWARP'] = approximations[name][columns]
+        table['Start_Date'] = [dates[i].date() if i >= 0 else None for i in out['First_Row']]
+        table['End_Date'] = [dates[i].date() if i >= 0 else None for i in out['Last_Row']]
+        tables.append(table)
+    table = pd.concat(tables, ignore_index=True)
+    table.insert(2, 'Rank', table.groupby('Portfolio', sort=False)['CWARP'].rank(ascending=False, method='min'))
+    return table.sort_values(['Portfolio', 'Rank'], kind='stable').reset_index(drop=True)
+
+#Command Line###############################################################################
+def _candidate_matrix(returns, tickers, dtype=float):
+    """(dates, matrix) of the candidates' returns on the union of their dates, column-major and cast column by column,
+    so float32 storage never goes through a float64 copy of the whole universe"""
+    index = [np.asarray(returns[ticker].index, dtype='datetime64[ns]') for ticker in tickers]
+    calendar = np.unique(np.concatenate(index)) if index else np.array([], dtype='datetime64[ns]')
+    candidates = np.full((len(calendar), len(tickers)), np.nan, dtype=dtype, order='F')
+    for k, ticker in enumerate(tickers):
+        candidates[np.searchsorted(calendar, index[k]), k] = np.asarray(returns[ticker], dtype=float)
+    return pd.DatetimeIndex(calendar), candidates
+
+def _provider(spec):
+    if spec == 'yahoo': return YahooProvider()
+    if spec == 'synthetic': return SyntheticProvider()
+    if spec.startswith('csv:'): return CsvDirectoryProvider(spec[4:])
+    raise ValueError(f'unknown provider {spec}, expected yahoo, synthetic or csv:DIRECTORY')
+
+def _read_universe(args):
+    tickers = []
+    if args.universe: tickers += args.universe.replace(' ','').split(',')
+    if args.universe_file:
+        with open(args.universe_file) as f:
+            tickers += f.read().replace(',', '\n').split()
+    return [ticker for ticker in dict.fromkeys(tickers) if ticker]
+
+def _parse_portfolio_arg(spec, i):
+    """'name=fraction_1, symbol_1, ...' (name optional)"""
+    name, _, port_string = spec.rpartition('=')
+    return (name or f'Portfolio_{i+1}'), parse_portfolio(port_string)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rank a universe of candidate assets by CWARP against replacement portfolios.')
+    parser.add_argument('--universe', help='comma separated candidate tickers')
+    parser.add_argument('--universe-file', help='file of candidate tickers, one per line or comma separated')
+    parser.add_argument('--store', help='ReturnStore directory holding the candidate universe (candidates default to all of its tickers)')
+    parser.add_argument('--portfolio', action='append', required=True,
+                        help='replacement portfolio "name=fraction_1, symbol_1, fraction_2, symbol_2...", may be repeated')
+    parser.add_argument('--start', default='2007-07-01')
+    parser.add_argument('--end', default='2020-12-31')
+    parser.add_argument('--weight-asset', type=float, default=0.25)
+    parser.add_argument('--weight-replace-port', type=float, default=1.0)
+    parser.add_argument('--risk-free-rate', type=float, default=0.005)
+    parser.add_argument('--financing-rate', type=float, default=0.01)
+    parser.add_argument('--periodicity', type=int, default=252)
+    parser.add_argument('--provider', default='yahoo', help='yahoo, synthetic or csv:DIRECTORY')
+    parser.add_argument('--cache-dir', default='.cwarp_cache')
+    parser.add_argument('--offline', action='store_true', help='serve prices from the cache only')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='processes, 1 runs single-process and deterministic')
+    parser.add_argument('--shard-size', type=int, help='candidate columns per task')
+    parser.add_argument('--max-memory', type=float, help='scratch memory per shard in MB, shards are scored in column blocks that fit it')
+    parser.add_argument('--float32', action='store_true', help='hold downloaded candidate returns as float32 (statistics still accumulate in float64)')
+    parser.add_argument('--prescreen-top', type=int, help='score exactly only candidates whose approximate CWARP may reach the top K')
+    parser.add_argument('--prescreen-threshold', type=float, help='score exactly only candidates whose approximate CWARP may reach T')
+    parser.add_argument('--prescreen-margin', type=float, default=0.05, help='relative shortfall of 1+CWARP/100 a pruned candidate must exceed')
+    parser.add_argument('--validate-prescreen', action='store_true', help='also score every candidate and report the pre-screen ranking agreement')
+    parser.add_argument('--out', required=True, help='output table, .parquet or .csv')
+    args = parser.parse_args(argv)
+
+    source = PriceCache(_provider(args.provider), cache_dir=args.cache_dir, offline=args.offline)
+    portfolios = [_parse_portfolio_arg(spec, i) for i, spec in enumerate(args.portfolio)]
+    legs = [ticker for name, (tickers, weights) in portfolios for ticker in tickers]
+    store = ReturnStore.open(args.store) if args.store else None
+
+    universe = _read_universe(args)
+    if store is not None:
+        if universe: raise SystemExit('--universe cannot be combined with --store, the store defines the candidates')
+        loaded = load_returns(legs, args.start, args.end, source)
+        tickers = store.tickers
+        dates, candidates = store.window(args.start, args.end)
+    else:
+        if not universe: raise SystemExit('no candidates, use --universe, --universe-file or --store')
+        loaded = load_returns(legs+universe, args.start, args.end, source)
+        tickers = [ticker for ticker in universe if ticker in loaded.returns]
+        dates, candidates = _candidate_matrix(loaded.returns, tickers, dtype=np.float32 if args.float32 else float)
+    for ticker, error in loaded.failures.items():
+        print(f'warning: no data for {ticker}: {error}')
+
+    replace_ports = {}
+    for name, (port_tickers, weights) in portfolios:
+        missing = [ticker for ticker in port_tickers if ticker not in loaded.returns]
+        if missing: raise SystemExit(f'no data for holdings {", ".join(missing)} of portfolio {name}')
+        replace_ports[name] = replacement_portfolio(loaded.returns, port_tickers, weights, name=name)
+
+    options = dict(risk_free_rate=args.risk_free_rate, financing_rate=args.financing_rate, weight_asset=args.weight_asset,
+                   weight_replace_port=args.weight_replace_port, periodicity=args.periodicity, workers=args.workers,
+                   shard_size=args.shard_size, store_path=args.store, store_rows=store.rows(args.start, args.end) if store is not None else None,
+                   max_bytes=int(args.max_memory*2**20) if args.max_memory else None)
+    report = {}
+    started = time.perf_counter()
+    table = screen(candidates, dates, tickers, replace_ports, prescreen_top=args.prescreen_top, prescreen_threshold=args.prescreen_threshold,
+                   prescreen_margin=args.prescreen_margin, report=report, **options)
+    elapsed = time.perf_counter()-started
+    for name, outcome in report.items():
+        print(f'pre-screen {name}: pruned {outcome["pruned"]} of {outcome["candidates"]} candidates (cutoff CWARP {outcome["cutoff"]:.2f})')
+    if args.validate_prescreen and report:
+        started = time.perf_counter()
+        full = screen(candidates, dates, tickers, replace_ports, **options)
+        full_elapsed = time.perf_counter()-started
+        for name, outcome in report.items():
+            exact = full[full['Portfolio'] == name].set_index('Ticker')['CWARP'].reindex(tickers).values
+            agreement = ranking_agreement(outcome['approx'], exact, outcome['keep'], top_k=args.prescreen_top, threshold=args.prescreen_threshold)
+            print(f'validation {name}: spearman {agreement["spearman"]:.4f}, kept {agreement["recall"]:.1%} of the {agreement["targets"]} '
+                  f'exact targets ({agreement["missed"]} missed)')
+        print(f'validation: {elapsed:.2f}s pre-screened vs {full_elapsed:.2f}s full')
+    if args.out.endswith('.parquet'): table.to_parquet(args.out, index=False)
+    else: table.to_csv(args.out, index=False)
+    print(f'scored {len(tickers)} candidates against {len(replace_ports)} portfolio(s) -> {args.out}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,364 @@
+"""Local HTTP service scoring candidate assets by CWARP, for programmatic use without the Streamlit app.
+
+POST /score with a JSON body such as
+    {"portfolio": ".6, spy, .4, ief", "candidates": "qqq, lqd, gld", "start": "2007-07-01", "end": "2020-12-31",
+     "weight_asset": 0.25, "weight_replace_port": 1, "risk_free_rate": 0.005, "financing_rate": 0.01,
+     "join": "inner", "name": "Plain 60/40"}
+returns the two tables the app shows, risk_ret and new_risk_ret, in pandas' 'split' layout (index, columns, data).
+Omitted fields take the app's defaults. GET /metrics reports latency percentiles, throughput, cache and coalescing
+counters, and GET /health answers immediately.
+
+The service runs on the standard library's asyncio. Identical requests that arrive while one is being computed share
+that computation. Finished results are kept in a MemoCache keyed by the normalized inputs. Scoring runs on a process
+(or thread) pool, so the event loop keeps serving metrics, cache hits and new connections meanwhile.
+
+Example:
+    python cwarp_service.py --provider synthetic --port 8050
+    curl -d '{"portfolio": ".6, spy, .4, ief", "candidates": "qqq, gld"}' localhost:8050/score
+    python cwarp_service.py --provider synthetic --load-test 500 --concurrency 32
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+from http import HTTPStatus
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from cwarp_defs import cwarp_tables
+from cwarp_data import PriceCache, load_returns, parse_portfolio, build_panel, PANEL_JOINS
+from cwarp_cache import MemoCache
+from cwarp_screen import _provider
+
+DEFAULTS = dict(start='2007-07-01', end='2020-12-31', weight_asset=0.25, weight_replace_port=1.0, risk_free_rate=0.005,
+                financing_rate=0.01, periodicity=252, join='inner', name='Replacement Portfolio', min_periods=100)
+MAX_BODY = 2**20
+
+#Scoring####################################################################################
+_source = None   # PriceCache of this worker, set by _init_worker
+
+def _init_worker(provider, cache_dir, offline):
+    """pool initializer: every worker reads prices through its own PriceCache on the shared cache directory,
+    which locks each entry across processes while it is read or written"""
+    global _source
+    _source = PriceCache(_provider(provider), cache_dir=cache_dir, offline=offline)
+
+def parse_request(body):
+    """Validated scoring parameters from a request body (dict), with the defaults filled in.
+    Raises ValueError on malformed input. Returns (key, params), key identifies the result for caching and coalescing."""
+    if not isinstance(body, dict): raise ValueError('request body must be a JSON object')
+    unknown = set(body)-set(DEFAULTS)-{'portfolio', 'candidates'}
+    if unknown: raise ValueError(f'unknown fields: {", ".join(sorted(unknown))}')
+    params = dict(DEFAULTS, **body)
+    if 'portfolio' not in body: raise ValueError('portfolio is required, e.g. ".6, spy, .4, ief"')
+    candidates = body.get('candidates', [])
+    if isinstance(candidates, str): candidates = candidates.replace(' ','').split(',')
+    params['candidates'] = [ticker for ticker in dict.fromkeys(candidates) if ticker]
+    if not params['candidates']: raise ValueError('candidates must name at least one ticker')
+    portfolio = body['portfolio']
+    # parse_portfolio drops a trailing fraction without a symbol
+    if isinstance(portfolio, str) and len(portfolio.split(',')) % 2: portfolio = ''
+    tickers, weights = parse_portfolio(portfolio) if isinstance(portfolio, str) else portfolio
+    if not tickers or len(tickers) != len(weights): raise ValueError('portfolio must be "fraction_1, symbol_1, fraction_2, symbol_2..."')
+    params['portfolio'] = (list(tickers), [float(weight) for weight in weights])
+    if params['join'] not in PANEL_JOINS: raise ValueError(f'join must be one of {", ".join(PANEL_JOINS)}')
+    for field in ('weight_asset', 'weight_replace_port', 'risk_free_rate', 'financing_rate'):
+        params[field] = float(params[field])
+    params['periodicity'] = int(params['periodicity'])
+    params['start'], params['end'] = str(pd.Timestamp(params['start']).date()), str(pd.Timestamp(params['end']).date())
+    key = (tuple(params['candidates']), tuple(params['portfolio'][0]), tuple(params['portfolio'][1]))+tuple(
+        params[field] for field in ('start', 'end', 'weight_asset', 'weight_replace_port', 'risk_free_rate', 'financing_rate',
+                                    'periodicity', 'join', 'name', 'min_periods'))
+    return key, params
+
+def _table_json(df):
+    """DataFrame as a JSON-ready dict of index, columns and data (dates as ISO strings, NaN as null)"""
+    return json.loads(df.to_json(orient='split', date_format='iso', default_handler=str))
+
+def score(params, source=None):
+    """the app's scoring steps for one parsed request: returns with a minimum history, panel, CWARP tables.
+    Raises LookupError when a replacement portfolio holding has no data."""
+    source = source if source is not None else _source
+    legs, weights = params['portfolio']
+    loaded = load_returns(legs+params['candidates'], params['start'], params['end'], source)
+    failures = dict(loaded.failures)
+    returns = {}
+    for ticker, series in loaded.returns.items():
+        if series.shape[0] < params['min_periods']:
+            failures[ticker] = 'no prices.'
+            continue
+        # first return in the range is left missing, as with pct_change of the range's closes
+        series = series.copy()
+        series.iloc[:1] = np.nan
+        returns[ticker] = series
+    missing_legs = [ticker for ticker in legs if ticker not in returns]
+    if missing_legs: raise LookupError(f'no data for replacement portfolio holdings {", ".join(missing_legs)}')
+    candidates = [ticker for ticker in params['candidates'] if ticker in returns]
+    if not candidates: raise LookupError('no data for any candidate')
+
+    panel = build_panel(returns, legs, weights, candidates, join=params['join'], name=params['name'])
+    risk_ret_df, new_risk_ret_df = cwarp_tables(new_assets=panel.candidates, replace_port=panel.replace_port,
+                                                risk_free_rate=params['risk_free_rate'], financing_rate=params['financing_rate'],
+                                                weight_asset=params['weight_asset'], weight_replace_port=params['weight_replace_port'],
+                                                periodicity=params['periodicity'], history=panel.overlap)
+    return {'risk_ret': _table_json(risk_ret_df), 'new_risk_ret': _table_json(new_risk_ret_df), 'failures': failures}
+
+#Metrics####################################################################################
+class ServiceMetrics:
+    """Latency and throughput per route over the last `window` requests, plus counters (e.g. cache hits, coalesced requests)."""
+
+    def __init__(self, window=10_000):
+        self.started = time.monotonic()
+        self.window = window
+        self._latency = {}   # route -> deque of (finished at, seconds, status)
+        self.totals = {}
+        self.counters = {}
+
+    def record(self, route, seconds, status):
+        self._latency.setdefault(route, deque(maxlen=self.window)).append((time.monotonic(), seconds, status))
+        self.totals[route] = self.totals.get(route, 0)+1
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0)+n
+
+    def snapshot(self, recent=60.0):
+        """dict of uptime, counters and, per route, request count, error count, mean/p50/p95/p99/max latency in ms and requests per second
+        over the whole uptime and the last `recent` seconds"""
+        now = time.monotonic()
+        uptime = now-self.started
+        routes = {}
+        for route, events in self._latency.items():
+            seconds = np.array([event[1] for event in events])*1e3
+            routes[route] = {'requests': self.totals[route],
+                             'errors': sum(event[2] >= 400 for event in events),
+                             'mean_ms': seconds.mean(),
+                             'p50_ms': np.percentile(seconds, 50), 'p95_ms': np.percentile(seconds, 95),
+                             'p99_ms': np.percentile(seconds, 99), 'max_ms': seconds.max(),
+                             'rps': self.totals[route]/uptime,
+                             'recent_rps': sum(event[0] >= now-recent for event in events)/min(recent, uptime)}
+        return {'uptime_s': uptime, 'counters': dict(self.counters), 'routes': routes}
+
+#HTTP Service###############################################################################
+async def _read_message(reader):
+    """start line, lower-cased headers and body of one HTTP/1.1 message, or None when the peer closed the connection"""
+    start = await reader.readline()
+    if not start: return None
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''): break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY: raise ValueError('request body too large')
+    body = await reader.readexactly(length) if length else b''
+    return start.decode('latin-1').rstrip('\r\n'), headers, body
+
+def _response(status, payload, keep_alive=True):
+    body = json.dumps(payload, default=str).encode()
+    head = (f'HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+    return head.encode('latin-1')+body
+
+class CwarpService:
+    """asyncio HTTP front end of score().
+    provider - price provider spec as in cwarp_screen: 'yahoo', 'synthetic' (deterministic stub, no network) or 'csv:DIRECTORY'
+    workers - size of the executor pool running score()
+    executor - 'process' (default, scoring never holds up the event loop) or 'thread' (lighter, shares one PriceCache)
+    memo_mb - bound of the result cache"""
+
+    def __init__(self, provider='synthetic', cache_dir='.cwarp_cache', offline=False, workers=None, executor='process', memo_mb=256):
+        workers = workers or os.cpu_count()
+        if executor == 'process':
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(provider, cache_dir, offline))
+            self.source = None
+        elif executor == 'thread':
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+            self.source = PriceCache(_provider(provider), cache_dir=cache_dir, offline=offline)
+        else:
+            raise ValueError(f"executor must be 'process' or 'thread', not {executor}")
+        self.memo = MemoCache(max_bytes=memo_mb*2**20)
+        self.metrics = ServiceMetrics()
+        self._inflight = {}   # key -> future of the computation every identical request waits on
+        self._connections = {}   # task -> writer of every open connection
+        self.server = None
+
+    async def score(self, body):
+        """(result, how) for a request body, how is 'cache', 'coalesced' or 'computed'"""
+        key, params = parse_request(body)
+        result = self.memo.get('score', key)
+        if result is not None:
+            self.metrics.count('cache_hits')
+            return result, 'cache'
+        future = self._inflight.get(key)
+        if future is not None:
+            self.metrics.count('coalesced')
+            return await asyncio.shield(future), 'coalesced'
+
+        loop = asyncio.get_running_loop()
+        future = self._inflight[key] = loop.create_future()
+        started = time.perf_counter()
+        try:
+            result = await loop.run_in_executor(self.executor, score, params, self.source)
+        except Exception as ex:
+            future.set_exception(ex)
+            # retrieve it here so an error nobody else was waiting for is not reported as unhandled
+            future.exception()
+            raise
+        else:
+            self.memo.put('score', key, result)
+            future.set_result(result)
+        finally:
+            del self._inflight[key]
+            self.metrics.count('computed')
+            self.metrics.count('compute_ms_total', (time.perf_counter()-started)*1e3)
+        return result, 'computed'
+
+    async def _dispatch(self, method, path, body):
+        """(status, payload) of one request"""
+        if path == '/health' and method == 'GET': return 200, {'status': 'ok'}
+        if path == '/metrics' and method == 'GET':
+            metrics = self.metrics.snapshot()
+            metrics['in_flight'] = len(self._inflight)
+            metrics['cache'] = json.loads(self.memo.stats().to_json(orient='index'))
+            return 200, metrics
+        if path == '/score' and method == 'POST':
+            try:
+                result, how = await self.score(json.loads(body or b'null'))
+            except (ValueError, TypeError) as ex:   # also malformed JSON
+                return 400, {'error': str(ex)}
+            except LookupError as ex:
+                return 422, {'error': str(ex)}
+            except Exception as ex:
+                return 500, {'error': f'{type(ex).__name__}: {ex}'}
+            return 200, dict(result, source=how)
+        if path in ('/health', '/metrics', '/score'): return 405, {'error': f'{method} not allowed on {path}'}
+        return 404, {'error': f'no route {path}'}
+
+    async def _connection(self, reader, writer):
+        """serve requests on one (keep-alive) connection until the client closes it"""
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                try:
+                    message = await _read_message(reader)
+                except (ValueError, asyncio.IncompleteReadError) as ex:
+                    writer.write(_response(400, {'error': str(ex)}, keep_alive=False))
+                    break
+                if message is None: break
+                start_line, headers, body = message
+                started = time.perf_counter()
+                try:
+                    method, target, version = start_line.split(' ', 2)
+                except ValueError:
+                    writer.write(_response(400, {'error': 'malformed request line'}, keep_alive=False))
+                    break
+                path = target.split('?', 1)[0]
+                status, payload = await self._dispatch(method, path, body)
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' and (version != 'HTTP/1.0' or connection == 'keep-alive')
+                writer.write(_response(status, payload, keep_alive))
+                await writer.drain()
+                self.metrics.record(f'{method} {path}', time.perf_counter()-started, status)
+                if not keep_alive: break
+        except ConnectionError:
+            pass
+        finally:
+            del self._connections[task]
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8050):
+        self.server = await asyncio.start_server(self._connection, host, port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            # closing the transports ends every idle keep-alive connection at its next read
+            for writer in list(self._connections.values()): writer.close()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+#Load Test##################################################################################
+async def _request(reader, writer, method, path, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else b''
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n'.encode()+body)
+    await writer.drain()
+    start_line, headers, body = await _read_message(reader)
+    return int(start_line.split(' ')[1]), json.loads(body)
+
+async def load_test(host, port, payloads, concurrency=16):
+    """Sends every payload to /score over `concurrency` keep-alive connections and returns client side results:
+    requests, errors, seconds, requests per second and latency percentiles in ms"""
+    queue = deque(payloads)
+    latencies, statuses = [], []
+
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            while queue:
+                payload = queue.popleft()
+                started = time.perf_counter()
+                status, _ = await _request(reader, writer, 'POST', '/score', payload)
+                latencies.append(time.perf_counter()-started)
+                statuses.append(status)
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    seconds = time.perf_counter()-started
+    latency = np.array(latencies)*1e3
+    return {'requests': len(statuses), 'errors': sum(status >= 400 for status in statuses), 'seconds': seconds,
+            'rps': len(statuses)/seconds, 'p50_ms': np.percentile(latency, 50), 'p95_ms': np.percentile(latency, 95),
+            'p99_ms': np.percentile(latency, 99), 'max_ms': latency.max()}
+
+def load_test_payloads(n_requests, distinct=8, seed=0):
+    """n_requests scoring requests drawn from `distinct` parameter sets, so a run mixes computed, coalesced and cached results"""
+    rng = np.random.default_rng(seed)
+    universe = ['qqq', 'lqd', 'hyg', 'tlt', 'ief', 'shy', 'gld', 'slv', 'efa', 'eem', 'iyr', 'xle', 'xlk', 'xlf']
+    variants = [{'portfolio': '.6, spy, .4, ief', 'candidates': list(rng.choice(universe, size=8, replace=False)),
+                 'weight_asset': round(0.05*(1+i % 10), 2)} for i in range(distinct)]
+    return [variants[i] for i in rng.integers(0, distinct, size=n_requests)]
+
+#Command Line###############################################################################
+async def _serve(args):
+    service = CwarpService(provider=args.provider, cache_dir=args.cache_dir, offline=args.offline, workers=args.workers,
+                           executor=args.executor, memo_mb=args.memo_mb)
+    host, port = await service.start(args.host, 0 if args.load_test else args.port)
+    try:
+        if not args.load_test:
+            print(f'serving CWARP on http://{host}:{port} (POST /score, GET /metrics, GET /health)')
+            await service.server.serve_forever()
+            return
+        result = await load_test(host, port, load_test_payloads(args.load_test, distinct=args.distinct), concurrency=args.concurrency)
+        print(json.dumps({'client': result, 'server': service.metrics.snapshot()}, indent=1, default=float))
+    finally:
+        await service.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve CWARP scores over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--provider', default='yahoo', help='yahoo, synthetic (stub, no network) or csv:DIRECTORY')
+    parser.add_argument('--cache-dir', default='.cwarp_cache')
+    parser.add_argument('--offline', action='store_true', help='serve prices from the cache only')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='executor pool size')
+    parser.add_argument('--executor', default='process', choices=('process', 'thread'))
+    parser.add_argument('--memo-mb', type=int, default=256, help='result cache size in MB')
+    parser.add_argument('--load-test', type=int, default=0, metavar='N', help='send N requests to an in-process service and report, then exit')
+    parser.add_argument('--concurrency', type=int, default=16, help='load test connections')
+    parser.add_argument('--distinct', type=int, default=8, help='distinct requests among the load test requests')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+#Memory-Mapped Return Store#################################################################
+class ReturnStore:
+    """Columnar store of aligned returns for a large universe: one calendar, one memory-mapped (time x assets) float array
+    and a ticker -> column index, kept in a directory as dates.npy, returns.npy and tickers.json.
+    The array is column-major (Fortran order), so every asset's history is contiguous on disk and only the pages
+    actually read are loaded. Date-range slices are views of the mapping, never copies, and can be passed straight
+    to the cwarp_defs batch and rolling functions (np.asarray of a float64 view does not copy)."""
+
+    def __init__(self, path, dates, tickers, values):
+        self.path = path
+        self.dates = dates
+        self.tickers = tickers
+        self.columns = {ticker: i for i, ticker in enumerate(tickers)}
+        self.values = values
+
+    @classmethod
+    def create(cls, path, dates, tickers, dtype=np.float64):
+        """new store with every return missing (NaN), opened for writing"""
+        os.makedirs(path, exist_ok=True)
+        dates = pd.DatetimeIndex(dates)
+        np.save(os.path.join(path, 'dates.npy'), dates.values.astype('datetime64[ns]'))
+        with open(os.path.join(path, 'tickers.json'), 'w') as f:
+            json.dump(list(tickers), f)
+        values = np.lib.format.open_memmap(os.path.join(path, 'returns.npy'), mode='w+', dtype=dtype,
+                                           shape=(len(dates), len(tickers)), fortran_order=True)
+        values[:] = np.nan
+        return cls(path, dates, list(tickers), values)
+
+    @classmethod
+    def open(cls, path, mode='r'):
+        """open an existing store, read-only by default ('r+' to update it in place)"""
+        dates = pd.DatetimeIndex(np.load(os.path.join(path, 'dates.npy')))
+        with open(os.path.join(path, 'tickers.json')) as f:
+            tickers = json.load(f)
+        values = np.load(os.path.join(path, 'returns.npy'), mmap_mode=mode)
+        return cls(path, dates, tickers, values)
+
+    @classmethod
+    def from_returns(cls, path, returns, dates=None, dtype=np.float64):
+        """build a store from a dict of ticker -> return Series (or a DataFrame), one column at a time.
+        dates - calendar of the store, defaults to the union of all the series' dates"""
+        if isinstance(returns, pd.DataFrame): returns = {ticker: returns[ticker] for ticker in returns.columns}
+        if dates is None:
+            dates = pd.DatetimeIndex([])
+            for series in returns.values(): dates = dates.union(series.index)
+        store = cls.create(path, dates, list(returns), dtype=dtype)
+        for ticker, series in returns.items():
+            store.write(ticker, series)
+        store.flush()
+        return store
+
+    def write(self, ticker, series):
+        """store a return Series in the ticker's column, dates outside the calendar are dropped"""
+        rows = self.dates.get_indexer(series.index)
+        found = rows >= 0
+        self.values[rows[found], self.columns[ticker]] = np.asarray(series, dtype=self.values.dtype)[found]
+
+    def flush(self):
+        if isinstance(self.values, np.memmap): self.values.flush()
+
+    def rows(self, bop=None, eop=None):
+        """row range [i, j) of the calendar between bop and eop (inclusive, either may be None)"""
+        i = 0 if bop is None else self.dates.searchsorted(pd.Timestamp(bop), side='left')
+        j = len(self.dates) if eop is None else self.dates.searchsorted(pd.Timestamp(eop), side='right')
+        return i, j
+
+    def window(self, bop=None, eop=None):
+        """(dates, values) between bop and eop for every asset, values is a zero-copy view of the mapping"""
+        i, j = self.rows(bop, eop)
+        return self.dates[i:j], self.values[i:j]
+
+    def column(self, ticker, bop=None, eop=None):
+        """returns of one asset between bop and eop as a zero-copy (contiguous) view"""
+        i, j = self.rows(bop, eop)
+        return self.values[i:j, self.columns[ticker]]
+
+    def block(self, first, last, bop=None, eop=None):
+        """columns first..last-1 between bop and eop as a zero-copy view, e.g. one shard of the universe"""
+        i, j = self.rows(bop, eop)
+        return self.values[i:j, first:last]
+
+    def frame(self, tickers=None, bop=None, eop=None):
+        """copy of the selected assets between bop and eop as a DataFrame, for small selections and display"""
+        i, j = self.rows(bop, eop)
+        tickers = self.tickers if tickers is None else list(tickers)
+        cols = [self.columns[ticker] for ticker in tickers]
+        return pd.DataFrame(self.values[i:j][:, cols], index=self.dates[i:j], columns=tickers)
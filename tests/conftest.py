@@ -0,0 +1,21 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+# the cwarp modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(7)
+
+def random_returns(rng, n_obs, n_cols=None, start='2010-01-01', vol=0.01, drift=0.0003, missing=0.0):
+    """business day return Series (n_cols None) or DataFrame of normal returns, a share `missing` of them NaN"""
+    shape = (n_obs,) if n_cols is None else (n_obs, n_cols)
+    values = rng.normal(drift, vol, size=shape)
+    if missing: values[rng.random(shape) < missing] = np.nan
+    index = pd.bdate_range(start, periods=n_obs)
+    if n_cols is None: return pd.Series(values, index=index)
+    return pd.DataFrame(values, index=index, columns=[f'A{i}' for i in range(n_cols)])
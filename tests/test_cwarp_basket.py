@@ -0,0 +1,75 @@
+import itertools
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import random_returns
+from cwarp_core import batch_metrics, cwarp_approx, cwarp_batch, _periodic_rate
+from cwarp_basket import cwarp_basket
+
+@pytest.fixture
+def universe(rng):
+    """candidates with a spread of betas to the replacement portfolio, a few of them listed late"""
+    n_obs, n_assets = 1500, 40
+    market = rng.normal(0.0004, 0.01, n_obs)
+    betas = rng.uniform(-0.6, 1.0, n_assets)
+    candidates = random_returns(rng, n_obs, n_assets, vol=0.008, drift=0.0002)+market[:, None]*betas
+    candidates.iloc[:300, :5] = np.nan
+    replace_port = pd.Series(market+rng.normal(0.0001, 0.002, n_obs), index=candidates.index)
+    return candidates, replace_port
+
+def _basket_cwarp(candidates, replace_port, weights, financing_rate=0, risk_free_rate=0):
+    """exact CWARP of the replacement portfolio plus the financed legs, rebuilt from every leg"""
+    financing = _periodic_rate(financing_rate)
+    new_port = replace_port.copy()
+    for ticker, weight in weights.items():
+        new_port = new_port+(candidates[ticker]-financing)*weight
+    replace_stats = batch_metrics(replace_port, risk_free=risk_free_rate)
+    stats = batch_metrics(new_port, risk_free=risk_free_rate)
+    return ((stats['Sortino']/replace_stats['Sortino']*stats['Ret_To_MaxDD']/replace_stats['Ret_To_MaxDD'])**(1/2)-1)[0]*100
+
+def test_approx_weight_grid_matches_single_weights(universe):
+    candidates, replace_port = universe
+    weights = np.array([0.1, 0.25, 0.5])
+    grid = cwarp_approx(candidates, replace_port, weight_asset=weights[:, None], financing_rate=0.02)
+    for i, weight in enumerate(weights):
+        single = cwarp_approx(candidates, replace_port, weight_asset=weight, financing_rate=0.02)
+        for key in single:
+            np.testing.assert_allclose(grid[key][i], single[key], rtol=1e-10)
+
+def test_passed_replacement_stats(universe):
+    candidates, replace_port = universe
+    replace_stats = batch_metrics(replace_port)
+    for function in (cwarp_batch, cwarp_approx):
+        np.testing.assert_allclose(function(candidates, replace_port, replace_stats=replace_stats)['CWARP'],
+                                   function(candidates, replace_port)['CWARP'])
+
+def test_greedy_picks_match_exhaustive_scoring(universe):
+    candidates, replace_port = universe
+    basket = cwarp_basket(candidates, replace_port, weights_asset=(0.1, 0.25), max_assets=3, swaps=False)
+    assert basket.cwarp == pytest.approx(_basket_cwarp(candidates, replace_port, basket.weights))
+    # every forward step picks the best of all (candidate, weight) pairs scored exactly
+    chosen = {}
+    for ticker, weight in basket.weights.items():
+        trials = {(t, w): _basket_cwarp(candidates, replace_port, {**chosen, t: w})
+                  for t, w in itertools.product(candidates.columns, (0.1, 0.25)) if t not in chosen}
+        assert max(trials, key=lambda pair: np.nan_to_num(trials[pair], nan=-np.inf)) == (ticker, weight)
+        chosen[ticker] = weight
+
+@pytest.mark.parametrize('kwargs', [dict(weights_asset=(0.1, 0.2, 0.3), max_assets=4),
+                                    dict(weights_asset=(0.25,), max_assets=3, financing_rate=0.02, risk_free_rate=0.01)])
+def test_shortlist_matches_exact_scoring(universe, kwargs):
+    candidates, replace_port = universe
+    exact = cwarp_basket(candidates, replace_port, shortlist=None, **kwargs)
+    fast = cwarp_basket(candidates, replace_port, **kwargs)
+    pd.testing.assert_series_equal(fast.weights, exact.weights)
+    assert fast.cwarp == pytest.approx(exact.cwarp)
+    assert list(fast.history['Ticker']) == list(exact.history['Ticker'])
+
+def test_caps_and_pool(universe):
+    candidates, replace_port = universe
+    basket = cwarp_basket(candidates, replace_port, weights_asset=(0.2, 0.3), max_assets=5, max_total_weight=0.5)
+    assert basket.weights.sum() <= 0.5+1e-12 and len(basket.weights) <= 5
+    assert basket.history['CWARP'].is_monotonic_increasing
+    pooled = cwarp_basket(candidates, replace_port, weights_asset=(0.2, 0.3), max_assets=5, max_total_weight=0.5, n_jobs=2, shard_size=7)
+    pd.testing.assert_series_equal(pooled.weights, basket.weights)
+    assert pooled.cwarp == basket.cwarp
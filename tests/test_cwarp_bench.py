@@ -0,0 +1,58 @@
+import json
+import numpy as np
+import pytest
+import cwarp_bench as bench
+
+#Synthetic Data#############################################################################
+def test_synthetic_returns_shape_and_missing_share():
+    values = bench.synthetic_returns(20000, 3, nan_density=0.1, seed=1)
+    assert values.shape == (20000, 3) and values.flags.f_contiguous
+    assert np.isnan(values[0]).all()
+    assert np.isnan(values[1:]).mean() == pytest.approx(0.1, abs=0.01)
+    np.testing.assert_array_equal(values, bench.synthetic_returns(20000, 3, nan_density=0.1, seed=1))
+
+def test_stub_provider_serves_prices_without_missing_days():
+    provider, calendar = bench.stub_provider(['spy', 'ief'], 500, nan_density=0.05)
+    close = provider.fetch('spy', calendar[0], calendar[-1]+np.timedelta64(1, 'D'))
+    assert close.notna().all() and close.index.isin(calendar).all()
+    assert 400 < len(close) < 500
+
+#Suite and Baselines########################################################################
+def test_run_suite_records_every_group():
+    records = bench.run_suite((300,), (3,), (0.0, 0.05), repeat=1, min_time=0.001, log=lambda line: None)
+    groups = {record['group'] for record in records}
+    assert groups == {'metric', 'cwarp', 'batch', 'pipeline'}
+    assert all(record['best_s'] > 0 and record['median_s'] >= record['best_s'] for record in records)
+    pipeline = {record['name'] for record in records if record['group'] == 'pipeline'}
+    assert pipeline == {'load', 'panel', 'score', 'plot_data', 'total'}
+
+def test_run_suite_filter_and_cell_limit():
+    records = bench.run_suite((300,), (3, 50), (0.0,), pattern='^batch\\.cwarp', max_cells=1000, repeat=1, min_time=0.001,
+                              log=lambda line: None)
+    assert [(record['name'], record['n_assets']) for record in records] == [('cwarp_batch', 3)]
+
+def test_compare_flags_regressions_and_improvements():
+    def record(name, seconds):
+        return {'group': 'batch', 'name': name, 'n_obs': 100, 'n_assets': 1, 'nan_density': 0.0, 'best_s': seconds}
+    baseline = {'results': [record('slower', 1.0), record('faster', 1.0), record('same', 1.0), record('dropped', 1.0)]}
+    table = bench.compare([record('slower', 1.5), record('faster', 0.5), record('same', 1.1), record('new', 1.0)], baseline, threshold=0.25)
+    assert dict(zip(table['name'], table['status'])) == {'slower': 'regression', 'faster': 'improvement', 'same': ''}
+    assert table.set_index('name').loc['slower', 'ratio'] == pytest.approx(1.5)
+
+def test_main_exit_status_reports_regressions(tmp_path, monkeypatch):
+    monkeypatch.setattr(bench, 'import_check', lambda: ([], {}))
+    args = ['--lengths', '300', '--assets', '2', '--nan', '0', '--filter', '^metric\\.max_dd$', '--repeat', '1', '--min-time', '0.001']
+    assert bench.main(args+['--out', str(tmp_path/'baseline.json')]) == 0
+    baseline = (tmp_path/'baseline.json').read_text()
+    # a baseline that claims every case used to be much faster
+    fast = json.loads(baseline)
+    for record in fast['results']: record['best_s'] = 1e-12
+    (tmp_path/'fast.json').write_text(json.dumps(fast))
+    assert bench.main(args+['--compare', str(tmp_path/'fast.json')]) == 1
+    assert bench.main(args+['--compare', str(tmp_path/'baseline.json'), '--threshold', '1000']) == 0
+
+#Import Rules###############################################################################
+@pytest.mark.parametrize('module', sorted(bench.IMPORT_RULES))
+def test_modules_stay_import_light(module):
+    best, median, loaded = bench.import_case(module, bench.IMPORT_RULES[module], repeat=1)
+    assert loaded == []
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import random_returns
+from cwarp_core import cole_win_above_replace_port
+from cwarp_bootstrap import bootstrap_indices, cwarp_bootstrap
+
+@pytest.fixture
+def returns(rng):
+    replace_port = random_returns(rng, 500, drift=0.0004)
+    candidates = pd.DataFrame({'hedge': -0.3*replace_port+random_returns(rng, 500, vol=0.006),
+                               'diversifier': random_returns(rng, 500, vol=0.008)})
+    return candidates, replace_port
+
+#Resampled Paths############################################################################
+@pytest.mark.parametrize('method', ['stationary', 'block'])
+def test_indices_stay_in_range_and_blocks_wrap(method):
+    n_obs, block_size = 97, 10
+    idx = bootstrap_indices(n_obs, 200, block_size=block_size, method=method, rng=np.random.default_rng(1))
+    assert idx.shape == (200, n_obs) and idx.min() >= 0 and idx.max() < n_obs
+    continues = idx[:, 1:] == (idx[:, :-1]+1) % n_obs
+    # a block walks forward one row at a time and wraps from the last row back to the first
+    assert ((idx[:, :-1] == n_obs-1) & (idx[:, 1:] == 0)).any()
+    if method == 'block':
+        # new blocks start exactly every block_size rows
+        boundary = np.arange(1, n_obs) % block_size == 0
+        assert continues[:, ~boundary].all()
+
+def test_stationary_block_lengths_have_the_requested_mean():
+    n_obs, n_boot, block_size = 2000, 200, 20
+    idx = bootstrap_indices(n_obs, n_boot, block_size=block_size, rng=np.random.default_rng(2))
+    starts = 1+(idx[:, 1:] != (idx[:, :-1]+1) % n_obs).sum()/n_boot
+    # geometric lengths: a new block begins at each later row with probability 1/block_size (a start that happens to
+    # continue the previous block is not counted, which is rare)
+    assert n_obs/starts == pytest.approx(block_size, rel=0.03)
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        bootstrap_indices(10, 2, method='iid')
+
+#Confidence Intervals#######################################################################
+def test_same_seed_same_samples_for_any_n_jobs(returns):
+    candidates, replace_port = returns
+    kwargs = dict(n_boot=60, seed=11, max_cells=500*2*16, return_samples=True)
+    single, samples = cwarp_bootstrap(candidates, replace_port, n_jobs=1, **kwargs)
+    pooled, pooled_samples = cwarp_bootstrap(candidates, replace_port, n_jobs=2, **kwargs)
+    np.testing.assert_array_equal(pooled_samples, samples)
+    pd.testing.assert_frame_equal(pooled, single)
+    assert samples.shape == (60, 2)
+    other = cwarp_bootstrap(candidates, replace_port, n_boot=60, seed=12, max_cells=500*2*16)
+    assert not np.allclose(other['Mean'], single['Mean'])
+
+def test_point_estimate_and_interval(returns):
+    candidates, replace_port = returns
+    table = cwarp_bootstrap(candidates, replace_port, n_boot=200, seed=3, ci=0.9, financing_rate=0.01)
+    for column in candidates:
+        assert table.at[column, 'CWARP'] == pytest.approx(cole_win_above_replace_port(candidates[column], replace_port, financing_rate=0.01))
+    assert (table['CI_Lower'] <= table['Mean']).all() and (table['Mean'] <= table['CI_Upper']).all()
+    assert ((table['Prob_Positive'] >= 0) & (table['Prob_Positive'] <= 1)).all()
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+from cwarp_cache import MemoCache
+
+def _array(kb):
+    return np.zeros(kb*128)   # kb kilobytes of float64
+
+def test_memory_bound_evicts_least_recently_used():
+    memo = MemoCache(max_bytes=10*1024)
+    for key in 'abcd':
+        memo.put('data', key, _array(3))
+    # four 3 KB values do not fit in 10 KB, the oldest goes
+    assert memo.get('data', 'a') is None
+    assert memo.get('data', 'b') is not None
+    memo.put('data', 'e', _array(3))
+    # 'b' was just read, so 'c' is now the least recently used
+    assert memo.get('data', 'c') is None
+    assert all(memo.get('data', key) is not None for key in 'bde')
+    assert memo._bytes <= memo.max_bytes
+
+def test_value_larger_than_the_budget_is_not_cached():
+    memo = MemoCache(max_bytes=1024)
+    memo.put('data', 'small', _array(0))
+    big = _array(2)
+    assert memo.put('data', 'big', big) is big
+    assert memo.get('data', 'big') is None and memo.get('data', 'small') is not None
+
+def test_replacing_a_key_frees_its_old_size():
+    memo = MemoCache(max_bytes=10*1024)
+    memo.put('data', 'a', _array(6))
+    memo.put('data', 'a', _array(2))
+    memo.put('data', 'b', _array(6))
+    assert memo.get('data', 'a') is not None and memo.get('data', 'b') is not None
+
+def test_stats_per_namespace():
+    memo = MemoCache(max_bytes=4*1024)
+    calls = []
+    compute = lambda: calls.append(1) or _array(1)
+    memo.get_or_compute('panel', 1, compute)
+    memo.get_or_compute('panel', 1, compute)
+    memo.get_or_compute('panel', 1, compute)
+    memo.get('metrics', 'x')
+    assert len(calls) == 1
+    stats = memo.stats()
+    assert stats.loc['panel', ['hits', 'misses', 'entries']].tolist() == [2, 1, 1]
+    assert stats.loc['panel', 'hit_rate'] == 2/3
+    assert stats.loc['metrics', ['hits', 'misses', 'entries']].tolist() == [0, 1, 0]
+    for key in range(5):
+        memo.put('latex', key, _array(1))
+    stats = memo.stats()
+    # evictions are charged to the namespace of the evicted entry
+    assert stats.loc['panel', ['evictions', 'entries']].tolist() == [1, 0]
+    assert stats.loc['latex', 'evictions'] == 5-stats.loc['latex', 'entries']
+    assert stats['MB'].sum()*2**20 <= 4*1024
+    memo.clear()
+    assert memo.stats().empty
+
+def test_memoize_keys_on_arguments():
+    memo = MemoCache()
+    calls = []
+    @memo.memoize('metrics')
+    def square(x, scale=1):
+        calls.append(x)
+        return pd.Series([x*x*scale])
+    assert square(3).iloc[0] == 9 and square(3).iloc[0] == 9 and square(3, scale=2).iloc[0] == 18
+    assert calls == [3, 3] and square.__name__ == 'square'
@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import random_returns
+import cwarp_core as core
+
+#Baseline Formulas##########################################################################
+# the separate single series metrics as they were before the fused stats kernel
+
+def _sharpe(df, risk_free=0, periodicity=252):
+    df = np.asarray(df)
+    risk_free = (1+risk_free)**(1/periodicity)-1
+    return (np.nanmean(df)-risk_free)/np.nanstd(df)*np.sqrt(periodicity)
+
+def _tdd(df, MAR=0):
+    df = np.asarray(df)-MAR
+    return np.sqrt(np.nanmean(np.where(df < 0, df, 0)**2))
+
+def _sortino(df, risk_free=0, periodicity=252):
+    df = np.asarray(df)
+    risk_free = (1+risk_free)**(1/periodicity)-1
+    return (np.nanmean(df)-risk_free)/_tdd(df)*np.sqrt(periodicity)
+
+def _annualized_return(df, periodicity=252):
+    df = np.asarray(df)
+    return np.nancumprod(df+1)[-1]**(1/(len(df)/periodicity))-1
+
+def _max_dd(df):
+    r = np.nancumprod(np.asarray(df)+1)
+    peak = np.maximum.accumulate(r)
+    return np.abs(np.nanmin((r-peak)/peak))
+
+def _return_maxdd(df, risk_free=0, periodicity=252):
+    risk_free = (1+risk_free)**(1/periodicity)-1
+    return (_annualized_return(df, periodicity)-risk_free)/_max_dd(df)
+
+def _cwarp(new_asset, replace_port, risk_free_rate=0, financing_rate=0, weight_asset=0.25, weight_replace_port=1, periodicity=252):
+    financing_rate = (1+financing_rate)**(1/periodicity)-1
+    new_port = (new_asset-financing_rate)*weight_asset+replace_port*weight_replace_port
+    sortino = _sortino(new_port, risk_free_rate, periodicity)/_sortino(replace_port, risk_free_rate, periodicity)
+    ret_maxdd = _return_maxdd(new_port, risk_free_rate, periodicity)/_return_maxdd(replace_port, risk_free_rate, periodicity)
+    return ((sortino*ret_maxdd)**(1/2)-1)*100, (sortino-1)*100, (ret_maxdd-1)*100
+
+#Fused Kernel###############################################################################
+@pytest.mark.parametrize('missing', [0.0, 0.05])
+def test_single_series_metrics_match_baseline(rng, missing):
+    ret = random_returns(rng, 1500, missing=missing)
+    assert core.sharpe_ratio(ret, risk_free=0.02) == pytest.approx(_sharpe(ret, risk_free=0.02), rel=1e-10)
+    assert core.target_downside_deviation(ret) == pytest.approx(_tdd(ret), rel=1e-10)
+    assert core.sortino_ratio(ret, risk_free=0.02) == pytest.approx(_sortino(ret, risk_free=0.02), rel=1e-10)
+    assert core.annualized_return(ret) == pytest.approx(_annualized_return(ret), rel=1e-10)
+    assert core.max_dd(ret) == pytest.approx(_max_dd(ret), rel=1e-10)
+    assert core.return_maxdd_ratio(ret, risk_free=0.02) == pytest.approx(_return_maxdd(ret, risk_free=0.02), rel=1e-10)
+
+def test_return_stats_columns_match_single_series(rng):
+    frame = random_returns(rng, 800, 4, missing=0.02)
+    stats = core.return_stats(frame)
+    for i, column in enumerate(frame):
+        single = core.return_stats(frame[column])
+        for field in ('count', 'mean', 'var', 'downside_ss', 'end_nav', 'max_dd', 'wins', 'losses', 'avg_win', 'avg_loss'):
+            assert np.asarray(getattr(stats, field))[i] == pytest.approx(getattr(single, field), rel=1e-12)
+
+#CWARP######################################################################################
+def test_cwarp_matches_baseline_on_one_calendar(rng):
+    new_asset, replace_port = random_returns(rng, 1000), random_returns(rng, 1000)
+    cwarp, sortino, ret_maxdd = _cwarp(new_asset, replace_port, risk_free_rate=0.01, financing_rate=0.02)
+    kwargs = dict(risk_free_rate=0.01, financing_rate=0.02)
+    assert core.cole_win_above_replace_port(new_asset, replace_port, **kwargs) == pytest.approx(cwarp, rel=1e-10)
+    assert core.cwarp_additive_sortino(new_asset, replace_port, **kwargs) == pytest.approx(sortino, rel=1e-10)
+    assert core.cwarp_additive_ret_maxdd(new_asset, replace_port, **kwargs) == pytest.approx(ret_maxdd, rel=1e-10)
+
+def test_cwarp_on_offset_calendars_scores_replacement_on_its_own_dates(rng):
+    # the replacement portfolio starts two months after the new asset, its stats must not see the padded union calendar
+    new_asset = random_returns(rng, 1000, start='2010-01-01')
+    replace_port = random_returns(rng, 960, start='2010-03-01')
+    cwarp, sortino, ret_maxdd = _cwarp(new_asset, replace_port)
+    assert core.cole_win_above_replace_port(new_asset, replace_port) == pytest.approx(cwarp, rel=1e-10)
+    assert core.cwarp_additive_sortino(new_asset, replace_port) == pytest.approx(sortino, rel=1e-10)
+    assert core.cwarp_additive_ret_maxdd(new_asset, replace_port) == pytest.approx(ret_maxdd, rel=1e-10)
+
+#Batch CWARP################################################################################
+@pytest.fixture
+def matrix(rng):
+    """aligned candidate matrix with scattered missing returns and its replacement portfolio"""
+    new_assets = random_returns(rng, 900, 6, missing=0.02).to_numpy()
+    replace_port = random_returns(rng, 900).to_numpy()
+    return new_assets, replace_port
+
+def _columns(function, new_assets, *args, **kwargs):
+    """function applied to every column of new_assets"""
+    return np.array([function(new_assets[:, k], *args, **kwargs) for k in range(new_assets.shape[1])])
+
+def test_cwarp_batch_matches_single_asset_functions(matrix):
+    new_assets, replace_port = matrix
+    kwargs = dict(risk_free_rate=0.01, financing_rate=0.02, weight_asset=0.3, weight_replace_port=0.9)
+    out = core.cwarp_batch(new_assets, replace_port, **kwargs)
+    expected = {'CWARP': core.cole_win_above_replace_port, '+Sortino': core.cwarp_additive_sortino,
+                '+Ret_To_MaxDD': core.cwarp_additive_ret_maxdd, 'Return': core.cwarp_port_return, 'Vol': core.cwarp_port_risk}
+    for key, function in expected.items():
+        np.testing.assert_allclose(out[key], _columns(function, new_assets, replace_port, **kwargs), rtol=1e-9)
+    new_ports = core.cwarp_new_port_data(new_assets, replace_port[:, None], **kwargs)
+    np.testing.assert_allclose(out['Max_DD'], _columns(core.max_dd, new_ports), rtol=1e-9)
+
+def test_cwarp_batch_per_column_weights(matrix):
+    new_assets, replace_port = matrix
+    weights = np.linspace(0.1, 0.6, new_assets.shape[1])
+    out = core.cwarp_batch(new_assets, replace_port, weight_asset=weights)
+    expected = [core.cole_win_above_replace_port(new_assets[:, k], replace_port, weight_asset=w) for k, w in enumerate(weights)]
+    np.testing.assert_allclose(out['CWARP'], expected, rtol=1e-9)
+
+def test_batch_metrics_match_single_series(matrix):
+    new_assets, replace_port = matrix
+    out = core.batch_metrics(new_assets, risk_free=0.01)
+    np.testing.assert_allclose(out['Sharpe'], _columns(core.sharpe_ratio, new_assets, risk_free=0.01), rtol=1e-9)
+    np.testing.assert_allclose(out['Sortino'], _columns(core.sortino_ratio, new_assets, risk_free=0.01), rtol=1e-9)
+    np.testing.assert_allclose(out['Return'], _columns(core.annualized_return, new_assets), rtol=1e-9)
+    np.testing.assert_allclose(out['Max_DD'], _columns(core.max_dd, new_assets), rtol=1e-9)
+    np.testing.assert_allclose(out['Ret_To_MaxDD'], _columns(core.return_maxdd_ratio, new_assets, risk_free=0.01), rtol=1e-9)
+
+def test_cwarp_batch_blocks_match_one_pass(matrix):
+    new_assets, replace_port = matrix
+    whole = core.cwarp_batch(new_assets, replace_port)
+    blocked = core.cwarp_batch(new_assets, replace_port, max_bytes=new_assets.shape[0]*60)
+    for key in whole:
+        np.testing.assert_allclose(blocked[key], whole[key], rtol=1e-12)
+
+def test_batch_metrics_own_history_drops_padding(rng):
+    frame = random_returns(rng, 400, 3)
+    frame.iloc[:150, 1] = np.nan
+    frame.iloc[300:, 2] = np.nan
+    out = core.batch_metrics(frame, risk_free=0.01, own_history=True)
+    for k, column in enumerate(frame):
+        own = frame[column].dropna()
+        assert out['Sortino'][k] == pytest.approx(core.sortino_ratio(own, risk_free=0.01))
+        assert out['Return'][k] == pytest.approx(core.annualized_return(own))
+        assert out['Ret_To_MaxDD'][k] == pytest.approx(core.return_maxdd_ratio(own, risk_free=0.01))
+    # padding does count without own_history
+    assert abs(core.batch_metrics(frame, risk_free=0.01)['Sortino'][1]) > abs(out['Sortino'][1])
+    frame.iloc[:, 0] = np.nan
+    assert np.isnan(core.batch_metrics(frame, own_history=True)['Sortino'][0])
@@ -0,0 +1,222 @@
+import gc
+import os
+import time
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+from concurrent.futures import ProcessPoolExecutor
+import cwarp_data
+from cwarp_data import PriceCache, SyntheticProvider, MemoryProvider
+
+#Shared Cache Directory#####################################################################
+def _fetch_in_process(cache_dir):
+    cache = PriceCache(SyntheticProvider(), cache_dir=cache_dir)
+    return [len(cache.get('spy', '2005-01-01', '2020-12-31')) for _ in range(3)]
+
+def test_processes_sharing_a_cache_directory(tmp_path):
+    with ProcessPoolExecutor(max_workers=8) as pool:
+        lengths = list(pool.map(_fetch_in_process, [str(tmp_path)]*16))
+    expected = len(SyntheticProvider().fetch('spy', '2005-01-01', '2020-12-31'))
+    assert all(n == expected for run in lengths for n in run)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+#Price Cache################################################################################
+@pytest.fixture
+def provider():
+    return SyntheticProvider(seed=3)
+
+def _expected(provider, ticker, start, end):
+    close = SyntheticProvider(seed=provider.seed).fetch(ticker, pd.Timestamp(start)-pd.Timedelta(days=PriceCache.overlap_days), end)
+    returns = close.pct_change()
+    return returns[(returns.index >= pd.Timestamp(start)) & (returns.index < pd.Timestamp(end))]
+
+def test_miss_then_hit(tmp_path, provider):
+    cache = PriceCache(provider, cache_dir=str(tmp_path))
+    first = cache.get('spy', '2015-01-01', '2016-01-01')
+    assert len(provider.calls) == 1
+    second = cache.get('SPY', '2015-03-01', '2015-09-01')
+    assert len(provider.calls) == 1
+    np.testing.assert_allclose(first.values, _expected(provider, 'spy', '2015-01-01', '2016-01-01').values)
+    expected = first['2015-03-01':'2015-08-31']
+    assert list(second.index) == list(expected.index)
+    np.testing.assert_array_equal(second.values, expected.values)
+
+def test_only_missing_ranges_are_fetched(tmp_path, provider):
+    cache = PriceCache(provider, cache_dir=str(tmp_path))
+    cache.get('spy', '2015-01-01', '2016-01-01')
+    wider = cache.get('spy', '2014-01-01', '2017-01-01')
+    fetched = [(start+pd.Timedelta(days=PriceCache.overlap_days), end) for ticker, start, end in provider.calls[1:]]
+    assert fetched == [(pd.Timestamp('2014-01-01'), pd.Timestamp('2015-01-01')), (pd.Timestamp('2016-01-01'), pd.Timestamp('2017-01-01'))]
+    np.testing.assert_allclose(wider.values, _expected(provider, 'spy', '2014-01-01', '2017-01-01').values)
+
+def test_refresh_after_ttl_picks_up_revised_closes(tmp_path, monkeypatch):
+    dates = pd.bdate_range('2015-01-01', '2015-12-31')
+    prices = {'spy': pd.Series(np.linspace(100, 120, len(dates)), index=dates)}
+    cache = PriceCache(MemoryProvider(prices), cache_dir=str(tmp_path), ttl=3600)
+    cache.get('spy', '2015-01-01', '2016-01-01')
+    # the vendor revises the last close, which the cache only sees once the ttl has expired
+    prices['spy'] = prices['spy'].copy()
+    prices['spy'].iloc[-1] *= 1.1
+    assert cache.get('spy', '2015-01-01', '2016-01-01').iloc[-1] == pytest.approx(120/prices['spy'].iloc[-2]-1)
+    now = time.time()
+    monkeypatch.setattr(cwarp_data.time, 'time', lambda: now+7200)
+    assert cache.get('spy', '2015-01-01', '2016-01-01').iloc[-1] == pytest.approx(132/prices['spy'].iloc[-2]-1)
+
+@pytest.mark.filterwarnings('error::ResourceWarning', 'error::pytest.PytestUnraisableExceptionWarning')
+@pytest.mark.parametrize('damage', ['garbage', 'truncated', 'empty'])
+def test_corrupt_entry_is_refetched(tmp_path, provider, damage):
+    cache = PriceCache(provider, cache_dir=str(tmp_path))
+    good = cache.get('spy', '2015-01-01', '2016-01-01')
+    path = os.path.join(tmp_path, 'spy.npz')
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write({'garbage': b'not a zip file', 'truncated': data[:len(data)//2], 'empty': b''}[damage])
+    again = cache.get('spy', '2015-01-01', '2016-01-01')
+    assert list(again.index) == list(good.index)
+    np.testing.assert_array_equal(again.values, good.values)
+    assert len(provider.calls) == 2
+    # the entry was rewritten and is served from the cache again
+    cache.get('spy', '2015-01-01', '2016-01-01')
+    assert len(provider.calls) == 2
+    # the corrupt file was closed when it was read, not left to the garbage collector
+    gc.collect()
+
+def test_offline_miss_raises(tmp_path, provider):
+    cache = PriceCache(provider, cache_dir=str(tmp_path), offline=True)
+    with pytest.raises(KeyError):
+        cache.get('spy', '2015-01-01', '2016-01-01')
+    assert provider.calls == []
+
+def test_least_recently_used_tickers_are_evicted(tmp_path, provider):
+    cache = PriceCache(provider, cache_dir=str(tmp_path))
+    cache.get('spy', '2010-01-01', '2016-01-01')
+    size = os.path.getsize(os.path.join(tmp_path, 'spy.npz'))
+    cache.max_bytes = int(1.5*size)
+    os.utime(os.path.join(tmp_path, 'spy.npz'), (0, 0))
+    cache.get('agg', '2010-01-01', '2016-01-01')
+    assert sorted(os.listdir(tmp_path)) == ['agg.lock', 'agg.npz']
+
+def test_clear_removes_entries_and_lock_files(tmp_path, provider):
+    cache = PriceCache(provider, cache_dir=str(tmp_path))
+    for ticker in ('spy', 'agg'):
+        cache.get(ticker, '2015-01-01', '2016-01-01')
+    assert sorted(os.listdir(tmp_path)) == ['agg.lock', 'agg.npz', 'spy.lock', 'spy.npz']
+    cache.clear()
+    assert os.listdir(tmp_path) == []
+    cache.get('spy', '2015-01-01', '2016-01-01')
+    assert len(provider.calls) == 3
+
+#Concurrent Loader##########################################################################
+class _StuckProvider(SyntheticProvider):
+    """hangs on the first `stuck` calls for the tickers in hang, until released"""
+    def __init__(self, hang, stuck=1):
+        super().__init__(seed=5)
+        self.hang, self.stuck = set(hang), stuck
+        self.attempts = {}
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+
+    def fetch(self, ticker, start_date, end_date):
+        with self.lock:
+            self.attempts[ticker] = self.attempts.get(ticker, 0)+1
+            attempts = self.attempts[ticker]
+        if ticker in self.hang and attempts <= self.stuck: self.release.wait(30)
+        return super().fetch(ticker, start_date, end_date)
+
+def test_stuck_attempt_does_not_hold_a_worker():
+    provider = _StuckProvider(['a'])
+    try:
+        start = time.monotonic()
+        loaded = cwarp_data.load_returns(['a', 'b', 'c', 'd'], '2019-01-01', '2020-01-01', provider, max_workers=1,
+                                         timeout=0.3, retries=1, backoff=0.01)
+        # the retry of 'a' and every other ticker run although the stuck first attempt never returns
+        assert list(loaded.returns) == ['a', 'b', 'c', 'd'] and not loaded.failures
+        assert provider.attempts['a'] == 2
+        assert time.monotonic()-start < 5
+    finally:
+        provider.release.set()
+
+def test_timeout_counts_from_the_start_of_an_attempt():
+    provider = _StuckProvider(['a', 'b'], stuck=5)
+    try:
+        loaded = cwarp_data.load_returns(['a', 'b', 'c'], '2019-01-01', '2020-01-01', provider, max_workers=1,
+                                         timeout=0.2, retries=2, backoff=0.01)
+        # every queued attempt ran before timing out instead of expiring while it waited for a worker
+        assert provider.attempts == {'a': 3, 'b': 3, 'c': 1}
+        assert loaded.failures == {'a': 'timed out after 0.2s', 'b': 'timed out after 0.2s'}
+        assert list(loaded.returns) == ['c']
+    finally:
+        provider.release.set()
+
+def test_stuck_fetch_through_the_cache_recovers(tmp_path):
+    # the abandoned first attempt must not keep the ticker's cache locks while its provider call hangs
+    provider = _StuckProvider(['a'])
+    cache = PriceCache(provider, cache_dir=str(tmp_path))
+    try:
+        start = time.monotonic()
+        loaded = cwarp_data.load_returns(['a', 'b'], '2019-01-01', '2020-01-01', cache, timeout=0.5, retries=2, backoff=0.01)
+        assert list(loaded.returns) == ['a', 'b'] and not loaded.failures
+        assert provider.attempts['a'] == 2
+        assert time.monotonic()-start < 5
+    finally:
+        provider.release.set()
+
+def test_failed_attempts_are_retried():
+    class Flaky(SyntheticProvider):
+        def fetch(self, ticker, start_date, end_date):
+            if len(self.calls) < 2:
+                self.calls.append(None)
+                raise ConnectionError('reset')
+            return super().fetch(ticker, start_date, end_date)
+    loaded = cwarp_data.load_returns(['a'], '2019-01-01', '2020-01-01', Flaky(), retries=2, backoff=0.01)
+    assert list(loaded.returns) == ['a'] and not loaded.failures
+    loaded = cwarp_data.load_returns(['a'], '2019-01-01', '2020-01-01', Flaky(), retries=1, backoff=0.01)
+    assert loaded.failures == {'a': 'ConnectionError: reset'} and not loaded.returns
+
+#Panel######################################################################################
+@pytest.fixture
+def staggered(rng):
+    """two legs on the full calendar, a late listing with a gap, a delisted asset and an asset with no returns"""
+    index = pd.bdate_range('2015-01-01', periods=60)
+    series = lambda dates: pd.Series(rng.normal(0.0003, 0.01, len(dates)), index=dates)
+    gappy = series(index[20:])
+    return {'spy': series(index), 'ief': series(index), 'late': gappy.drop(gappy.index[5:8]),
+            'gone': series(index[:40]), 'empty': pd.Series([], index=pd.DatetimeIndex([]), dtype=float)}
+
+def test_panel_inner_join(staggered):
+    panel = cwarp_data.build_panel(staggered, ['spy', 'ief'], [0.6, 0.4], ['late', 'gone'], join='inner')
+    common = staggered['late'].index.intersection(staggered['gone'].index)
+    assert list(panel.dates) == list(common)
+    assert not panel.candidates.isna().any().any()
+    expected = 0.6*staggered['spy'].reindex(common)+0.4*staggered['ief'].reindex(common)
+    np.testing.assert_allclose(panel.replace_port.values, expected.values)
+    # the overlap report keeps each asset's own history, not the common window
+    assert panel.overlap.at['gone', 'Start'] == staggered['gone'].index[0]
+    assert panel.overlap.at['late', 'End'] == staggered['late'].index[-1]
+    assert panel.overlap.at['gone', 'Observations'] == 40
+    assert panel.overlap.at['gone', 'Overlap_Start'] == common[0]
+    assert panel.overlap.at['gone', 'Overlap_Obs'] == len(common)
+
+def test_panel_asset_start_join(staggered):
+    panel = cwarp_data.build_panel(staggered, ['spy', 'ief'], [0.6, 0.4], ['late', 'gone', 'empty'], join='asset_start')
+    assert list(panel.dates) == list(staggered['spy'].index)
+    late = panel.candidates['late']
+    # missing before the first and after the last return, gaps inside the history filled with 0
+    assert late.loc[:staggered['late'].index[0]].iloc[:-1].isna().all()
+    assert late.loc[staggered['late'].index[0]:].notna().all()
+    assert panel.overlap.at['late', 'Filled'] == 3
+    assert panel.candidates['gone'].iloc[40:].isna().all()
+    assert panel.candidates['empty'].isna().all()
+    assert pd.isna(panel.overlap.at['empty', 'Start']) and panel.overlap.at['empty', 'Observations'] == 0
+
+def test_panel_outer_join(staggered):
+    panel = cwarp_data.build_panel(staggered, ['spy', 'ief'], [0.6, 0.4], ['late', 'gone'], join='outer')
+    assert list(panel.dates) == list(staggered['spy'].index)
+    assert not panel.candidates.isna().any().any()
+    assert panel.missing['late'].sum() == 60-len(staggered['late'])
+    kept = cwarp_data.build_panel(staggered, ['spy', 'ief'], [0.6, 0.4], ['late'], join='outer', fill=None)
+    assert kept.candidates['late'].isna().sum() == 60-len(staggered['late'])
+    with pytest.raises(ValueError):
+        cwarp_data.build_panel(staggered, ['spy', 'ief'], [0.6, 0.4], join='left')
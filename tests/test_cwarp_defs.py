@@ -0,0 +1,210 @@
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import random_returns
+import cwarp_defs as defs
+
+def _brute_force(function, values, window, *args, **kwargs):
+    """function applied to every trailing window slice of a 1-D array, NaN until the first full window"""
+    out = np.full(len(values), np.nan)
+    for end in range(window, len(values)+1):
+        out[end-1] = function(values[end-window:end], *args, **kwargs)
+    return out
+
+#Rolling Metrics############################################################################
+@pytest.mark.parametrize('missing', [0.0, 0.03])
+def test_rolling_metrics_match_window_slices(rng, missing):
+    ret = random_returns(rng, 400, missing=missing)
+    values = ret.to_numpy()
+    window = 60
+    cases = [(defs.rolling_annualized_return, defs.annualized_return, {}),
+             (defs.rolling_target_downside_deviation, defs.target_downside_deviation, {'MAR': 0.0002}),
+             (defs.rolling_sortino_ratio, defs.sortino_ratio, {'risk_free': 0.02}),
+             (defs.rolling_max_dd, defs.max_dd, {}),
+             (defs.rolling_return_maxdd_ratio, defs.return_maxdd_ratio, {'risk_free': 0.02})]
+    for rolling, single, kwargs in cases:
+        result = rolling(ret, window, **kwargs)
+        assert isinstance(result, pd.Series) and result.index.equals(ret.index)
+        np.testing.assert_allclose(result.to_numpy(), _brute_force(single, values, window, **kwargs), rtol=1e-8, atol=1e-12,
+                                   err_msg=rolling.__name__)
+
+@pytest.mark.parametrize('window', [1, 7, 50, 64, 399, 400])
+def test_rolling_max_dd_window_edges(rng, window):
+    # windows of one period, of a whole block and of the whole series exercise the block decomposition
+    values = random_returns(rng, 400, vol=0.02).to_numpy()
+    np.testing.assert_allclose(defs.rolling_max_dd(values, window), _brute_force(defs.max_dd, values, window), rtol=1e-8, atol=1e-12)
+
+def test_rolling_cwarp_matches_window_slices(rng):
+    frame = random_returns(rng, 300, 3, missing=0.01)
+    replace_port = random_returns(rng, 300).to_numpy()
+    kwargs = dict(risk_free_rate=0.01, financing_rate=0.02)
+    result = defs.rolling_cole_win_above_replace_port(frame, replace_port, 120, **kwargs)
+    assert list(result.columns) == list(frame.columns)
+    for column in frame:
+        expected = np.full(len(frame), np.nan)
+        for end in range(120, len(frame)+1):
+            expected[end-1] = defs.cole_win_above_replace_port(frame[column].to_numpy()[end-120:end], replace_port[end-120:end], **kwargs)
+        np.testing.assert_allclose(result[column].to_numpy(), expected, rtol=1e-8)
+
+#Tearsheet##################################################################################
+def _naive_tearsheet(ret, periodicity=252):
+    """tearsheet row of one window slice computed directly, zero returns dropped from Sharpe and Sortino"""
+    x = ret.to_numpy()
+    present = x[~np.isnan(x)]
+    moment = present[present != 0]
+    annret = defs.annualized_return(x, periodicity=periodicity)
+    maxdd = defs.max_dd(x)
+    wins, losses = present[present >= 0], present[present < 0]
+    win_pct = len(wins)/len(present)
+    avg_pos, avg_neg = wins.mean(), losses.mean()
+    return {'AnnRet': annret, 'Vol': np.std(present)*np.sqrt(periodicity),
+            'Sharpe': moment.mean()/moment.std()*np.sqrt(periodicity),
+            'Sortino': moment.mean()/np.sqrt(np.sum(np.minimum(moment, 0)**2)/len(moment))*np.sqrt(periodicity),
+            'MaxDD': maxdd, 'Calmar': annret/maxdd,
+            'Kelly': ((avg_pos/abs(avg_neg))*win_pct-(1-win_pct))/(avg_pos/(1-win_pct)),
+            'BestDay': present.max(), 'WorstDay': present.min()}
+
+def test_tearsheet_matches_naive_windows(rng):
+    frame = random_returns(rng, 1600, 2, start='2012-03-05', missing=0.02)
+    frame.iloc[::17, 0] = 0.0
+    windows = (defs.calendar_year_windows(frame.index)+defs.trailing_windows(frame.index)
+               +[('Custom', '2013-02-14', '2014-07-03'), ('Short', '2015-06-01', '2015-06-09')])
+    table = defs.tearsheet(frame, windows)
+    assert list(table.index.get_level_values('Window')[:len(windows)]) == [w[0] for w in windows]
+    for column in frame:
+        for label, bop, eop in windows:
+            window = frame[column][(frame.index >= pd.Timestamp(bop)) & (frame.index <= pd.Timestamp(eop))]
+            row = table.loc[(column, label)]
+            for key, value in _naive_tearsheet(window).items():
+                assert row[key] == pytest.approx(value, rel=1e-8, abs=1e-12), (column, label, key)
+            assert row['bop'] == window.index[0] and row['eop'] == window.index[-1]
+
+def test_return_analyz_is_a_one_window_tearsheet(rng):
+    ret = random_returns(rng, 500)
+    row = defs.return_analyz(ret, 'Test', bop='2010-03-01', eop='2010-12-31')
+    assert list(row.index) == ['Test']
+    expected = _naive_tearsheet(ret['2010-03-01':'2010-12-31'])
+    for key, value in expected.items():
+        assert row.loc['Test', key] == pytest.approx(value, rel=1e-8)
+
+#Calendar Return Tables#####################################################################
+def _naive_period_returns(nav, keys):
+    """compounded returns of one NAV series per calendar period, NaN for periods without returns"""
+    daily = nav.pct_change()
+    grouped = (1+daily).groupby(keys)
+    return (grouped.prod()-1).where(daily.notna().groupby(keys).sum() > 0)
+
+def test_calendar_return_matrices_match_per_series_compounding(rng):
+    returns = random_returns(rng, 900, 3, start='2011-05-10', missing=0.01)
+    nav = (1+returns.fillna(0)).cumprod()
+    nav.loc['2012-02-01':'2012-02-29', 'A1'] = np.nan
+    tables = defs.calendar_return_matrices(nav, data='nav')
+    year = nav.index.year
+    for column in nav:
+        monthly = _naive_period_returns(nav[column], [year, nav.index.month])
+        quarterly = _naive_period_returns(nav[column], [year, (nav.index.month-1)//3+1])
+        annual = _naive_period_returns(nav[column], year)
+        for (y, m), value in monthly.items():
+            assert tables['M'].loc[(column, y), m] == pytest.approx(value, rel=1e-10, nan_ok=True)
+        for (y, q), value in quarterly.items():
+            assert tables['Q'].loc[(column, y), f'Q{q}'] == pytest.approx(value, rel=1e-10)
+        for y, value in annual.items():
+            assert tables['A'].loc[y, column] == pytest.approx(value, rel=1e-10)
+            assert tables['M'].loc[(column, y), 'Annual'] == pytest.approx(value, rel=1e-10)
+    # a month without any return stays missing rather than reading as 0%
+    assert np.isnan(tables['M'].loc[('A1', 2012), 2])
+
+def test_first_month_is_a_partial_period(rng):
+    # starts mid-month: the first month runs from the first NAV to the month end, month-end to month-end returns would leave it NaN
+    nav = (1+random_returns(rng, 60, 2, start='2015-01-14')).cumprod()
+    nav.iloc[:30, 1] = np.nan
+    tables = defs.calendar_return_matrices(nav, freqs=('M',))['M']
+    assert tables.loc[('A0', 2015), 1] == pytest.approx(nav['A0'].loc['2015-01'].iloc[-1]/nav['A0'].iloc[0]-1)
+    first = nav['A1'].first_valid_index()
+    month = nav['A1'].loc[first:].loc[f'{first.year}-{first.month:02d}']
+    assert tables.loc[('A1', first.year), first.month] == pytest.approx(month.iloc[-1]/month.iloc[0]-1)
+    assert np.isnan(tables.loc[('A1', 2015), 1])
+    assert list(tables.index.get_level_values('Series').unique()) == ['A0', 'A1']
+
+def test_return_inputs_and_wrappers(rng):
+    returns = random_returns(rng, 400, 2, start='2015-01-01')
+    nav = (1+returns).cumprod()
+    from_returns = defs.calendar_return_matrices(returns, data='returns', freqs=('A',))['A']
+    from_nav = defs.calendar_return_matrices(nav, data='nav', freqs=('A',))['A']
+    # the NAV's first day has no return, so only later years agree exactly
+    pd.testing.assert_frame_equal(from_returns.iloc[1:], from_nav.iloc[1:])
+    pd.testing.assert_frame_equal(defs.ReturnTable(nav, freq='1Q'), defs.calendar_return_matrices(nav, freqs=('Q',))['Q'])
+    pd.testing.assert_frame_equal(defs.monthly_ret_matrix(nav), defs.calendar_return_matrices(nav, freqs=('M',))['M'].T)
+    with pytest.raises(ValueError):
+        defs.calendar_return_matrices(nav, freqs=('W',))
+
+#CWARP Tables###############################################################################
+def test_cwarp_tables_dates_of_each_asset(rng):
+    from cwarp_data import build_panel
+    returns = random_returns(rng, 300, 3)
+    series = {'spy': returns['A0'], 'late': returns['A1'].iloc[100:], 'gone': returns['A2'].iloc[:250]}
+    panel = build_panel(series, ['spy'], [1], ['late', 'gone'], join='inner', name='Port')
+    risk_ret_df, _ = defs.cwarp_tables(panel.candidates, panel.replace_port, history=panel.overlap)
+    assert risk_ret_df.at['Start_Date', 'gone'] == returns.index[0].date()
+    assert risk_ret_df.at['End_Date', 'late'] == returns.index[-1].date()
+    # without a history the dates are those of the columns passed in
+    risk_ret_df, _ = defs.cwarp_tables(panel.candidates, panel.replace_port)
+    assert risk_ret_df.at['Start_Date', 'gone'] == returns.index[100].date()
+
+def test_cwarp_tables_all_missing_candidate(rng):
+    candidates = random_returns(rng, 200, 2)
+    candidates['A1'] = np.nan
+    replace_port = random_returns(rng, 200).rename('Port')
+    risk_ret_df, new_risk_ret_df = defs.cwarp_tables(candidates, replace_port)
+    assert pd.isna(risk_ret_df.at['Start_Date', 'A1']) and pd.isna(risk_ret_df.at['End_Date', 'A1'])
+    assert risk_ret_df.at['Start_Date', 'A0'] == candidates.index[0].date()
+    assert list(new_risk_ret_df.columns)[0] == 'Port'
+
+def test_cwarp_tables_standalone_stats_on_own_rows(rng):
+    from cwarp_data import build_panel
+    returns = random_returns(rng, 1000, 2)
+    late = returns['A1'].iloc[500:]
+    panel = build_panel({'spy': returns['A0'], 'late': late}, ['spy'], [1], ['late'], join='asset_start', name='Port')
+    assert panel.candidates['late'].isna().sum() == 500
+    risk_ret_df, _ = defs.cwarp_tables(panel.candidates, panel.replace_port, history=panel.overlap)
+    assert risk_ret_df.at['Sortino', 'late'] == pytest.approx(defs.sortino_ratio(late.dropna()))
+    assert risk_ret_df.at['Sharpe', 'late'] == pytest.approx(defs.sharpe_ratio(late.dropna()))
+    assert risk_ret_df.at['Max_DD', 'late'] == pytest.approx(defs.max_dd(late.dropna()))
+
+#Sensitivity Surface########################################################################
+@pytest.fixture
+def overlay_candidates(rng):
+    """a hedge, a diversifier and a volatile asset whose CWARP is undefined (NaN) at larger weights"""
+    replace_port = random_returns(rng, 750, vol=0.01, drift=0.0004)
+    hedge = -0.5*replace_port+random_returns(rng, 750, vol=0.006, drift=0.0002)
+    volatile = random_returns(rng, 750, vol=0.06, drift=0.0012)
+    candidates = pd.DataFrame({'hedge': hedge, 'diversifier': random_returns(rng, 750, vol=0.008), 'volatile': volatile})
+    return candidates, replace_port
+
+def test_cwarp_surface_matches_brute_force(overlay_candidates):
+    candidates, replace_port = overlay_candidates
+    weights, replace_weights, rates = (0.1, 0.5, 1.0), (0.8, 1.0), (0.0, 0.03)
+    surface = defs.cwarp_surface(candidates, replace_port, weights_asset=weights, weights_replace_port=replace_weights,
+                                 financing_rates=rates, risk_free_rate=0.01, max_cells=750*3)
+    assert len(surface) == 12
+    for (w, wr, f), row in surface.iterrows():
+        expected = [defs.cole_win_above_replace_port(candidates[c], replace_port, risk_free_rate=0.01, financing_rate=f,
+                                                     weight_asset=w, weight_replace_port=wr) for c in candidates]
+        np.testing.assert_allclose(row.values, expected, rtol=1e-9, equal_nan=True)
+    assert surface['volatile'].isna().any() and surface['volatile'].notna().any()
+
+def test_optimal_overlay_weight_matches_dense_search(overlay_candidates):
+    candidates, replace_port = overlay_candidates
+    candidates['missing'] = np.nan
+    optimal = defs.optimal_overlay_weight(candidates, replace_port, financing_rate=0.02)
+    dense = np.linspace(0.0001, 0.9999, 2001)
+    for column in ('hedge', 'diversifier', 'volatile'):
+        scores = np.array([defs.cole_win_above_replace_port(candidates[column], replace_port, financing_rate=0.02, weight_asset=w) for w in dense])
+        best = np.nanargmax(scores)
+        assert optimal.at[column, 'CWARP'] >= scores[best]-1e-3
+        assert optimal.at[column, 'weight_asset'] == pytest.approx(dense[best], abs=2e-3)
+        # the reported CWARP is the one at the reported weight
+        assert optimal.at[column, 'CWARP'] == pytest.approx(defs.cole_win_above_replace_port(
+            candidates[column], replace_port, financing_rate=0.02, weight_asset=optimal.at[column, 'weight_asset']))
+    # undefined at every weight
+    assert np.isnan(optimal.at['missing', 'CWARP'])
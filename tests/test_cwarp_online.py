@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from conftest import random_returns
+import cwarp_core as core
+from cwarp_online import SeriesAccumulator, CwarpAccumulator, save_accumulators, load_accumulators
+
+PARAMS = dict(risk_free_rate=0.01, financing_rate=0.02, weight_asset=0.3, weight_replace_port=1, periodicity=252)
+
+@pytest.fixture
+def history(rng):
+    new_asset = random_returns(rng, 700, missing=0.02).to_numpy()
+    replace_port = random_returns(rng, 700, missing=0.01).to_numpy()
+    return new_asset, replace_port
+
+def _streamed(new_asset, replace_port):
+    acc = CwarpAccumulator(**PARAMS)
+    for a, r in zip(new_asset, replace_port):
+        acc.update(a, r)
+    return acc
+
+def test_series_accumulator_matches_batch_metrics(history):
+    ret = history[0]
+    acc = SeriesAccumulator()
+    for r in ret:
+        acc.update(r)
+    assert acc.sharpe_ratio(0.01) == pytest.approx(core.sharpe_ratio(ret, risk_free=0.01), rel=1e-9)
+    assert acc.sortino_ratio(0.01) == pytest.approx(core.sortino_ratio(ret, risk_free=0.01), rel=1e-9)
+    assert acc.annualized_return() == pytest.approx(core.annualized_return(ret), rel=1e-9)
+    assert acc.target_downside_deviation() == pytest.approx(core.target_downside_deviation(ret), rel=1e-9)
+    assert acc.max_dd == pytest.approx(core.max_dd(ret), rel=1e-9)
+    assert acc.return_maxdd_ratio(0.01) == pytest.approx(core.return_maxdd_ratio(ret, risk_free=0.01), rel=1e-9)
+
+def test_cwarp_accumulator_matches_batch_functions(history):
+    new_asset, replace_port = history
+    acc = _streamed(new_asset, replace_port)
+    assert acc.cwarp() == pytest.approx(core.cole_win_above_replace_port(new_asset, replace_port, **PARAMS), rel=1e-9)
+    assert acc.additive_sortino() == pytest.approx(core.cwarp_additive_sortino(new_asset, replace_port, **PARAMS), rel=1e-9)
+    assert acc.additive_ret_maxdd() == pytest.approx(core.cwarp_additive_ret_maxdd(new_asset, replace_port, **PARAMS), rel=1e-9)
+    assert acc.port_return() == pytest.approx(core.cwarp_port_return(new_asset, replace_port, **PARAMS), rel=1e-9)
+    assert acc.port_risk() == pytest.approx(core.cwarp_port_risk(new_asset, replace_port, **PARAMS), rel=1e-9)
+
+def test_seeded_history_continues_like_streaming(history):
+    new_asset, replace_port = history
+    # seed from the first 500 periods in one pass, then stream the rest
+    acc = CwarpAccumulator.from_history(new_asset[:500], replace_port[:500], **PARAMS)
+    for a, r in zip(new_asset[500:], replace_port[500:]):
+        acc.update(a, r)
+    np.testing.assert_allclose(acc.state(), _streamed(new_asset, replace_port).state(), rtol=1e-9)
+
+def test_state_round_trips(history, tmp_path):
+    new_asset, replace_port = history
+    accumulators = [_streamed(new_asset[:n], replace_port[:n]) for n in (100, 400, 700)]
+    restored = [CwarpAccumulator.from_state(acc.state()) for acc in accumulators]
+    path = tmp_path/'accumulators.npy'
+    save_accumulators(path, accumulators)
+    for original, copy, loaded in zip(accumulators, restored, load_accumulators(path)):
+        for acc in (copy, loaded):
+            np.testing.assert_array_equal(acc.state(), original.state())
+            assert acc.cwarp() == original.cwarp()
+            assert isinstance(acc.new_port.n, int) and isinstance(acc.periodicity, int)
+    # a restored accumulator keeps updating like the original
+    original, loaded = accumulators[0], load_accumulators(path)[0]
+    for a, r in zip(new_asset[100:200], replace_port[100:200]):
+        original.update(a, r)
+        loaded.update(a, r)
+    np.testing.assert_array_equal(loaded.state(), original.state())
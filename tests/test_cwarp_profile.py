@@ -0,0 +1,94 @@
+import json
+import time
+import threading
+import pytest
+from cwarp_profile import Profiler, _NULL_STAGE
+
+#Disabled Profiler##########################################################################
+def test_disabled_profiler_records_nothing():
+    profiler = Profiler(enabled=False)
+    stage = profiler.stage('data', ticker='spy')
+    assert stage is _NULL_STAGE and profiler.stage('metrics') is _NULL_STAGE
+    with stage:
+        pass
+    double = profiler.timed()(lambda x: 2*x)
+    assert double(4) == 8
+    profiler.record('plot', 0.5)
+    assert profiler.events == []
+    assert profiler.summary().empty
+    assert json.loads(profiler.to_chrome_trace())['traceEvents'] == []
+
+def test_disabled_stage_does_not_swallow_exceptions():
+    with pytest.raises(KeyError):
+        with Profiler(enabled=False).stage('data'):
+            raise KeyError('x')
+
+#Stage Timings##############################################################################
+def test_nested_stages_are_timed_and_summarised():
+    profiler = Profiler()
+    with profiler.stage('pipeline'):
+        for ticker in ['spy', 'tlt']:
+            with profiler.stage('fetch', ticker=ticker):
+                time.sleep(0.02)
+        with profiler.stage('metrics'):
+            time.sleep(0.01)
+    assert [event['name'] for event in profiler.events] == ['fetch', 'fetch', 'metrics', 'pipeline']
+    events = {event['name']: event for event in profiler.events}
+    outer, inner = events['pipeline'], events['metrics']
+    # the inner stage lies inside the outer one
+    assert outer['start'] <= inner['start'] and inner['start']+inner['seconds'] <= outer['start']+outer['seconds']
+    summary = profiler.summary()
+    # order of first appearance
+    assert list(summary.index) == ['fetch', 'metrics', 'pipeline']
+    assert summary.loc['fetch', 'calls'] == 2 and summary.loc['pipeline', 'calls'] == 1
+    assert summary.loc['fetch', 'total_ms'] >= 40 and summary.loc['fetch', 'max_ms'] >= 20
+    assert summary.loc['fetch', 'mean_ms'] == pytest.approx(summary.loc['fetch', 'total_ms']/2)
+    assert summary.loc['pipeline', 'total_ms'] >= summary.loc['fetch', 'total_ms']+summary.loc['metrics', 'total_ms']
+    # the outermost stage covers the whole wall time
+    assert summary.loc['pipeline', 'share'] == pytest.approx(1)
+    breakdown = profiler.breakdown('ticker')
+    assert sorted(breakdown.index.get_level_values('ticker')) == ['spy', 'tlt']
+
+def test_exceptions_still_record_the_stage():
+    profiler = Profiler()
+    with pytest.raises(ValueError):
+        with profiler.stage('data'):
+            raise ValueError
+    assert [event['name'] for event in profiler.events] == ['data']
+
+def test_timed_uses_the_function_name():
+    profiler = Profiler()
+    @profiler.timed(kind='load')
+    def load(x):
+        return x+1
+    assert load(1) == 2 and load.__name__ == 'load'
+    assert profiler.events[0]['name'] == 'load' and profiler.events[0]['tags'] == {'kind': 'load'}
+
+#Chrome Trace###############################################################################
+def test_chrome_trace_schema(tmp_path):
+    profiler = Profiler()
+    def work():
+        with profiler.stage('fetch', ticker='spy'):
+            time.sleep(0.01)
+    thread = threading.Thread(target=work)
+    thread.start()
+    thread.join()
+    with profiler.stage('metrics'):
+        pass
+    path = tmp_path / 'trace.json'
+    text = profiler.to_chrome_trace(path)
+    assert path.read_text() == text
+    trace = json.loads(text)
+    assert trace['displayTimeUnit'] == 'ms'
+    events = trace['traceEvents']
+    assert len(events) == 2
+    for trace_event, event in zip(events, profiler.events):
+        # complete events with start and duration in microseconds
+        assert trace_event['ph'] == 'X' and trace_event['cat'] == 'cwarp'
+        assert trace_event['ts'] == pytest.approx(event['start']*1e6)
+        assert trace_event['dur'] == pytest.approx(event['seconds']*1e6)
+        assert isinstance(trace_event['pid'], int) and trace_event['tid'] == event['thread']
+    fetch, metrics = events
+    assert fetch['name'] == 'fetch' and fetch['args'] == {'ticker': 'spy'} and fetch['dur'] >= 1e4
+    assert fetch['tid'] != metrics['tid']
+    assert metrics['ts'] >= fetch['ts']+fetch['dur']
@@ -0,0 +1,61 @@
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import random_returns
+from cwarp_render import lttb, downsample, cumulative_returns, figure, static_cumulative
+
+#Downsampling###############################################################################
+@pytest.mark.parametrize('n_out', [3, 10, 257])
+def test_lttb_keeps_endpoints_and_returns_n_out_increasing_indices(rng, n_out):
+    y = rng.normal(size=1000).cumsum()
+    keep = lttb(np.arange(1000), y, n_out)
+    assert len(keep) == n_out
+    assert keep[0] == 0 and keep[-1] == 999
+    assert (np.diff(keep) > 0).all()
+
+@pytest.mark.parametrize('n_out', [2, 50, 51])
+def test_lttb_passes_short_lines_through(n_out):
+    keep = lttb(np.arange(50), np.ones(50), n_out)
+    np.testing.assert_array_equal(keep, np.arange(50))
+
+def test_lttb_keeps_the_extremes_of_a_spike():
+    y = np.zeros(1000)
+    y[400], y[700] = 5, -5
+    keep = lttb(np.arange(1000), y, 20)
+    assert 400 in keep and 700 in keep
+
+def test_downsample_caps_points_per_column_and_keeps_endpoints(rng):
+    growth = cumulative_returns(random_returns(rng, 3000, 2, missing=0.05))
+    lines = downsample(growth, max_points=200)
+    assert list(lines.columns) == ['Date', 'Series', 'Value']
+    for column in growth.columns:
+        line = lines[lines['Series'] == column]
+        full = growth[column].dropna()
+        assert len(line) == 200
+        assert line['Date'].iloc[0] == full.index[0] and line['Date'].iloc[-1] == full.index[-1]
+        # points are taken from the series, not interpolated
+        np.testing.assert_array_equal(line['Value'].values, full.loc[line['Date']].values)
+
+def test_downsample_passes_short_series_through(rng):
+    growth = cumulative_returns(random_returns(rng, 100))
+    lines = downsample(growth, max_points=100)
+    assert (lines['Series'] == 'Value').all()
+    np.testing.assert_array_equal(lines['Value'].values, growth.values)
+    pd.testing.assert_index_equal(pd.DatetimeIndex(lines['Date']), growth.index, check_names=False)
+
+#Static Images##############################################################################
+def test_figures_are_independent_across_threads(rng):
+    returns = {'a': random_returns(rng, 500), 'b': random_returns(rng, 500)}
+    figures = [None]*8
+    def draw(i):
+        figures[i] = static_cumulative(returns, title=f'run {i}', max_points=100)
+    threads = [threading.Thread(target=draw, args=(i,)) for i in range(len(figures))]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert len({id(fig) for fig in figures}) == len(figures)
+    for i, fig in enumerate(figures):
+        # each figure holds only its own drawing
+        assert len(fig.axes) == 1 and fig.axes[0].get_title() == f'run {i}'
+        assert len(fig.axes[0].lines) == 2
+    assert figure(figsize=(3,2)).get_size_inches().tolist() == [3, 2]
@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import random_returns
+import cwarp_core
+import cwarp_screen
+from cwarp_core import cwarp_batch
+from cwarp_store import ReturnStore
+
+@pytest.fixture
+def universe(rng):
+    """candidate matrix with ragged histories and a replacement portfolio that starts later than the calendar"""
+    frame = random_returns(rng, 600, 12, missing=0.01)
+    frame.iloc[:80, 3] = np.nan
+    frame.iloc[500:, 7] = np.nan
+    replace_port = random_returns(rng, 540, start=frame.index[40]).rename('port')
+    return frame.index, np.asfortranarray(frame.values), list(frame.columns), {'port': replace_port}
+
+def _numbers(table):
+    return table.select_dtypes('number').to_numpy(dtype=float)
+
+#Memory Budget##############################################################################
+def test_memory_budget_matches_unbounded_screen(universe):
+    dates, candidates, tickers, portfolios = universe
+    full = cwarp_screen.screen(candidates, dates, tickers, portfolios, workers=1)
+    bounded = cwarp_screen.screen(candidates, dates, tickers, portfolios, workers=1, max_bytes=20000)
+    assert list(bounded['Ticker']) == list(full['Ticker'])
+    np.testing.assert_allclose(_numbers(bounded), _numbers(full), rtol=1e-9, equal_nan=True)
+
+def test_float32_candidates_stay_close(universe):
+    dates, candidates, tickers, portfolios = universe
+    full = cwarp_screen.screen(candidates, dates, tickers, portfolios, workers=1)
+    single = cwarp_screen.screen(candidates.astype(np.float32), dates, tickers, portfolios, workers=1, max_bytes=20000)
+    np.testing.assert_allclose(single['CWARP'], full['CWARP'], rtol=1e-4, atol=1e-4)
+
+def test_screen_matches_cwarp_batch_on_replacement_calendar(universe):
+    dates, candidates, tickers, portfolios = universe
+    table = cwarp_screen.screen(candidates, dates, tickers, portfolios, workers=1).set_index('Ticker')
+    aligned = pd.DataFrame(candidates, index=dates, columns=tickers).reindex(portfolios['port'].index)
+    expected = cwarp_batch(aligned.values, portfolios['port'])['CWARP']
+    np.testing.assert_allclose(table.loc[tickers, 'CWARP'], expected, rtol=1e-12)
+
+def test_asset_stats_use_each_candidate_own_history(universe):
+    dates, candidates, tickers, portfolios = universe
+    table = cwarp_screen.screen(candidates, dates, tickers, portfolios, workers=1).set_index('Ticker')
+    frame = pd.DataFrame(candidates, index=dates, columns=tickers)
+    for ticker in (tickers[3], tickers[7], tickers[0]):
+        own = frame[ticker].loc[frame[ticker].first_valid_index():frame[ticker].last_valid_index()]
+        assert table.at[ticker, 'Asset_Sortino'] == pytest.approx(cwarp_core.sortino_ratio(own))
+        assert table.at[ticker, 'Asset_Sharpe'] == pytest.approx(cwarp_core.sharpe_ratio(own))
+        assert table.at[ticker, 'Asset_Max_DD'] == pytest.approx(cwarp_core.max_dd(own))
+
+#Process Pool###############################################################################
+def test_pooled_screen_matches_single_process(universe):
+    dates, candidates, tickers, portfolios = universe
+    portfolios = dict(portfolios, second=portfolios['port'].iloc[100:].rename('second'))
+    single = cwarp_screen.screen(candidates, dates, tickers, portfolios, workers=1)
+    pooled = cwarp_screen.screen(candidates, dates, tickers, portfolios, workers=2, shard_size=5)
+    pd.testing.assert_frame_equal(pooled, single)
+
+def test_pooled_screen_from_return_store(universe, tmp_path):
+    dates, candidates, tickers, portfolios = universe
+    store = ReturnStore.from_returns(str(tmp_path/'store'), pd.DataFrame(candidates, index=dates, columns=tickers))
+    first, last = store.rows(dates[20], dates[-20])
+    window_dates, window = store.window(dates[20], dates[-20])
+    single = cwarp_screen.screen(window, window_dates, tickers, portfolios, workers=1)
+    pooled = cwarp_screen.screen(window, window_dates, tickers, portfolios, workers=2, shard_size=4,
+                                 store_path=str(tmp_path/'store'), store_rows=(first, last))
+    pd.testing.assert_frame_equal(pooled, single)
+
+def test_single_process_screen_is_deterministic(universe):
+    dates, candidates, tickers, portfolios = universe
+    runs = [cwarp_screen.screen(candidates, dates, tickers, portfolios, workers=1, shard_size=shard) for shard in (None, 1, 5)]
+    for run in runs[1:]:
+        pd.testing.assert_frame_equal(run, runs[0])
+    ranks = runs[0]['Rank'].to_numpy()
+    assert (np.diff(ranks[~np.isnan(ranks)]) >= 0).all()
+
+#Pre-Screen#################################################################################
+def test_prune_cutoffs_margin_and_missing_approximations():
+    approx = np.array([50.0, 10.0, np.nan, 30.0, -20.0, 29.0])
+    keep, cutoff = cwarp_screen.prune(approx, top_k=2, margin=0.0)
+    assert cutoff == 30.0 and list(keep) == [True, False, True, True, False, False]
+    # 29 is within 5% of 1+CWARP/100 of the cutoff, 10 is not
+    keep, cutoff = cwarp_screen.prune(approx, top_k=2, margin=0.05)
+    assert list(keep) == [True, False, True, True, False, True]
+    keep, cutoff = cwarp_screen.prune(approx, top_k=2, threshold=40.0, margin=0.0)
+    assert cutoff == 40.0 and list(keep) == [True, False, True, False, False, False]
+    keep, cutoff = cwarp_screen.prune(approx, top_k=10)
+    assert cutoff == -np.inf and keep.all()
+
+def test_ranking_agreement_counts_missed_targets():
+    exact = np.array([5.0, 4.0, 3.0, 2.0, np.nan])
+    approx = np.array([5.0, 3.0, 4.0, 2.0, 1.0])
+    keep = np.array([True, False, True, True, True])
+    agreement = cwarp_screen.ranking_agreement(approx, exact, keep, top_k=2)
+    assert agreement['targets'] == 2 and agreement['missed'] == 1 and agreement['recall'] == 0.5
+    assert agreement['spearman'] == pytest.approx(0.8)
+    agreement = cwarp_screen.ranking_agreement(approx, exact, keep, threshold=2.5)
+    assert agreement['targets'] == 3 and agreement['missed'] == 1
+
+@pytest.fixture
+def large_universe(rng):
+    frame = random_returns(rng, 1500, 400, missing=0.005, drift=0.0004)
+    replace_port = random_returns(rng, 1500, drift=0.0004).rename('port')
+    return frame.index, np.asfortranarray(frame.values), list(frame.columns), {'port': replace_port}
+
+def test_cwarp_approx_ranks_like_exact_scoring(large_universe):
+    dates, candidates, tickers, portfolios = large_universe
+    exact = cwarp_batch(candidates, portfolios['port'])['CWARP']
+    approx = cwarp_core.cwarp_approx(candidates, portfolios['port'])['CWARP']
+    both = ~np.isnan(exact) & ~np.isnan(approx)
+    assert pd.Series(approx[both]).rank().corr(pd.Series(exact[both]).rank()) > 0.98
+    blocked = cwarp_core.cwarp_approx(candidates, portfolios['port'], max_bytes=len(dates)*100)['CWARP']
+    np.testing.assert_allclose(blocked, approx, rtol=1e-10)
+
+@pytest.mark.parametrize('options', [dict(prescreen_top=20), dict(prescreen_threshold=80.0), dict(prescreen_top=20, prescreen_threshold=100.0)])
+def test_prescreen_keeps_the_exact_top_candidates(large_universe, options):
+    dates, candidates, tickers, portfolios = large_universe
+    full = cwarp_screen.screen(candidates, dates, tickers, portfolios, workers=1)
+    report = {}
+    pruned = cwarp_screen.screen(candidates, dates, tickers, portfolios, workers=1, report=report, **options)
+    outcome = report['port']
+    assert outcome['pruned'] > len(tickers)//2 and len(pruned) == len(tickers)-outcome['pruned']
+    exact = full.set_index('Ticker')['CWARP'].reindex(tickers).to_numpy()
+    agreement = cwarp_screen.ranking_agreement(outcome['approx'], exact, outcome['keep'], top_k=options.get('prescreen_top'),
+                                               threshold=options.get('prescreen_threshold'))
+    assert agreement['missed'] == 0
+    # the survivors are scored exactly, so the top of the table is the full run's
+    targets = agreement['targets']
+    columns = [column for column in full.columns if column != 'Approx_CWARP']
+    pd.testing.assert_frame_equal(pruned[columns].head(targets), full.head(targets))
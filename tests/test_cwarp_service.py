@@ -0,0 +1,118 @@
+import json
+import time
+import asyncio
+import pytest
+import cwarp_service
+from cwarp_service import CwarpService, ServiceMetrics, parse_request
+
+BODY = {'portfolio': '.6, spy, .4, ief', 'candidates': 'qqq, gld, tlt', 'start': '2015-01-01', 'end': '2019-12-31'}
+
+@pytest.fixture
+def service(tmp_path):
+    service = CwarpService(provider='synthetic', cache_dir=str(tmp_path), workers=4, executor='thread')
+    yield service
+    service.executor.shutdown(wait=True)
+
+@pytest.fixture
+def slow_score(monkeypatch):
+    """counts score() calls and holds each one long enough for identical requests to pile up"""
+    calls = []
+    score = cwarp_service.score
+    def slow(params, source=None):
+        calls.append(params['candidates'])
+        time.sleep(0.3)
+        return score(params, source)
+    monkeypatch.setattr(cwarp_service, 'score', slow)
+    return calls
+
+#Coalescing and Result Cache################################################################
+def test_identical_requests_share_one_computation(service, slow_score):
+    async def run():
+        return await asyncio.gather(*[service.score(dict(BODY)) for _ in range(8)])
+    results = asyncio.run(run())
+    assert len(slow_score) == 1
+    assert sorted(how for result, how in results) == ['coalesced']*7+['computed']
+    assert all(result == results[0][0] for result, how in results)
+    assert service.metrics.counters['computed'] == 1 and service.metrics.counters['coalesced'] == 7
+    assert not service._inflight
+
+def test_finished_results_are_served_from_the_cache(service, slow_score):
+    first, how = asyncio.run(service.score(dict(BODY)))
+    assert how == 'computed'
+    # the same request written differently normalizes to the same key
+    again, how = asyncio.run(service.score(dict(BODY, candidates=['qqq', 'gld', 'tlt', 'qqq'], end='2019-12-31T00:00')))
+    assert how == 'cache' and again == first
+    assert len(slow_score) == 1 and service.metrics.counters['cache_hits'] == 1
+    _, how = asyncio.run(service.score(dict(BODY, weight_asset=0.5)))
+    assert how == 'computed' and len(slow_score) == 2
+    assert set(first) == {'risk_ret', 'new_risk_ret', 'failures'}
+    assert first['risk_ret']['columns'] == ['qqq', 'gld', 'tlt']
+
+#Request Validation#########################################################################
+@pytest.mark.parametrize('body, message', [
+    ([], 'JSON object'),
+    ({'candidates': 'qqq'}, 'portfolio is required'),
+    (dict(BODY, candidates=''), 'at least one ticker'),
+    (dict(BODY, portfolio='.6, spy, .4'), 'fraction_1'),
+    (dict(BODY, join='left'), 'join must be'),
+    (dict(BODY, colour='red'), 'unknown fields'),
+    (dict(BODY, weight_asset='a lot'), 'could not convert'),
+])
+def test_parse_request_rejects_malformed_input(body, message):
+    with pytest.raises(ValueError, match=message):
+        parse_request(body)
+
+def test_malformed_requests_get_4xx(service):
+    async def run():
+        return [await service._dispatch('POST', '/score', body) for body in
+                (b'{"portfolio": ', json.dumps({'candidates': 'qqq'}).encode(), b'')]+[
+                await service._dispatch('GET', '/score', b''), await service._dispatch('GET', '/nowhere', b'')]
+    assert [status for status, payload in asyncio.run(run())] == [400, 400, 400, 405, 404]
+
+def test_oversized_body_is_refused(service):
+    async def run():
+        host, port = await service.start(port=0)
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(f'POST /score HTTP/1.1\r\nContent-Length: {cwarp_service.MAX_BODY+1}\r\n\r\n'.encode())
+            await writer.drain()
+            start_line, headers, body = await cwarp_service._read_message(reader)
+            writer.close()
+            # the server closes the connection without reading the body
+            return start_line, headers, json.loads(body)
+        finally:
+            await service.close()
+    start_line, headers, payload = asyncio.run(run())
+    assert start_line.split(' ')[1] == '400' and headers['connection'] == 'close'
+    assert 'too large' in payload['error']
+
+def test_score_over_http(service):
+    async def run():
+        host, port = await service.start(port=0)
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            replies = [await cwarp_service._request(reader, writer, 'POST', '/score', BODY) for _ in range(2)]
+            replies.append(await cwarp_service._request(reader, writer, 'GET', '/metrics'))
+            writer.close()
+            return replies
+        finally:
+            await service.close()
+    (status, first), (_, second), (_, metrics) = asyncio.run(run())
+    assert status == 200 and first['source'] == 'computed' and second['source'] == 'cache'
+    assert metrics['counters']['cache_hits'] == 1 and metrics['routes']['POST /score']['requests'] == 2
+
+#Metrics####################################################################################
+def test_service_metrics_counters_and_latency():
+    metrics = ServiceMetrics(window=3)
+    for seconds, status in ((0.010, 200), (0.020, 200), (0.030, 500), (0.040, 200)):
+        metrics.record('POST /score', seconds, status)
+    metrics.count('cache_hits')
+    metrics.count('cache_hits', 2)
+    metrics.count('compute_ms_total', 12.5)
+    snapshot = metrics.snapshot()
+    assert snapshot['counters'] == {'cache_hits': 3, 'compute_ms_total': 12.5}
+    route = snapshot['routes']['POST /score']
+    # totals count every request, latencies only the last `window`
+    assert route['requests'] == 4 and route['errors'] == 1
+    assert route['p50_ms'] == pytest.approx(30) and route['max_ms'] == pytest.approx(40) and route['mean_ms'] == pytest.approx(30)
+    assert route['rps'] > 0